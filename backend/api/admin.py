@@ -1,16 +1,30 @@
+from functools import partial
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 
 from .models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
+    RecipeTag,
+    RecipeTrend,
+    RequestProfile,
     ShoppingCart,
+    SlowQuery,
     Subscription,
     Tag,
     User,
 )
+from .pantry import pantry_index
+from .profiling import profile_path
 
 
 @admin.register(User)
@@ -77,13 +91,32 @@ class RecipeIngredientInline(admin.TabularInline):
     extra = 1
 
 
+class RecipeTagInline(admin.TabularInline):
+    model = RecipeTag
+    extra = 1
+
+
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ("name", "author", "cooking_time", "pub_date")
     list_filter = ("tags", "pub_date")
     search_fields = ("name", "author__email", "author__username")
-    inlines = [RecipeIngredientInline]
-    filter_horizontal = ("tags",)
+    inlines = [RecipeTagInline, RecipeIngredientInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        recipe = form.instance
+        transaction.on_commit(
+            partial(
+                pantry_index.update_recipe,
+                recipe.id,
+                list(
+                    recipe.recipe_ingredients.values_list(
+                        "ingredient_id", flat=True
+                    )
+                ),
+            )
+        )
 
 
 @admin.register(Subscription)
@@ -105,3 +138,109 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ("user", "recipe", "created")
     list_filter = ("created",)
     search_fields = ("user__email", "recipe__name")
+
+
+@admin.register(RecipeTrend)
+class RecipeTrendAdmin(admin.ModelAdmin):
+    list_display = ("recipe", "score", "updated")
+    search_fields = ("recipe__name",)
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    """Медленные и повторяющиеся запросы, сгруппированные по маршрутам"""
+
+    list_display = (
+        "route",
+        "kind",
+        "short_sql",
+        "duration_ms",
+        "repeats",
+        "occurrences",
+        "last_seen",
+    )
+    list_filter = ("kind", "route")
+    search_fields = ("sql", "location")
+    readonly_fields = (
+        "route",
+        "kind",
+        "fingerprint",
+        "sql",
+        "location",
+        "duration_ms",
+        "repeats",
+        "occurrences",
+        "plan",
+        "first_seen",
+        "last_seen",
+    )
+
+    @admin.display(description="SQL")
+    def short_sql(self, obj):
+        return obj.sql[:100]
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Профили запросов со скачиванием файла для speedscope или pstats"""
+
+    list_display = (
+        "created",
+        "method",
+        "path",
+        "route",
+        "status_code",
+        "duration_ms",
+        "user",
+        "download_link",
+    )
+    list_filter = ("route", "format")
+    search_fields = ("path",)
+    readonly_fields = (
+        "user",
+        "method",
+        "path",
+        "route",
+        "status_code",
+        "duration_ms",
+        "format",
+        "download_link",
+        "created",
+    )
+    exclude = ("filename",)
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:pk>/download/",
+                self.admin_site.admin_view(self.download),
+                name="api_requestprofile_download",
+            ),
+            *super().get_urls(),
+        ]
+
+    def download(self, request, pk):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        if not self.has_view_permission(request, profile):
+            raise PermissionDenied
+        try:
+            file = open(profile_path(profile), "rb")
+        except FileNotFoundError:
+            raise Http404("Файл профиля не найден")
+        return FileResponse(
+            file, as_attachment=True, filename=profile.filename
+        )
+
+    @admin.display(description="Файл")
+    def download_link(self, obj):
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse("admin:api_requestprofile_download", args=[obj.pk]),
+            obj.get_format_display(),
+        )
+
+    def has_add_permission(self, request):
+        return False
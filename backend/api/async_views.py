@@ -0,0 +1,98 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.response import Response
+
+from .authentication import aauthenticate
+
+
+class AsyncReadMixin:
+    """
+    Асинхронные alist/aretrieve для вьюсетов: те же queryset,
+    сериализаторы и пагинация, но чтение идет через async ORM
+    """
+
+    async def afilter_queryset(self, queryset):
+        # django-filter валидирует параметры запросами к БД
+        # (например, author), поэтому фильтрация уходит в поток.
+        return await sync_to_async(self.filter_queryset)(queryset)
+
+    async def aget_object(self):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(
+                **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+            )
+        except queryset.model.DoesNotExist:
+            raise Http404(
+                "No %s matches the given query."
+                % queryset.model._meta.object_name
+            )
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        if self.paginator is not None:
+            page = await self.paginator.apaginate_queryset(
+                queryset, request, view=self
+            )
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(
+            [obj async for obj in queryset], many=True
+        )
+        return Response(serializer.data)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        return Response(self.get_serializer(instance).data)
+
+
+async def dispatch_async(viewset_class, action, request, args, kwargs):
+    """
+    Повторяет ViewSet.dispatch для GET без синхронных обращений к БД:
+    токен проверяется через async ORM, а вызывается метод a<action>
+    """
+    self = viewset_class(action_map={"get": action})
+    self.args = args
+    self.kwargs = kwargs
+    self.headers = self.default_response_headers
+    request = self.initialize_request(request, *args, **kwargs)
+    self.request = request
+    try:
+        user, token = await aauthenticate(request._request)
+        request.user = user or AnonymousUser()
+        request.auth = token
+        self.initial(request, *args, **kwargs)
+        response = await getattr(self, f"a{action}")(request, *args, **kwargs)
+    except Exception as exc:
+        response = self.handle_exception(exc)
+    self.response = self.finalize_response(request, response, *args, **kwargs)
+    return self.response.render()
+
+
+def async_read_view(viewset_class, actions):
+    """
+    View для маршрута вьюсета под ASGI: GET обслуживает асинхронный
+    метод вьюсета, остальные методы — обычный синхронный вьюсет
+    """
+    sync_view = sync_to_async(viewset_class.as_view(actions))
+    action = actions["get"]
+
+    async def view(request, *args, **kwargs):
+        if request.method != "GET":
+            return await sync_view(request, *args, **kwargs)
+        return await dispatch_async(
+            viewset_class, action, request, args, kwargs
+        )
+
+    view.cls = viewset_class
+    view.actions = actions
+    return csrf_exempt(view)
@@ -0,0 +1,38 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+
+
+def token_key(request):
+    """Ключ из заголовка Authorization: Token ... или None"""
+    header = request.headers.get("Authorization", "").split()
+    if len(header) == 2 and (
+        header[0].lower() == TokenAuthentication.keyword.lower()
+    ):
+        return header[1]
+    return None
+
+
+async def aauthenticate(request):
+    """
+    Асинхронный аналог TokenAuthentication: возвращает (user, token)
+    или (None, None) для анонимного запроса. Пользователь, уже
+    определенный пакетным запросом (см. api.batch), не проверяется
+    повторно
+    """
+    forced_user = getattr(request, "_force_auth_user", None)
+    if forced_user is not None:
+        return forced_user, getattr(request, "_force_auth_token", None)
+    header = request.headers.get("Authorization", "").split()
+    if not header or header[0].lower() != TokenAuthentication.keyword.lower():
+        return None, None
+    if len(header) != 2:
+        raise AuthenticationFailed(_("Invalid token header."))
+    try:
+        token = await Token.objects.select_related("user").aget(key=header[1])
+    except Token.DoesNotExist:
+        raise AuthenticationFailed(_("Invalid token."))
+    if not token.user.is_active:
+        raise AuthenticationFailed(_("User inactive or deleted."))
+    return token.user, token
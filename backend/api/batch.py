@@ -0,0 +1,241 @@
+import contextvars
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_to_bytes, urlsplit
+
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.urls import Resolver404, resolve, reverse
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from .constants import BATCH_MAX_WORKERS
+from .serializers import BatchSerializer
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET",)
+FORWARDED_META = (
+    "HTTP_ACCEPT_LANGUAGE",
+    "HTTP_AUTHORIZATION",
+    "HTTP_USER_AGENT",
+    "HTTP_X_FORWARDED_FOR",
+    "HTTP_X_FORWARDED_PROTO",
+    "REMOTE_ADDR",
+    "SERVER_NAME",
+    "SERVER_PORT",
+)
+FORWARDED_HEADERS = ("Content-Type", "Content-Disposition", "Location")
+# Пакет в пакете и бесконечный поток событий в подзапросе не выполняются.
+REFUSED_URL_NAMES = ("batch", "events")
+
+_handler = None
+_handler_lock = threading.Lock()
+
+
+def _get_handler():
+    """
+    Синхронный обработчик с той же цепочкой middleware, что у
+    приложения: кеш ответов, реплики, метрики и журнал медленных
+    запросов работают и для подзапросов. Асинхронные вьюхи он вызывает
+    через async_to_sync
+    """
+    global _handler
+    with _handler_lock:
+        if _handler is None:
+            handler = BaseHandler()
+            handler.load_middleware(is_async=False)
+            _handler = handler
+        return _handler
+
+
+@receiver(setting_changed)
+def _reset_handler(setting, **kwargs):
+    global _handler
+    if setting == "MIDDLEWARE":
+        with _handler_lock:
+            _handler = None
+
+
+def _error(item, status_code, message):
+    return {
+        "id": item.get("id"),
+        "status": status_code,
+        "headers": {},
+        "body": {"errors": message},
+    }
+
+
+def _build_subrequest(request, item, cookies):
+    """
+    Собирает WSGIRequest подзапроса: тот же хост, схема, заголовок
+    Authorization и cookie, что у пакетного запроса, плюс cookie,
+    выставленные предыдущими подзапросами. Пользователь уже определен
+    пакетным запросом и передается подзапросу так же, как
+    force_authenticate в тестах DRF: токен заново не проверяется
+    """
+    url = urlsplit(item["url"])
+    body = item.get("body")
+    payload = json.dumps(body).encode() if body is not None else b""
+    environ = {
+        key: request.META[key] for key in FORWARDED_META if key in request.META
+    }
+    environ.update(
+        {
+            "REQUEST_METHOD": item["method"],
+            "SCRIPT_NAME": request.META.get("SCRIPT_NAME", ""),
+            "PATH_INFO": unquote_to_bytes(url.path).decode("iso-8859-1"),
+            "QUERY_STRING": url.query,
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(payload)),
+            "HTTP_HOST": request.get_host(),
+            "wsgi.input": io.BytesIO(payload),
+            "wsgi.url_scheme": request.scheme,
+        }
+    )
+    if cookies:
+        environ["HTTP_COOKIE"] = "; ".join(
+            f"{name}={value}" for name, value in cookies.items()
+        )
+    subrequest = WSGIRequest(environ)
+    if request.user.is_authenticated:
+        subrequest._force_auth_user = request.user
+        subrequest._force_auth_token = request.auth
+    return subrequest
+
+
+def _decode_body(response):
+    if not response.content:
+        return None
+    content = response.content.decode(response.charset or "utf-8")
+    if response.get("Content-Type", "").startswith("application/json"):
+        return json.loads(content)
+    return content
+
+
+def _run_subrequest(request, item, cookies):
+    """
+    Выполняет подзапрос; cookie из его ответа попадают в cookies для
+    следующих подзапросов. Потоковые ответы не поддерживаются
+    """
+    path = urlsplit(item["url"]).path
+    if not path.startswith(reverse("api-root")):
+        return _error(
+            item, status.HTTP_400_BAD_REQUEST, "Недопустимый адрес подзапроса."
+        )
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return _error(item, status.HTTP_404_NOT_FOUND, "Страница не найдена.")
+    if match.url_name in REFUSED_URL_NAMES:
+        return _error(
+            item, status.HTTP_400_BAD_REQUEST, "Недопустимый адрес подзапроса."
+        )
+
+    try:
+        response = _get_handler().get_response(
+            _build_subrequest(request, item, cookies)
+        )
+        body = None if response.streaming else _decode_body(response)
+    except Exception:
+        logger.exception(
+            "Batch subrequest failed: %s %s", item["method"], path
+        )
+        response = None
+    if response is not None and response.streaming:
+        return _error(
+            item,
+            status.HTTP_400_BAD_REQUEST,
+            "Потоковые ответы в пакете не поддерживаются.",
+        )
+    # Страницу ошибки Django (HTML, в DEBUG — с трассировкой) клиенту
+    # пакета не отдаем.
+    if response is None or (
+        response.status_code >= status.HTTP_500_INTERNAL_SERVER_ERROR
+        and not isinstance(body, (dict, list))
+    ):
+        return _error(
+            item,
+            status.HTTP_500_INTERNAL_SERVER_ERROR,
+            "Внутренняя ошибка сервера.",
+        )
+
+    _apply_cookies(cookies, response.cookies)
+    return {
+        "id": item.get("id"),
+        "status": response.status_code,
+        "headers": {
+            header: response[header]
+            for header in FORWARDED_HEADERS
+            if header in response
+        },
+        "body": body,
+    }
+
+
+def _apply_cookies(cookies, response_cookies):
+    """Переносит cookie ответа подзапроса в cookie следующих подзапросов"""
+    for name, morsel in response_cookies.items():
+        if morsel["max-age"] == 0:
+            cookies.pop(name, None)
+        else:
+            cookies[name] = morsel.value
+
+
+def _run_in_thread(request, item):
+    try:
+        return _run_subrequest(request, item, dict(request.COOKIES))
+    finally:
+        connections.close_all()
+
+
+@api_view(["POST"])
+@permission_classes([AllowAny])
+def batch_view(request):
+    """
+    Выполняет пачку подзапросов к /api/ внутри одного HTTP-запроса.
+    Подзапросы проходят всю цепочку middleware и идут последовательно
+    на соединении текущего запроса; cookie, выставленные подзапросом
+    (например, закрепление за основной БД после записи), видят
+    следующие подзапросы. С "parallel": true пакет из одних GET
+    выполняется в пуле потоков
+    """
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    items = serializer.validated_data["requests"]
+    # Аутентификация одна на пакет: до пула потоков, а не в каждом
+    # подзапросе.
+    request.user
+
+    parallel = serializer.validated_data["parallel"] and all(
+        item["method"] in SAFE_METHODS for item in items
+    )
+    if parallel and len(items) > 1:
+        with ThreadPoolExecutor(
+            max_workers=min(BATCH_MAX_WORKERS, len(items))
+        ) as executor:
+            # Свой контекст на каждую задачу: ContextVar запроса видны
+            # в потоках пула, а один Context нельзя войти из двух потоков.
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    _run_in_thread,
+                    request,
+                    item,
+                )
+                for item in items
+            ]
+            results = [future.result() for future in futures]
+    else:
+        cookies = dict(request.COOKIES)
+        results = [_run_subrequest(request, item, cookies) for item in items]
+
+    return Response({"responses": results})
@@ -0,0 +1,25 @@
+from django.core.cache import cache
+
+from .models import Tag
+
+TAG_SLUG_MAP_KEY = "tags:slug-map"
+TAG_SLUG_MAP_TIMEOUT = 60 * 60
+TAG_LIST_KEY = "tags:list"
+TAG_LIST_TIMEOUT = 60 * 60
+
+
+def get_tag_slug_map():
+    """Словарь slug -> id тегов, закешированный до изменения тегов"""
+    slug_map = cache.get(TAG_SLUG_MAP_KEY)
+    if slug_map is None:
+        slug_map = dict(Tag.objects.values_list("slug", "id"))
+        cache.set(TAG_SLUG_MAP_KEY, slug_map, TAG_SLUG_MAP_TIMEOUT)
+    return slug_map
+
+
+def tag_slug_choices():
+    return [(slug, slug) for slug in get_tag_slug_map()]
+
+
+def invalidate_tag_cache():
+    cache.delete_many([TAG_SLUG_MAP_KEY, TAG_LIST_KEY])
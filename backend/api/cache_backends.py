@@ -0,0 +1,34 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+from .metrics import count_cache_lookups
+
+_missing = object()
+
+
+class MeteredCacheMixin:
+    """
+    Считает попадания и промахи get для Server-Timing и метрик запроса.
+    get_many, aget и aget_many из BaseCache сводятся к тому же get
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        if value is _missing:
+            count_cache_lookups(0, 1)
+            return default
+        count_cache_lookups(1, 0)
+        return value
+
+
+class MeteredLocMemCache(MeteredCacheMixin, LocMemCache):
+    pass
+
+
+class MeteredRedisCache(MeteredCacheMixin, RedisCache):
+    def get_many(self, keys, version=None):
+        # RedisCache читает ключи одним MGET, минуя get.
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        count_cache_lookups(len(found), len(keys) - len(found))
+        return found
@@ -11,3 +11,52 @@ RECIPE_NAME_MAX_LENGTH = 200
 
 FIRST_NAME_MAX_LENGTH = 150
 LAST_NAME_MAX_LENGTH = 150
+
+RECIPE_IDS_MAX = 100
+
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+PANTRY_MAX_INGREDIENTS = 200
+PANTRY_MAX_MISSING = 10
+# Изменения индекса кладовой в кеше: сколько хранятся и сколько
+# отставших изменений процесс догоняет, а не перестраивает индекс.
+PANTRY_DELTA_TIMEOUT = 24 * 60 * 60
+PANTRY_MAX_DELTAS = 1000
+
+SIMILAR_RECIPES_LIMIT = 6
+
+TREND_FAVORITE_WEIGHT = 2.0
+TREND_SHOPPING_CART_WEIGHT = 1.0
+TREND_HALF_LIFE_HOURS = 72
+TREND_MIN_SCORE = 0.01
+
+TIMELINE_FANOUT_MAX_FOLLOWERS = 1000
+TIMELINE_BACKFILL_SIZE = 50
+TIMELINE_PAGE_SIZE_MAX = 50
+
+SYNC_MAX_CHANGES = 1000
+SYNC_SAFETY_LAG_SECONDS = 5
+# Ключ pg_advisory_xact_lock, упорядочивающего записи журнала изменений.
+CHANGE_LOG_LOCK_ID = 7_301_001
+
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_QUEUE_SIZE = 100
+EVENTS_TICKET_MAX_AGE = 60
+
+RESPONSE_CACHE_STALE_SECONDS = 60
+SINGLE_FLIGHT_LEASE_SECONDS = 5
+SINGLE_FLIGHT_POLL_SECONDS = 0.05
+XFETCH_BETA = 1.0
+
+METRICS_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+ROUTE_MAX_LENGTH = 200
+SQL_LOCATION_MAX_LENGTH = 300
+PROFILE_PATH_MAX_LENGTH = 2000
+SLOW_QUERY_QUEUE_SIZE = 1000
+
+PROFILER_RATE_WINDOW_SECONDS = 60
+PROFILER_SLOT_TIMEOUT_SECONDS = 300
+
+TRACEMALLOC_TOP_SITES = 10
@@ -0,0 +1,35 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Реплика, выбранная для текущего запроса, или None — читать из default.
+replica_alias = ContextVar("replica_alias", default=None)
+
+# Токены читаются только с основной БД: отозванный токен не должен
+# работать, пока реплика догоняет основную.
+PRIMARY_ONLY_APPS = ("authtoken",)
+
+
+class ReplicaRouter:
+    """
+    Чтения запроса уходят на реплику, если ее выбрал
+    ReplicaRoutingMiddleware; записи всегда идут в default
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return None
+        return replica_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схему реплик ведет репликация с основной БД.
+        return db == "default"
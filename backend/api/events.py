@@ -0,0 +1,352 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.core.signals import setting_changed
+from django.db import close_old_connections
+from django.dispatch import receiver
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from .authentication import aauthenticate
+from .constants import (
+    EVENTS_HEARTBEAT_SECONDS,
+    EVENTS_QUEUE_SIZE,
+    EVENTS_TICKET_MAX_AGE,
+)
+from .models import ChangeLogEntry, Recipe, Subscription, User
+from .sync import current_cursor
+
+logger = logging.getLogger(__name__)
+
+RECIPE_CREATED = "recipe_created"
+RECIPE_UPDATED = "recipe_updated"
+SHOPPING_CART_CHANGED = "shopping_cart_changed"
+SUBSCRIPTION_CHANGED = "subscription_changed"
+
+AUTHOR_EVENTS = (RECIPE_CREATED, RECIPE_UPDATED)
+
+
+TICKET_SALT = "api.events.ticket"
+
+
+class Subscriber:
+    """
+    Подключенный SSE-клиент: своя очередь в своем event loop.
+    followed_ids читает поток публикации, а меняет loop клиента, поэтому
+    доступ к нему идет под блокировкой
+    """
+
+    def __init__(self, user_id, followed_ids):
+        self.user_id = user_id
+        self.followed_ids = set(followed_ids)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self._lock = threading.Lock()
+
+    def wants(self, event):
+        if event["type"] in AUTHOR_EVENTS:
+            with self._lock:
+                return event["author_id"] in self.followed_ids
+        return event.get("user_id") == self.user_id
+
+    def _put(self, event):
+        if event["type"] == SUBSCRIPTION_CHANGED:
+            with self._lock:
+                if event["action"] == "added":
+                    self.followed_ids.add(event["author_id"])
+                else:
+                    self.followed_ids.discard(event["author_id"])
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            logger.warning("SSE queue overflow for user %s", self.user_id)
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+
+class EventBroker:
+    """
+    Pub/sub внутри процесса. Публиковать можно из любого потока:
+    доставка идет через call_soon_threadsafe в loop подписчика, так что
+    простаивающее соединение стоит одну пустую очередь.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+
+    def subscribe(self, user_id, followed_ids):
+        subscriber = Subscriber(user_id, followed_ids)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        get_backend().start(self)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def dispatch(self, event):
+        """
+        Ошибка доставки одному подписчику не мешает остальным. Подписчик
+        с закрытым loop (соединение оборвано при остановке или
+        перезагрузке) отписывается
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                if subscriber.wants(event):
+                    subscriber.deliver(event)
+            except Exception:
+                if subscriber.loop.is_closed():
+                    self.unsubscribe(subscriber)
+                else:
+                    logger.exception(
+                        "SSE delivery failed for user %s", subscriber.user_id
+                    )
+
+
+class LocalBackend:
+    """
+    События доходят только до клиентов этого процесса: подходит для
+    разработки и одного рабочего процесса. При GUNICORN_WORKERS больше
+    одного не запускается — клиенты других воркеров не получали бы
+    событий
+    """
+
+    def __init__(self):
+        if int(os.environ.get("GUNICORN_WORKERS", "1")) > 1:
+            raise ImproperlyConfigured(
+                "api.events.LocalBackend delivers events within one "
+                "process; use api.events.ChangeLogBackend with several "
+                "GUNICORN_WORKERS"
+            )
+
+    def start(self, broker):
+        pass
+
+    def publish(self, event):
+        broker.dispatch(event)
+
+
+class ChangeLogBackend:
+    """
+    Межпроцессный бэкенд: каждый процесс опрашивает ChangeLogEntry и
+    превращает новые записи в события. publish() ничего не делает —
+    записи журнала уже пишутся сигналами. Доставка «по возможности»:
+    пропущенное клиент догоняет через /api/sync/.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self, broker):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(
+            target=self._poll, args=(broker,), daemon=True, name="sse-poller"
+        ).start()
+
+    def publish(self, event):
+        pass
+
+    @staticmethod
+    def _to_events(entries):
+        Kind, Action = ChangeLogEntry.Kind, ChangeLogEntry.Action
+        recipe_ids = {
+            entry.object_id
+            for entry in entries
+            if entry.kind == Kind.RECIPE and entry.action != Action.DELETED
+        }
+        authors = dict(
+            Recipe.objects.filter(id__in=recipe_ids).values_list(
+                "id", "author_id"
+            )
+        )
+        for entry in entries:
+            added = "removed" if entry.action == Action.DELETED else "added"
+            if entry.kind == Kind.RECIPE and entry.object_id in authors:
+                yield {
+                    "type": (
+                        RECIPE_CREATED
+                        if entry.action == Action.CREATED
+                        else RECIPE_UPDATED
+                    ),
+                    "recipe_id": entry.object_id,
+                    "author_id": authors[entry.object_id],
+                }
+            elif entry.kind == Kind.SHOPPING_CART:
+                yield {
+                    "type": SHOPPING_CART_CHANGED,
+                    "recipe_id": entry.object_id,
+                    "action": added,
+                    "user_id": entry.user_id,
+                }
+            elif entry.kind == Kind.SUBSCRIPTION:
+                yield {
+                    "type": SUBSCRIPTION_CHANGED,
+                    "author_id": entry.object_id,
+                    "action": added,
+                    "user_id": entry.user_id,
+                }
+
+    def _poll(self, broker):
+        cursor = None
+        while True:
+            try:
+                close_old_connections()
+                if cursor is None:
+                    cursor = current_cursor()
+                entries = list(
+                    ChangeLogEntry.objects.filter(id__gt=cursor).order_by(
+                        "id"
+                    )[:1000]
+                )
+                if entries:
+                    # События собираются до сдвига курсора: при ошибке
+                    # запроса пачка будет прочитана заново.
+                    events = list(self._to_events(entries))
+                    cursor = entries[-1].id
+                    for event in events:
+                        broker.dispatch(event)
+            except Exception:
+                logger.exception("SSE change log polling failed")
+            time.sleep(settings.EVENTS_POLL_INTERVAL)
+
+
+broker = EventBroker()
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(settings.EVENTS_BACKEND)()
+    return _backend
+
+
+@receiver(setting_changed)
+def _reset_backend(setting, **kwargs):
+    global _backend
+    if setting == "EVENTS_BACKEND":
+        _backend = None
+
+
+def publish(event):
+    get_backend().publish(event)
+
+
+def format_event(event):
+    data = {key: value for key, value in event.items() if key != "user_id"}
+    return f"event: {event['type']}\ndata: {json.dumps(data)}\n\n"
+
+
+def issue_ticket(user):
+    """Подписанный билет на подключение к потоку событий"""
+    return signing.TimestampSigner(salt=TICKET_SALT).sign(str(user.pk))
+
+
+async def user_from_ticket(ticket):
+    """
+    Пользователь по билету не старше EVENTS_TICKET_MAX_AGE секунд или
+    AuthenticationFailed
+    """
+    try:
+        user_id = signing.TimestampSigner(salt=TICKET_SALT).unsign(
+            ticket, max_age=EVENTS_TICKET_MAX_AGE
+        )
+        return await User.objects.aget(pk=user_id, is_active=True)
+    except (signing.BadSignature, User.DoesNotExist):
+        raise AuthenticationFailed("Недействительный или просроченный билет.")
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def events_ticket_view(request):
+    """
+    Короткоживущий билет для EventSource, который не умеет передавать
+    заголовки: в строке запроса и логах остается билет, а не API-токен
+    """
+    return Response(
+        {
+            "ticket": issue_ticket(request.user),
+            "expires": EVENTS_TICKET_MAX_AGE,
+        }
+    )
+
+
+async def stream_events(user_id, followed_ids):
+    """
+    Подписка создается при первом чтении потока, а не в вьюхе: если
+    клиент отключился до начала ответа, генератор не запускается и
+    подписчик не остается в брокере
+    """
+    subscriber = broker.subscribe(user_id, followed_ids)
+    try:
+        yield f"retry: {EVENTS_HEARTBEAT_SECONDS * 1000}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscriber.queue.get(), EVENTS_HEARTBEAT_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+            else:
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+async def events_view(request):
+    """
+    Поток server-sent events для текущего пользователя: токен в
+    заголовке Authorization или билет ?ticket= от /api/events/ticket/.
+    Работает только под ASGI: под WSGI каждое соединение занимало бы
+    рабочий процесс целиком.
+    """
+    if request.method != "GET":
+        return JsonResponse({"detail": "Метод не разрешен."}, status=405)
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"detail": "События доступны только при запуске под ASGI."},
+            status=501,
+        )
+    try:
+        user, _ = await aauthenticate(request)
+        if user is None and "ticket" in request.GET:
+            user = await user_from_ticket(request.GET["ticket"])
+    except AuthenticationFailed as exc:
+        return JsonResponse({"detail": exc.detail}, status=exc.status_code)
+    if user is None:
+        return JsonResponse(
+            {"detail": "Учетные данные не были предоставлены."}, status=401
+        )
+    followed_ids = [
+        author_id
+        async for author_id in Subscription.objects.filter(
+            user=user
+        ).values_list("author_id", flat=True)
+    ]
+    response = StreamingHttpResponse(
+        stream_events(user.id, followed_ids), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
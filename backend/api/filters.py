@@ -1,39 +1,131 @@
+from django.db.models import Exists, F, OuterRef
 from django_filters import rest_framework as filters
+from django_filters.constants import EMPTY_VALUES
 
-from .models import Ingredient, Recipe, Tag
+from .cache import get_tag_slug_map, tag_slug_choices
+from .models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeTag,
+    ShoppingCart,
+)
+
+
+class NumberInFilter(filters.BaseInFilter, filters.NumberFilter):
+    pass
+
+
+class RecipeOrderingFilter(filters.OrderingFilter):
+    """
+    Сортировка по полям рецепта и рейтингу трендов; рецепты без
+    рейтинга идут в конце
+    """
+
+    @staticmethod
+    def _order_by(field):
+        if field.lstrip("-") != "trend__score":
+            return field
+        expression = F("trend__score")
+        if field.startswith("-"):
+            return expression.desc(nulls_last=True)
+        return expression.asc(nulls_last=True)
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        ordering = [self.get_ordering_value(param) for param in value]
+        return qs.order_by(
+            *(self._order_by(field) for field in ordering), "-pub_date"
+        )
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name="tags__slug",
-        to_field_name="slug",
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_slug_choices,
+        method="filter_tags",
     )
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart"
     )
+    ingredients = NumberInFilter(method="filter_ingredients")
+    exclude_ingredients = NumberInFilter(method="filter_exclude_ingredients")
+    cooking_time_min = filters.NumberFilter(
+        field_name="cooking_time", lookup_expr="gte"
+    )
+    cooking_time_max = filters.NumberFilter(
+        field_name="cooking_time", lookup_expr="lte"
+    )
+    ordering = RecipeOrderingFilter(
+        fields=(
+            ("cooking_time", "cooking_time"),
+            ("name", "name"),
+            ("popularity", "popularity"),
+            ("trend__score", "trending"),
+        )
+    )
 
     class Meta:
         model = Recipe
-        fields = ("tags", "author", "is_favorited", "is_in_shopping_cart")
+        fields = (
+            "tags",
+            "author",
+            "is_favorited",
+            "is_in_shopping_cart",
+            "ingredients",
+            "exclude_ingredients",
+            "cooking_time_min",
+            "cooking_time_max",
+        )
 
-    def filter_is_favorited(self, queryset, name, value):
-        user = self.request.user
-        return (
-            queryset.filter(favorites__user=user).distinct()
-            if value and user.is_authenticated
-            else queryset
+    def filter_tags(self, queryset, name, value):
+        slug_map = get_tag_slug_map()
+        return queryset.filter(
+            Exists(
+                RecipeTag.objects.filter(
+                    recipe=OuterRef("pk"),
+                    tag_id__in=[slug_map[slug] for slug in value],
+                )
+            )
         )
 
-    def filter_is_in_shopping_cart(self, queryset, name, value):
+    def filter_ingredients(self, queryset, name, value):
+        """Рецепт должен содержать каждый из переданных ингредиентов"""
+        for ingredient_id in set(value):
+            queryset = queryset.filter(
+                Exists(
+                    RecipeIngredient.objects.filter(
+                        recipe=OuterRef("pk"), ingredient_id=ingredient_id
+                    )
+                )
+            )
+        return queryset
+
+    def filter_exclude_ingredients(self, queryset, name, value):
+        return queryset.exclude(
+            Exists(
+                RecipeIngredient.objects.filter(
+                    recipe=OuterRef("pk"), ingredient_id__in=value
+                )
+            )
+        )
+
+    def _filter_by_user_relation(self, queryset, model, value):
         user = self.request.user
-        return (
-            queryset.filter(shopping_cart__user=user).distinct()
-            if value and user.is_authenticated
-            else queryset
+        if not value or not user.is_authenticated:
+            return queryset
+        return queryset.filter(
+            Exists(model.objects.filter(user=user, recipe=OuterRef("pk")))
         )
 
+    def filter_is_favorited(self, queryset, name, value):
+        return self._filter_by_user_relation(queryset, Favorite, value)
+
+    def filter_is_in_shopping_cart(self, queryset, name, value):
+        return self._filter_by_user_relation(queryset, ShoppingCart, value)
+
 
 class IngredientFilter(filters.FilterSet):
     name = filters.CharFilter(field_name="name", lookup_expr="istartswith")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.similarity import build_index, index_dir
+
+
+class Command(BaseCommand):
+    help = (
+        "Build or incrementally update the MinHash/LSH index "
+        "used by /api/recipes/<id>/similar/"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recompute every signature instead of only changed recipes",
+        )
+
+    def handle(self, *args, **options):
+        total, recomputed, removed = build_index(full=options["full"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Similarity index in {index_dir()}: {total} recipes, "
+                f"recomputed {recomputed}, removed {removed}"
+            )
+        )
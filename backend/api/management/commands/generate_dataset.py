@@ -0,0 +1,508 @@
+import csv
+import io
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from faker import Faker
+from PIL import Image
+
+from api.cache import invalidate_tag_cache
+from api.constants import TIMELINE_FANOUT_MAX_FOLLOWERS
+from api.management.commands.load_data import DEFAULT_TAGS
+from api.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    RecipeTag,
+    ShoppingCart,
+    Subscription,
+    Tag,
+    TimelineEntry,
+    User,
+)
+from api.pantry import pantry_index
+from api.response_cache import INGREDIENTS_KEY, RECIPES_KEY, TAGS_KEY, purge
+from api.timeline import recount_followers
+from api.trending import rebuild_scores, recount_popularity
+
+PLACEHOLDER_IMAGE = "recipes/dataset-placeholder.png"
+DISHES = (
+    "Салат",
+    "Суп",
+    "Запеканка",
+    "Паста",
+    "Рагу",
+    "Пирог",
+    "Омлет",
+    "Каша",
+    "Смузи",
+    "Плов",
+    "Соус",
+    "Десерт",
+)
+# Количества по единицам измерения; остальные единицы — от 1 до 5.
+AMOUNTS = {
+    "г": (10, 20, 50, 100, 150, 200, 250, 300, 500, 1000),
+    "мл": (10, 50, 100, 150, 200, 250, 500, 1000),
+    "шт.": (1, 1, 2, 2, 3, 4, 6),
+}
+TEXT_POOL_SIZE = 1000
+
+
+def _zipf_cum_weights(size, exponent=1.0):
+    return list(
+        itertools.accumulate(1 / rank**exponent for rank in range(1, size + 1))
+    )
+
+
+def _sample(rng, population, cum_weights, k):
+    """До k разных элементов с весами (повторы отбрасываются)"""
+    if k <= 0:
+        return set()
+    return set(rng.choices(population, cum_weights=cum_weights, k=k))
+
+
+def _placeholder_image():
+    if not default_storage.exists(PLACEHOLDER_IMAGE):
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), (230, 160, 90)).save(buffer, "PNG")
+        default_storage.save(PLACEHOLDER_IMAGE, ContentFile(buffer.getvalue()))
+    return PLACEHOLDER_IMAGE
+
+
+@contextmanager
+def _explicit_dates():
+    """
+    bulk_create подставляет now() в поля auto_now_add; на время загрузки
+    это отключается, чтобы даты были распределены по истории
+    """
+    fields = [
+        model._meta.get_field(name)
+        for model, name in (
+            (Recipe, "pub_date"),
+            (Subscription, "created"),
+            (Favorite, "created"),
+            (ShoppingCart, "created"),
+        )
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a deterministic synthetic dataset for load and "
+        "regression testing: users, recipes with ingredient and tag "
+        "distributions from data/ingredients.csv, a power-law follower "
+        "graph, favorites, shopping carts and subscription timelines"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--recipes", type=int, default=5000)
+        parser.add_argument(
+            "--following",
+            type=float,
+            default=20,
+            help="Average number of authors a user follows",
+        )
+        parser.add_argument(
+            "--favorites",
+            type=float,
+            default=10,
+            help="Average number of favorites per user",
+        )
+        parser.add_argument(
+            "--carts",
+            type=float,
+            default=3,
+            help="Average number of recipes in a shopping cart",
+        )
+        parser.add_argument(
+            "--alpha",
+            type=float,
+            default=1.5,
+            help=(
+                "Pareto shape of author popularity: lower values give a "
+                "heavier tail of followers and recipes"
+            ),
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=365,
+            help="Spread publication and relation dates over this period",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--prefix",
+            default="dataset",
+            help="Username and email prefix of generated users",
+        )
+        parser.add_argument(
+            "--password",
+            default="dataset-password",
+            help="Password of every generated user",
+        )
+        parser.add_argument(
+            "--csv",
+            dest="csv_path",
+            default=None,
+            help="Path to ingredients.csv (default: data/ingredients.csv)",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--skip-timeline",
+            action="store_true",
+            help="Do not fan recipes out to follower timelines",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 2:
+            raise CommandError("--users must be at least 2")
+        if User.objects.filter(
+            username__startswith=options["prefix"]
+        ).exists():
+            raise CommandError(
+                f"Users with prefix {options['prefix']!r} already exist: "
+                "use another --prefix or flush the database"
+            )
+        self.options = options
+        self.batch_size = options["batch_size"]
+        self.rng = random.Random(options["seed"])
+        self.fake = Faker("ru_RU")
+        self.fake.seed_instance(options["seed"])
+        self.now = timezone.now()
+        self.period = options["days"] * 24 * 3600
+        self.counts = {}
+        started = time.monotonic()
+
+        with transaction.atomic(), _explicit_dates():
+            ingredients_loaded = self._load_ingredients()
+            tags_created = self._ensure_tags()
+            self._create_users()
+            self._create_recipes()
+            self._create_subscriptions()
+            recount_followers()
+            self._create_relations(Favorite, options["favorites"])
+            self._create_relations(ShoppingCart, options["carts"])
+            recount_popularity()
+            if not options["skip_timeline"]:
+                self._create_timeline()
+
+        self.counts["RecipeTrend"] = rebuild_scores()
+        pantry_index.invalidate()
+        if tags_created:
+            invalidate_tag_cache()
+        purge(
+            RECIPES_KEY,
+            *([TAGS_KEY] if tags_created else []),
+            *([INGREDIENTS_KEY] if ingredients_loaded else []),
+        )
+
+        for name, count in self.counts.items():
+            self.stdout.write(f"{name}: {count}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Dataset generated in {time.monotonic() - started:.1f}s "
+                f"(seed {options['seed']}). Run build_similarity_index "
+                "--full to index the new recipes"
+            )
+        )
+
+    def _date(self, after=None):
+        """Случайный момент за период, но не раньше after"""
+        start = self.now - timedelta(seconds=self.period)
+        if after is not None and after > start:
+            start = after
+        span = (self.now - start).total_seconds()
+        return start + timedelta(seconds=self.rng.uniform(0, span))
+
+    def _insert(self, model, fields, rows):
+        """
+        Пишет кортежи значений полей fields: на PostgreSQL через COPY,
+        на остальных БД через bulk_create пачками
+        """
+        total = 0
+        if connection.vendor == "postgresql":
+            columns = ", ".join(
+                connection.ops.quote_name(model._meta.get_field(f).column)
+                for f in fields
+            )
+            table = connection.ops.quote_name(model._meta.db_table)
+            with connection.cursor() as cursor:
+                with cursor.cursor.copy(
+                    f"COPY {table} ({columns}) FROM STDIN"
+                ) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                        total += 1
+        else:
+            rows = iter(rows)
+            while batch := list(itertools.islice(rows, self.batch_size)):
+                model.objects.bulk_create(
+                    [model(**dict(zip(fields, row))) for row in batch]
+                )
+                total += len(batch)
+        self.counts[model.__name__] = (
+            self.counts.get(model.__name__, 0) + total
+        )
+
+    def _load_ingredients(self):
+        """Добавляет недостающие ингредиенты из csv; True, если были новые"""
+        candidates = [
+            Path(settings.BASE_DIR).parent / "data" / "ingredients.csv",
+            Path(settings.BASE_DIR) / "data" / "ingredients.csv",
+        ]
+        if self.options["csv_path"]:
+            candidates.insert(0, Path(self.options["csv_path"]))
+        path = next((p for p in candidates if p.is_file()), None)
+        before = Ingredient.objects.count()
+        if path is not None:
+            with path.open(encoding="utf-8") as file:
+                Ingredient.objects.bulk_create(
+                    [
+                        Ingredient(
+                            name=row[0].strip(),
+                            measurement_unit=row[1].strip(),
+                        )
+                        for row in csv.reader(file)
+                        if len(row) >= 2 and row[0].strip() and row[1].strip()
+                    ],
+                    batch_size=self.batch_size,
+                    ignore_conflicts=True,
+                )
+        ingredients = list(
+            Ingredient.objects.order_by("id").values_list(
+                "id", "measurement_unit"
+            )
+        )
+        if not ingredients:
+            raise CommandError("No ingredients: pass --csv or run load_data")
+        # Популярность ингредиентов по закону Ципфа в случайном порядке.
+        self.rng.shuffle(ingredients)
+        self.ingredients = ingredients
+        self.ingredient_weights = _zipf_cum_weights(len(ingredients))
+        self.counts["Ingredient"] = len(ingredients)
+        return len(ingredients) > before
+
+    def _ensure_tags(self):
+        created = False
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create([Tag(**tag) for tag in DEFAULT_TAGS])
+            created = True
+        self.tag_ids = list(
+            Tag.objects.order_by("id").values_list("id", flat=True)
+        )
+        self.rng.shuffle(self.tag_ids)
+        self.tag_weights = _zipf_cum_weights(len(self.tag_ids), 0.7)
+        return created
+
+    def _create_users(self):
+        prefix = self.options["prefix"]
+        password = make_password(self.options["password"])
+        first_names = [self.fake.first_name() for _ in range(200)]
+        last_names = [self.fake.last_name() for _ in range(200)]
+        self.user_ids = []
+        numbers = iter(range(self.options["users"]))
+        while batch := list(itertools.islice(numbers, self.batch_size)):
+            users = User.objects.bulk_create(
+                [
+                    User(
+                        username=f"{prefix}{number}",
+                        email=f"{prefix}{number}@example.com",
+                        first_name=self.rng.choice(first_names),
+                        last_name=self.rng.choice(last_names),
+                        password=password,
+                        date_joined=self._date(),
+                    )
+                    for number in batch
+                ]
+            )
+            self.user_ids.extend(user.pk for user in users)
+        self.counts["User"] = len(self.user_ids)
+        # Популярность авторов с тяжелым хвостом: от нее зависят число
+        # подписчиков (степенное распределение) и число рецептов.
+        popularity = [
+            self.rng.paretovariate(self.options["alpha"])
+            for _ in self.user_ids
+        ]
+        self.author_weights = list(itertools.accumulate(popularity))
+
+    def _create_recipes(self):
+        image = _placeholder_image()
+        texts = [
+            self.fake.paragraph(nb_sentences=5) for _ in range(TEXT_POOL_SIZE)
+        ]
+        names_by_id = dict(Ingredient.objects.values_list("id", "name"))
+        self.recipes = []
+        numbers = iter(range(self.options["recipes"]))
+        while batch := list(itertools.islice(numbers, self.batch_size)):
+            authors = self.rng.choices(
+                self.user_ids, cum_weights=self.author_weights, k=len(batch)
+            )
+            compositions = [self._composition() for _ in batch]
+            recipes = Recipe.objects.bulk_create(
+                [
+                    Recipe(
+                        name=self._recipe_name(composition, names_by_id),
+                        text=self.rng.choice(texts),
+                        cooking_time=self.rng.choice(
+                            (5, 10, 15, 20, 30, 40, 45, 60, 90, 120)
+                        ),
+                        image=image,
+                        author_id=author_id,
+                        pub_date=self._date(),
+                    )
+                    for author_id, composition in zip(authors, compositions)
+                ]
+            )
+            self._insert(
+                RecipeIngredient,
+                ("recipe_id", "ingredient_id", "amount"),
+                (
+                    (recipe.pk, ingredient_id, amount)
+                    for recipe, (ingredients, _) in zip(recipes, compositions)
+                    for ingredient_id, amount in ingredients
+                ),
+            )
+            self._insert(
+                RecipeTag,
+                ("recipe_id", "tag_id"),
+                (
+                    (recipe.pk, tag_id)
+                    for recipe, (_, tag_ids) in zip(recipes, compositions)
+                    for tag_id in tag_ids
+                ),
+            )
+            self.recipes.extend(
+                (recipe.pk, recipe.author_id, recipe.pub_date)
+                for recipe in recipes
+            )
+        self.counts["Recipe"] = len(self.recipes)
+        # Популярность рецептов для избранного и корзин — тоже по Ципфу.
+        self.recipe_order = list(range(len(self.recipes)))
+        self.rng.shuffle(self.recipe_order)
+        self.recipe_weights = _zipf_cum_weights(len(self.recipes))
+
+    def _composition(self):
+        """Ингредиенты с количествами и теги одного рецепта"""
+        picked = _sample(
+            self.rng,
+            self.ingredients,
+            self.ingredient_weights,
+            self.rng.randint(3, 12),
+        )
+        ingredients = [
+            (
+                ingredient_id,
+                (
+                    self.rng.choice(AMOUNTS[unit])
+                    if unit in AMOUNTS
+                    else self.rng.randint(1, 5)
+                ),
+            )
+            for ingredient_id, unit in sorted(picked)
+        ]
+        tag_ids = _sample(
+            self.rng,
+            self.tag_ids,
+            self.tag_weights,
+            self.rng.choice((1, 1, 2, 2, 3)),
+        )
+        return ingredients, sorted(tag_ids)
+
+    def _recipe_name(self, composition, names_by_id):
+        ingredients = composition[0][:2]
+        name = "{}: {}".format(
+            self.rng.choice(DISHES),
+            ", ".join(names_by_id[pk] for pk, _ in ingredients),
+        )
+        return name[: Recipe._meta.get_field("name").max_length]
+
+    def _create_subscriptions(self):
+        """
+        Число подписок пользователя — экспоненциальное со средним
+        --following, авторы выбираются по популярности, поэтому число
+        подписчиков распределено по степенному закону
+        """
+        self.followers = {}
+        average = self.options["following"]
+
+        def rows():
+            for user_id in self.user_ids:
+                count = (
+                    int(self.rng.expovariate(1 / average)) if average else 0
+                )
+                authors = _sample(
+                    self.rng,
+                    self.user_ids,
+                    self.author_weights,
+                    min(count, len(self.user_ids) - 1),
+                )
+                authors.discard(user_id)
+                for author_id in sorted(authors):
+                    self.followers.setdefault(author_id, []).append(user_id)
+                    yield user_id, author_id, self._date()
+
+        self._insert(Subscription, ("user_id", "author_id", "created"), rows())
+
+    def _create_relations(self, model, average):
+        """Избранное или корзины: рецепты по популярности, после публикации"""
+
+        def rows():
+            for user_id in self.user_ids:
+                count = (
+                    int(self.rng.expovariate(1 / average)) if average else 0
+                )
+                positions = _sample(
+                    self.rng,
+                    self.recipe_order,
+                    self.recipe_weights,
+                    min(count, len(self.recipes)),
+                )
+                for position in sorted(positions):
+                    recipe_id, _, pub_date = self.recipes[position]
+                    yield user_id, recipe_id, self._date(after=pub_date)
+
+        self._insert(model, ("user_id", "recipe_id", "created"), rows())
+
+    def _create_timeline(self):
+        """
+        Ленты подписок, как их собрал бы fan-out при публикации: авторы с
+        большим числом подписчиков пропускаются и читаются на лету
+        """
+        by_author = {}
+        for recipe_id, author_id, pub_date in self.recipes:
+            by_author.setdefault(author_id, []).append((recipe_id, pub_date))
+
+        def rows():
+            for author_id, followers in self.followers.items():
+                if len(followers) > TIMELINE_FANOUT_MAX_FOLLOWERS:
+                    continue
+                for recipe_id, pub_date in by_author.get(author_id, ()):
+                    for user_id in followers:
+                        yield user_id, recipe_id, author_id, pub_date
+
+        self._insert(
+            TimelineEntry,
+            ("user_id", "recipe_id", "author_id", "pub_date"),
+            rows(),
+        )
@@ -0,0 +1,100 @@
+import os
+import shutil
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.memory import read_samples
+
+MIB = 1024 * 1024
+
+
+def _mib(size):
+    return f"{size / MIB:.2f}" if size is not None else "-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarize tracemalloc request samples from all worker processes: "
+        "peak and retained memory per route, top allocation sites and "
+        "RSS growth per worker"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dir",
+            default=settings.TRACEMALLOC_DIR,
+            help="Directory with memory-<pid>.jsonl files",
+        )
+        parser.add_argument("--route", help="Only samples of this route")
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=10,
+            help="Number of allocation sites to show",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete the samples after printing the report",
+        )
+
+    def handle(self, *args, **options):
+        directory = options["dir"]
+        if not os.path.isdir(directory):
+            raise CommandError(
+                f"No samples in {directory}: set TRACEMALLOC_SAMPLE_RATE"
+            )
+        routes = defaultdict(list)
+        sites = defaultdict(lambda: [0, 0])
+        workers = defaultdict(list)
+        for sample in read_samples(directory):
+            workers[sample["pid"]].append(sample)
+            if options["route"] and sample["route"] != options["route"]:
+                continue
+            routes[(sample["route"], sample["method"])].append(sample)
+            for site in sample["sites"]:
+                sites[site["site"]][0] += site["size"]
+                sites[site["site"]][1] += site["count"]
+        if not workers:
+            self.stdout.write(self.style.WARNING("No samples recorded yet"))
+            return
+
+        self.stdout.write(
+            f"{'route':<40} {'samples':>7} {'peak avg':>9} "
+            f"{'peak max':>9} {'kept avg':>9} {'kept sum':>9}  MiB"
+        )
+        ordered = sorted(
+            routes.items(),
+            key=lambda item: -sum(s["retained"] for s in item[1]),
+        )
+        for (route, method), samples in ordered:
+            peaks = [s["peak"] for s in samples]
+            retained = [s["retained"] for s in samples]
+            self.stdout.write(
+                f"{f'{method} {route}':<40} {len(samples):>7} "
+                f"{_mib(sum(peaks) / len(peaks)):>9} {_mib(max(peaks)):>9} "
+                f"{_mib(sum(retained) / len(retained)):>9} "
+                f"{_mib(sum(retained)):>9}"
+            )
+
+        self.stdout.write("\nTop allocation sites still held after requests:")
+        top = sorted(sites.items(), key=lambda item: -item[1][0])
+        for site, (size, count) in top[: options["top"]]:
+            self.stdout.write(
+                f"  {_mib(size):>9} MiB {count:>8} blocks  {site}"
+            )
+
+        self.stdout.write("\nWorkers (RSS at the first and last sample):")
+        for pid, samples in sorted(workers.items()):
+            first, last = samples[0], samples[-1]
+            self.stdout.write(
+                f"  pid {pid}: {_mib(first['rss'])} MiB at request "
+                f"{first['served']}, {_mib(last['rss'])} MiB at request "
+                f"{last['served']}"
+            )
+
+        if options["clear"]:
+            shutil.rmtree(directory)
+            self.stdout.write(self.style.SUCCESS("Samples deleted"))
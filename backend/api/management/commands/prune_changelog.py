@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import ChangeLogEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete change log entries older than --days; clients with an "
+        "older sync cursor get reset=true and reload their data"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        deleted, _ = ChangeLogEntry.objects.filter(created__lt=cutoff).delete()
+        self.stdout.write(
+            self.style.SUCCESS(f"Change log entries deleted: {deleted}")
+        )
@@ -0,0 +1,318 @@
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Ingredient, Tag, User
+from api.replay import ReplayError, Scenario, load_collection, run_load
+
+DEFAULT_COLLECTION = (
+    settings.BASE_DIR.parent
+    / "postman_collection"
+    / "foodgram.postman_collection.json"
+)
+STARTUP_TIMEOUT_SECONDS = 30
+# Коллекции нужны три тега и два ингредиента (postman_collection/README).
+MIN_TAGS = 3
+MIN_INGREDIENTS = 2
+
+
+def _numbers(value):
+    return [int(number) for number in value.split(",") if number.strip()]
+
+
+def _ms(value):
+    return f"{value:.1f}" if value is not None else "-"
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay the successful requests of the Postman collection with "
+        "concurrent virtual users and report throughput, latency "
+        "percentiles and error rates. With --workers the command starts "
+        "gunicorn itself for every worker count and pool size"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--collection", default=str(DEFAULT_COLLECTION))
+        parser.add_argument(
+            "--base-url",
+            default="http://127.0.0.1:8000",
+            help="Running server to load (ignored with --workers)",
+        )
+        parser.add_argument(
+            "--users", type=int, default=10, help="Virtual users"
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=1,
+            help="Flow repetitions per virtual user after sign-up",
+        )
+        parser.add_argument(
+            "--duration",
+            type=float,
+            help="Repeat flows for this many seconds instead of "
+            "--iterations",
+        )
+        parser.add_argument(
+            "--ramp-up",
+            type=float,
+            default=0,
+            help="Seconds over which virtual users start",
+        )
+        parser.add_argument(
+            "--think-time",
+            type=float,
+            default=0,
+            help="Pause between requests of a virtual user, seconds",
+        )
+        parser.add_argument("--timeout", type=float, default=30)
+        parser.add_argument(
+            "--flows",
+            help="Comma-separated top-level collection folders to repeat "
+            "(default: all); sign-up and login always run first",
+        )
+        parser.add_argument(
+            "--workers",
+            type=_numbers,
+            help="Comma-separated gunicorn worker counts to compare",
+        )
+        parser.add_argument(
+            "--pool-sizes",
+            type=_numbers,
+            default=[],
+            help="Comma-separated DB_POOL_MAX_SIZE values to compare "
+            "(PostgreSQL with DB_POOL only)",
+        )
+        parser.add_argument(
+            "--worker-class",
+            default=os.getenv(
+                "GUNICORN_WORKER_CLASS", "uvicorn_worker.UvicornWorker"
+            ),
+        )
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument(
+            "--prefix",
+            default="load",
+            help="Prefix of the usernames and emails of virtual users",
+        )
+        parser.add_argument("--json", help="Write the results to this file")
+        parser.add_argument(
+            "--cleanup",
+            action="store_true",
+            help="Delete the virtual users of this run from the database",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            variables, steps = load_collection(options["collection"])
+            scenario = Scenario(
+                steps,
+                variables,
+                options["flows"].split(",") if options["flows"] else None,
+            )
+        except (OSError, ValueError, ReplayError) as error:
+            raise CommandError(error)
+        tag = f"{options['prefix']}-{uuid.uuid4().hex[:8]}"
+        self.stdout.write(
+            f"{len(scenario.setup)} sign-up requests, "
+            f"{len(scenario.loop)} requests per iteration "
+            f"({', '.join(scenario.flows)})"
+        )
+
+        runs = []
+        if options["workers"]:
+            self._check_data()
+            configurations = itertools.product(
+                options["workers"], options["pool_sizes"] or [None]
+            )
+            for number, (workers, pool_size) in enumerate(configurations):
+                with self._server(workers, pool_size, options) as base_url:
+                    runs.append(
+                        self._run(
+                            scenario,
+                            variables,
+                            base_url,
+                            f"{tag}-{number}",
+                            {"workers": workers, "pool_size": pool_size},
+                            options,
+                        )
+                    )
+        else:
+            runs.append(
+                self._run(
+                    scenario,
+                    variables,
+                    options["base_url"],
+                    tag,
+                    {"base_url": options["base_url"]},
+                    options,
+                )
+            )
+
+        if len(runs) > 1:
+            self._compare(runs)
+        if options["json"]:
+            with open(options["json"], "w", encoding="utf-8") as file:
+                json.dump(
+                    {"tag": tag, "users": options["users"], "runs": runs},
+                    file,
+                    ensure_ascii=False,
+                    indent=2,
+                )
+                file.write("\n")
+        if options["cleanup"]:
+            deleted, _ = User.objects.filter(
+                username__startswith=f"{tag}-"
+            ).delete()
+            self.stdout.write(f"Deleted {deleted} objects of {tag}")
+        if any(run["errors"] for run in runs):
+            self.stdout.write(self.style.WARNING("Some requests failed"))
+
+    def _run(self, scenario, variables, base_url, tag, config, options):
+        label = " ".join(f"{key}={value}" for key, value in config.items())
+        self.stdout.write(
+            f"\n{label}: {options['users']} virtual users against {base_url}"
+        )
+        stats = run_load(
+            scenario,
+            variables,
+            base_url,
+            options["users"],
+            tag,
+            iterations=options["iterations"],
+            duration=options["duration"],
+            ramp_up=options["ramp_up"],
+            think_time=options["think_time"],
+            timeout=options["timeout"],
+        )
+        summary = stats.summary()
+        self._report(summary)
+        return {**config, **summary}
+
+    def _report(self, summary):
+        width = max([len("request")] + [len(n) for n in summary["steps"]])
+        self.stdout.write(
+            f"{'request':<{width}} {'method':<6} {'count':>6} "
+            f"{'errors':>6} {'rps':>7} {'p50 ms':>8} {'p95 ms':>8} "
+            f"{'p99 ms':>8}"
+        )
+        for name, step in summary["steps"].items():
+            line = (
+                f"{name:<{width}} {step['method']:<6} {step['count']:>6} "
+                f"{step['errors']:>6} {step['throughput_rps']:>7.1f} "
+                f"{_ms(step['p50_ms']):>8} {_ms(step['p95_ms']):>8} "
+                f"{_ms(step['p99_ms']):>8}"
+            )
+            self.stdout.write(
+                self.style.ERROR(line) if step["errors"] else line
+            )
+            for kind, count in step["error_kinds"].items():
+                self.stdout.write(f"    {kind}: {count}")
+            for example in step["error_examples"]:
+                self.stdout.write(f"    {example}")
+        self.stdout.write(
+            f"total: {summary['requests']} requests in "
+            f"{summary['duration_s']} s, "
+            f"{summary['throughput_rps']} req/s, "
+            f"errors {summary['error_rate']:.2%}, "
+            f"p50 {_ms(summary['p50_ms'])} ms, "
+            f"p95 {_ms(summary['p95_ms'])} ms, "
+            f"p99 {_ms(summary['p99_ms'])} ms, "
+            f"{summary['iterations']} iterations "
+            f"(p50 {_ms(summary['iteration_p50_ms'])} ms)"
+        )
+
+    def _compare(self, runs):
+        self.stdout.write(
+            f"\n{'workers':>7} {'pool':>5} {'req/s':>8} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {'p99 ms':>8} {'errors':>7}"
+        )
+        for run in runs:
+            self.stdout.write(
+                f"{run['workers']:>7} {run['pool_size'] or '-':>5} "
+                f"{run['throughput_rps']:>8.1f} {_ms(run['p50_ms']):>8} "
+                f"{_ms(run['p95_ms']):>8} {_ms(run['p99_ms']):>8} "
+                f"{run['error_rate']:>7.2%}"
+            )
+
+    def _check_data(self):
+        if (
+            Tag.objects.count() < MIN_TAGS
+            or Ingredient.objects.count() < MIN_INGREDIENTS
+        ):
+            raise CommandError(
+                f"The collection needs at least {MIN_TAGS} tags and "
+                f"{MIN_INGREDIENTS} ingredients: run load_data first"
+            )
+
+    @contextmanager
+    def _server(self, workers, pool_size, options):
+        """gunicorn с теми же приложением и настройками, что в entrypoint"""
+        worker_class = options["worker_class"]
+        application = (
+            "foodgram.wsgi:application"
+            if worker_class == "sync"
+            else "foodgram.asgi:application"
+        )
+        base_url = f"http://127.0.0.1:{options['port']}"
+        with (
+            tempfile.TemporaryDirectory() as metrics_dir,
+            tempfile.TemporaryFile() as log,
+        ):
+            env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": metrics_dir}
+            if pool_size:
+                env["DB_POOL_MAX_SIZE"] = str(pool_size)
+            process = subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "gunicorn",
+                    application,
+                    "--bind",
+                    f"127.0.0.1:{options['port']}",
+                    f"--workers={workers}",
+                    "--worker-class",
+                    worker_class,
+                ],
+                cwd=settings.BASE_DIR,
+                env=env,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
+            try:
+                self._wait_ready(process, base_url, log)
+                yield base_url
+            finally:
+                process.terminate()
+                try:
+                    process.wait(10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+
+    def _wait_ready(self, process, base_url, log):
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                break
+            try:
+                # Первый запрос воркера импортирует приложение, поэтому
+                # таймаут больше обычного.
+                requests.get(f"{base_url}/api/tags/", timeout=10)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        log.seek(0)
+        output = log.read().decode(errors="replace")[-2000:]
+        raise CommandError(f"gunicorn did not start:\n{output}")
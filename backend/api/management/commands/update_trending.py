@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from api.trending import decay_scores, rebuild_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Decay trending recipe scores by the time elapsed since the "
+        "previous decay (run on a schedule, e.g. hourly from cron) or "
+        "rebuild them from favorites and shopping carts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute all scores from relation timestamps",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            total = rebuild_scores()
+            self.stdout.write(
+                self.style.SUCCESS(f"Trending scores rebuilt: {total}")
+            )
+            return
+
+        decayed, removed, hours = decay_scores()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Trending scores decayed over {hours:.2f} h: {decayed}, "
+                f"removed {removed}"
+            )
+        )
@@ -0,0 +1,209 @@
+import gc
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import tracemalloc
+
+from django.conf import settings
+
+from .constants import TRACEMALLOC_TOP_SITES
+
+logger = logging.getLogger(__name__)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+# Собственные выделения замера: снимки и счетчики.
+SKIP_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, os.path.abspath(__file__)),
+]
+
+# Трассы tracemalloc общие для процесса, поэтому одновременно
+# измеряется не больше одного запроса: от начала замера до его записи.
+_sampling = threading.Lock()
+# Замеры, ждущие снимка и записи в фоновом потоке.
+pending = queue.Queue()
+_writer = None
+_writer_lock = threading.Lock()
+# Запросы, обработанные процессом: вместе с RSS показывает рост памяти
+# за жизнь воркера до перезапуска по max_requests.
+_served = itertools.count(1)
+
+
+def enabled():
+    return settings.TRACEMALLOC_SAMPLE_RATE > 0
+
+
+def start():
+    if enabled() and not tracemalloc.is_tracing():
+        tracemalloc.start(settings.TRACEMALLOC_FRAMES)
+
+
+def count_request():
+    return next(_served)
+
+
+def sample_path(pid):
+    return os.path.join(settings.TRACEMALLOC_DIR, f"memory-{pid}.jsonl")
+
+
+def rss():
+    """Текущий RSS процесса в байтах (только Linux), иначе None"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _short(filename):
+    if filename.startswith(settings.BASE_DIR.as_posix()):
+        return os.path.relpath(filename, settings.BASE_DIR)
+    head, separator, tail = filename.rpartition("site-packages/")
+    return tail if separator else filename
+
+
+def _site(traceback):
+    """
+    Место выделения: строка, где выделена память, и ближайший к ней
+    кадр кода приложения, если это разные строки. Кадры Traceback идут
+    от самого раннего вызова
+    """
+    frames = list(reversed(traceback))
+    site = "{}:{}".format(_short(frames[0].filename), frames[0].lineno)
+    for frame in frames:
+        if frame.filename.startswith(APP_DIR):
+            if frame != frames[0]:
+                site += " <- {}:{}".format(
+                    _short(frame.filename), frame.lineno
+                )
+            break
+    return site
+
+
+class Sample:
+    """
+    Замер одного запроса: пик выделенной памяти за запрос, память,
+    оставшаяся после запроса и сборки мусора, и места выделения блоков,
+    которые появились за запрос и еще живы. В начале замера трассы
+    tracemalloc сбрасываются: снимок после запроса содержит только новые
+    блоки, и сравнивать его с кучей до запроса не нужно
+    """
+
+    def __init__(self):
+        tracemalloc.clear_traces()
+        tracemalloc.reset_peak()
+        self.record = None
+
+    def stop(self, route, method, status, served):
+        """Конец запроса: пик и данные запроса, без снимков"""
+        _, peak = tracemalloc.get_traced_memory()
+        self.record = {
+            "time": time.time(),
+            "pid": os.getpid(),
+            "route": route,
+            "method": method,
+            "status": status,
+            "served": served,
+            "rss": rss(),
+            "peak": peak,
+        }
+
+    @staticmethod
+    def _sites(snapshot):
+        """Живые блоки снимка по местам выделения, крупные первыми"""
+        sites = {}
+        for stat in snapshot.filter_traces(SKIP_FILTERS).statistics(
+            "traceback"
+        ):
+            site = sites.setdefault(_site(stat.traceback), [0, 0])
+            site[0] += stat.size
+            site[1] += stat.count
+        return sorted(sites.items(), key=lambda item: -item[1][0])
+
+    def finish(self):
+        """Сборка мусора, снимок и запись замера; выполняется в фоне"""
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+        top = self._sites(tracemalloc.take_snapshot())
+        self.record.update(
+            retained=current,
+            sites=[
+                {"site": site, "size": size, "count": count}
+                for site, (size, count) in top[:TRACEMALLOC_TOP_SITES]
+            ],
+        )
+        os.makedirs(settings.TRACEMALLOC_DIR, exist_ok=True)
+        with open(sample_path(os.getpid()), "a") as file:
+            file.write(json.dumps(self.record, ensure_ascii=False) + "\n")
+
+
+def sampled():
+    """Попал ли запрос в долю TRACEMALLOC_SAMPLE_RATE"""
+    return (
+        tracemalloc.is_tracing()
+        and random.random() < settings.TRACEMALLOC_SAMPLE_RATE
+    )
+
+
+def begin_sample():
+    """Sample для запроса, если другой запрос сейчас не измеряется"""
+    if not _sampling.acquire(blocking=False):
+        return None
+    try:
+        return Sample()
+    except BaseException:
+        _sampling.release()
+        raise
+
+
+def _write_pending():
+    while True:
+        sample = pending.get()
+        try:
+            sample.finish()
+        except Exception:
+            logger.exception("Не удалось записать замер памяти")
+        finally:
+            _sampling.release()
+            pending.task_done()
+
+
+def _start_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(
+                target=_write_pending, name="memory-samples", daemon=True
+            )
+            _writer.start()
+
+
+def end_sample(sample, route, method, status, served):
+    """
+    Фиксирует пик и отдает замер фоновому потоку: ответ не ждет сборки
+    мусора и снимка. Место замера освобождается после записи
+    """
+    try:
+        sample.stop(route, method, status, served)
+        _start_writer()
+        pending.put(sample)
+    except BaseException:
+        _sampling.release()
+        raise
+
+
+def read_samples(directory):
+    """Записи всех процессов, включая завершенные по max_requests"""
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith("memory-") and name.endswith(".jsonl")):
+            continue
+        with open(os.path.join(directory, name)) as file:
+            for line in file:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
@@ -0,0 +1,181 @@
+import hmac
+import ipaddress
+import os
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from .constants import METRICS_QUERY_BUCKETS
+
+# Счетчики текущего запроса; None — запрос не измеряется.
+current = ContextVar("request_metrics", default=None)
+
+LABELS = ("route", "method")
+
+REQUEST_DURATION = Histogram(
+    "foodgram_request_duration_seconds",
+    "Время обработки запроса",
+    LABELS,
+)
+DB_DURATION = Histogram(
+    "foodgram_request_db_duration_seconds",
+    "Суммарное время SQL-запросов за запрос",
+    LABELS,
+)
+DB_QUERIES = Histogram(
+    "foodgram_request_db_queries",
+    "Число SQL-запросов за запрос",
+    LABELS,
+    buckets=METRICS_QUERY_BUCKETS,
+)
+SERIALIZER_DURATION = Histogram(
+    "foodgram_request_serializer_duration_seconds",
+    "Время сериализации ответа",
+    LABELS,
+)
+CACHE_LOOKUPS = Counter(
+    "foodgram_cache_lookups",
+    "Обращения к кешу по результату",
+    (*LABELS, "result"),
+)
+REQUESTS = Counter(
+    "foodgram_requests",
+    "Запросы по статусу ответа",
+    (*LABELS, "status"),
+)
+
+
+class RequestMetrics:
+    """Счетчики одного запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def server_timing(self, total):
+        return ", ".join(
+            (
+                f'db;dur={self.sql_time * 1000:.1f};desc="{self.sql_count} '
+                'queries"',
+                f"serializer;dur={self.serializer_time * 1000:.1f}",
+                f'cache;desc="{self.cache_hits} hit, '
+                f'{self.cache_misses} miss"',
+                f"view;dur={total * 1000:.1f}",
+            )
+        )
+
+    def observe(self, route, method, status, total):
+        labels = (route, method)
+        REQUEST_DURATION.labels(*labels).observe(total)
+        DB_DURATION.labels(*labels).observe(self.sql_time)
+        DB_QUERIES.labels(*labels).observe(self.sql_count)
+        SERIALIZER_DURATION.labels(*labels).observe(self.serializer_time)
+        if self.cache_hits:
+            CACHE_LOOKUPS.labels(*labels, "hit").inc(self.cache_hits)
+        if self.cache_misses:
+            CACHE_LOOKUPS.labels(*labels, "miss").inc(self.cache_misses)
+        REQUESTS.labels(*labels, str(status)).inc()
+
+
+def route_name(request):
+    """
+    Метка маршрута: имя URL, у вьюсетов это basename и действие
+    (recipes-list, recipes-download-shopping-cart)
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        # Ответ из кеша отдан до разбора URL.
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return "unmatched"
+    return match.url_name or match.route
+
+
+def record_query(execute, sql, params, many, context):
+    """Обертка execute_wrappers: время и число SQL-запросов"""
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.sql_count += 1
+        metrics.sql_time += time.perf_counter() - started
+
+
+def count_cache_lookups(hits, misses):
+    """Учитывает обращения к кешу в счетчиках текущего запроса"""
+    metrics = current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def _networks(value):
+    return [
+        ipaddress.ip_network(item.strip(), strict=False)
+        for item in value
+        if item.strip()
+    ]
+
+
+def metrics_allowed(request):
+    """
+    Метрики видят сотрудники, запросы с токеном METRICS_TOKEN
+    (Authorization: Bearer ...) и адреса из METRICS_ALLOWED_NETWORKS
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+    header = request.headers.get("Authorization", "").split()
+    if (
+        settings.METRICS_TOKEN
+        and len(header) == 2
+        and header[0].lower() == "bearer"
+        and hmac.compare_digest(header[1], settings.METRICS_TOKEN)
+    ):
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get("REMOTE_ADDR", ""))
+    except ValueError:
+        return False
+    return any(
+        address in network
+        for network in _networks(settings.METRICS_ALLOWED_NETWORKS)
+    )
+
+
+def metrics_view(request):
+    """
+    Метрики в формате Prometheus. Под gunicorn каждый воркер пишет
+    свои значения в PROMETHEUS_MULTIPROC_DIR, здесь они суммируются
+    """
+    if not metrics_allowed(request):
+        return HttpResponse("Доступ запрещен.", status=403)
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+    )
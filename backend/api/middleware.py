@@ -0,0 +1,459 @@
+import asyncio
+import hashlib
+import random
+import time
+from functools import partial
+
+from asgiref.sync import (
+    iscoroutinefunction,
+    markcoroutinefunction,
+    sync_to_async,
+)
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.permissions import SAFE_METHODS
+
+from . import memory, metrics, profiling, response_cache, slow_queries
+from .authentication import token_key
+from .constants import SINGLE_FLIGHT_LEASE_SECONDS, SINGLE_FLIGHT_POLL_SECONDS
+from .db_routers import replica_alias
+from .single_flight import acquire_lease, local_flights, release_lease
+
+_in_thread = partial(sync_to_async, thread_sensitive=False)
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """
+    Безопасные запросы к вьюсетам с replica_reads = True читают
+    с одной случайной реплики. После успешной записи клиент на
+    DB_REPLICA_STICKY_SECONDS закрепляется за основной БД: cookie для
+    браузера и метка в кеше по токену для остальных клиентов
+    """
+
+    cookie_name = "db_primary"
+    cache_prefix = "db:primary:"
+
+    def _pin_key(self, request):
+        token = token_key(request)
+        if token is None:
+            return None
+        return self.cache_prefix + hashlib.sha256(token.encode()).hexdigest()
+
+    def _is_pinned(self, request):
+        if self.cookie_name in request.COOKIES:
+            return True
+        key = self._pin_key(request)
+        return key is not None and cache.get(key) is not None
+
+    def process_request(self, request):
+        replica_alias.set(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "cls", None)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method in SAFE_METHODS
+            and getattr(view_class, "replica_reads", False)
+            and not self._is_pinned(request)
+        ):
+            replica_alias.set(random.choice(settings.DATABASE_REPLICAS))
+
+    def process_response(self, request, response):
+        replica_alias.set(None)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+        ):
+            window = settings.DB_REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                self.cookie_name,
+                "1",
+                max_age=window,
+                httponly=True,
+                samesite="Lax",
+            )
+            key = self._pin_key(request)
+            if key is not None:
+                cache.set(key, True, window)
+        return response
+
+
+class AnonymousResponseCacheMiddleware:
+    """
+    Кеш полных ответов на анонимные GET к ленте, рецептам, тегам,
+    ингредиентам и коротким ссылкам (см. api.response_cache).
+
+    Несвежую запись пересобирает один запрос: внутри процесса лидера
+    выбирает local_flights, между процессами — аренда в кеше. Остальные
+    запросы отдают прежнюю запись (stale-while-revalidate), а если ее
+    нет — ждут результат лидера. Под ASGI обращения к кешу идут в пуле
+    потоков, не занимая поток синхронных вьюх
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        key = response_cache.request_key(request)
+        if key is None:
+            return self.get_response(request)
+        entry, fresh = response_cache.lookup(key)
+        if fresh:
+            return response_cache.build(entry, "HIT")
+
+        leader, flight = local_flights.join(key)
+        if not leader:
+            if entry is not None:
+                return response_cache.build(entry, "STALE")
+            try:
+                result = flight.result(timeout=SINGLE_FLIGHT_LEASE_SECONDS)
+            except TimeoutError:
+                result = None
+            if result is not None:
+                return response_cache.build(result, "HIT")
+            return self.get_response(request)
+
+        result = None
+        try:
+            response, result = self._lead(request, key, entry)
+            return response
+        finally:
+            local_flights.finish(key, result)
+
+    def _lead(self, request, key, entry):
+        token = acquire_lease(key)
+        if token is None:
+            if entry is not None:
+                return response_cache.build(entry, "STALE"), entry
+            entry = self._wait(key)
+            if entry is not None:
+                return response_cache.build(entry, "HIT"), entry
+        try:
+            started = time.time_ns()
+            response = self.get_response(request)
+            return response, response_cache.store(key, response, started)
+        finally:
+            if token is not None:
+                release_lease(key, token)
+
+    @staticmethod
+    def _wait(key):
+        """Ждет, пока лидер из другого процесса сохранит запись"""
+        deadline = time.monotonic() + SINGLE_FLIGHT_LEASE_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+            entry, fresh = response_cache.lookup(key)
+            if fresh:
+                return entry
+        return None
+
+    async def __acall__(self, request):
+        key = response_cache.request_key(request)
+        if key is None:
+            return await self.get_response(request)
+        entry, fresh = await _in_thread(response_cache.lookup)(key)
+        if fresh:
+            return response_cache.build(entry, "HIT")
+
+        leader, flight = local_flights.join(key)
+        if not leader:
+            if entry is not None:
+                return response_cache.build(entry, "STALE")
+            try:
+                result = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(flight)),
+                    SINGLE_FLIGHT_LEASE_SECONDS,
+                )
+            except TimeoutError:
+                result = None
+            if result is not None:
+                return response_cache.build(result, "HIT")
+            return await self.get_response(request)
+
+        result = None
+        try:
+            response, result = await self._alead(request, key, entry)
+            return response
+        finally:
+            local_flights.finish(key, result)
+
+    async def _alead(self, request, key, entry):
+        token = await _in_thread(acquire_lease)(key)
+        if token is None:
+            if entry is not None:
+                return response_cache.build(entry, "STALE"), entry
+            entry = await self._await(key)
+            if entry is not None:
+                return response_cache.build(entry, "HIT"), entry
+        try:
+            started = time.time_ns()
+            response = await self.get_response(request)
+            entry = await _in_thread(response_cache.store)(
+                key, response, started
+            )
+            return response, entry
+        finally:
+            if token is not None:
+                await _in_thread(release_lease)(key, token)
+
+    @staticmethod
+    async def _await(key):
+        deadline = time.monotonic() + SINGLE_FLIGHT_LEASE_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(SINGLE_FLIGHT_POLL_SECONDS)
+            entry, fresh = await _in_thread(response_cache.lookup)(key)
+            if fresh:
+                return entry
+        return None
+
+
+class RequestMetricsMiddleware:
+    """
+    Замеряет запрос: SQL, сериализацию, обращения к кешу и общее время.
+    Итог уходит в заголовок Server-Timing и в гистограммы по маршруту
+    (см. api.metrics). Стоит раньше кеша ответов, чтобы учитывать и
+    ответы из кеша
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self._finish(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current.set(request_metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current.reset(token)
+        return self._finish(request, response, request_metrics)
+
+    @staticmethod
+    def _finish(request, response, request_metrics):
+        total = time.perf_counter() - request_metrics.started
+        if settings.SERVER_TIMING:
+            response["Server-Timing"] = request_metrics.server_timing(total)
+        request_metrics.observe(
+            metrics.route_name(request),
+            request.method,
+            response.status_code,
+            total,
+        )
+        return response
+
+
+class SlowQueryMiddleware:
+    """
+    Отслеживает SQL запроса: медленнее SLOW_QUERY_THRESHOLD_MS или
+    повторенные больше SLOW_QUERY_REPEAT_LIMIT раз попадают в журнал
+    и в админку (см. api.slow_queries). Находки записывает фоновый
+    поток, ответ их не ждет
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        watch = slow_queries.QueryWatch()
+        token = slow_queries.current.set(watch)
+        try:
+            response = self.get_response(request)
+        finally:
+            slow_queries.current.reset(token)
+        if watch.findings:
+            slow_queries.flush(watch, metrics.route_name(request))
+        return response
+
+    async def __acall__(self, request):
+        watch = slow_queries.QueryWatch()
+        token = slow_queries.current.set(watch)
+        try:
+            response = await self.get_response(request)
+        finally:
+            slow_queries.current.reset(token)
+        if watch.findings:
+            slow_queries.flush(watch, metrics.route_name(request))
+        return response
+
+
+class ProfilerMiddleware:
+    """
+    Профилирует отдельный запрос сотрудника с заголовком X-Profile или
+    параметром ?profile= (см. api.profiling). Профиль доступен в админке,
+    его id возвращается в заголовке X-Profile-Id. Число профилей в минуту
+    и одновременных профилей ограничено через общий кеш, при превышении
+    запрос получает 429
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profile_format = profiling.requested_format(request)
+        if profile_format is None:
+            return self.get_response(request)
+        try:
+            grant = profiling.admit(request)
+        except profiling.ProfilerBusy as error:
+            return JsonResponse({"detail": str(error)}, status=429)
+        if grant is None:
+            return self.get_response(request)
+        user, slot = grant
+        try:
+            profiler = profiling.new_profiler()
+            started = time.perf_counter()
+            profiler.start()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.stop()
+            profile = profiling.save(
+                profiler,
+                profile_format,
+                user,
+                request,
+                response,
+                time.perf_counter() - started,
+            )
+        finally:
+            profiling.release(slot)
+        response["X-Profile-Id"] = profile.pk
+        return response
+
+    async def __acall__(self, request):
+        profile_format = profiling.requested_format(request)
+        if profile_format is None:
+            return await self.get_response(request)
+        try:
+            grant = await sync_to_async(profiling.admit)(request)
+        except profiling.ProfilerBusy as error:
+            return JsonResponse({"detail": str(error)}, status=429)
+        if grant is None:
+            return await self.get_response(request)
+        user, slot = grant
+        try:
+            profiler = profiling.new_profiler()
+            in_loop = profiling.runs_in_event_loop(request)
+            started = time.perf_counter()
+            if in_loop:
+                profiler.start()
+            else:
+                await sync_to_async(profiler.start)()
+            try:
+                response = await self.get_response(request)
+            finally:
+                if in_loop:
+                    profiler.stop()
+                else:
+                    await sync_to_async(profiler.stop)()
+            profile = await sync_to_async(profiling.save)(
+                profiler,
+                profile_format,
+                user,
+                request,
+                response,
+                time.perf_counter() - started,
+            )
+        finally:
+            await sync_to_async(profiling.release)(slot)
+        response["X-Profile-Id"] = profile.pk
+        return response
+
+
+class MemorySampleMiddleware:
+    """
+    При TRACEMALLOC_SAMPLE_RATE > 0 доля запросов измеряется снимками
+    tracemalloc: пик и оставшаяся память по маршруту и главные места
+    выделения пишутся в файл процесса (см. api.memory, memory_report).
+    Снимок и запись выполняет фоновый поток, ответ их не ждет. Под ASGI
+    в замер попадают и выделения запросов, которые event loop обслуживал
+    одновременно с измеряемым
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        served = memory.count_request()
+        sample = memory.begin_sample() if memory.sampled() else None
+        if sample is None:
+            return self.get_response(request)
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            self._finish(sample, request, response, served)
+
+    async def __acall__(self, request):
+        served = memory.count_request()
+        sample = memory.begin_sample() if memory.sampled() else None
+        if sample is None:
+            return await self.get_response(request)
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            self._finish(sample, request, response, served)
+
+    @staticmethod
+    def _finish(sample, request, response, served):
+        memory.end_sample(
+            sample,
+            metrics.route_name(request),
+            request.method,
+            response.status_code if response is not None else None,
+            served,
+        )
@@ -0,0 +1,71 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0001_initial"),
+    ]
+
+    operations = [
+        # Таблица api_recipe_tags уже существует как автоматическая M2M,
+        # поэтому меняем только состояние моделей.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name="RecipeTag",
+                    fields=[
+                        (
+                            "id",
+                            models.BigAutoField(
+                                auto_created=True,
+                                primary_key=True,
+                                serialize=False,
+                                verbose_name="ID",
+                            ),
+                        ),
+                        (
+                            "recipe",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="recipe_tags",
+                                to="api.recipe",
+                                verbose_name="Рецепт",
+                            ),
+                        ),
+                        (
+                            "tag",
+                            models.ForeignKey(
+                                on_delete=django.db.models.deletion.CASCADE,
+                                related_name="recipe_tags",
+                                to="api.tag",
+                                verbose_name="Тег",
+                            ),
+                        ),
+                    ],
+                    options={
+                        "verbose_name": "Тег рецепта",
+                        "verbose_name_plural": "Теги рецепта",
+                        "db_table": "api_recipe_tags",
+                        "unique_together": {("recipe", "tag")},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name="recipe",
+                    name="tags",
+                    field=models.ManyToManyField(
+                        related_name="recipes",
+                        through="api.RecipeTag",
+                        to="api.tag",
+                        verbose_name="Теги рецепта",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="recipetag",
+            index=models.Index(
+                fields=["tag", "recipe"], name="recipe_tag_tag_recipe_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0003_recipe_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeTrend",
+            fields=[
+                (
+                    "recipe",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="trend",
+                        serialize=False,
+                        to="api.recipe",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+                (
+                    "score",
+                    models.FloatField(default=0, verbose_name="Рейтинг"),
+                ),
+                (
+                    "updated",
+                    models.DateTimeField(
+                        auto_now=True, verbose_name="Дата обновления"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Рейтинг рецепта",
+                "verbose_name_plural": "Рейтинги рецептов",
+                "ordering": ["-score"],
+                "indexes": [
+                    models.Index(
+                        fields=["-score"], name="recipe_trend_score_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,82 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0005_timelineentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLogEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("recipe", "Рецепт"),
+                            ("favorite", "Избранное"),
+                            ("shopping_cart", "Список покупок"),
+                            ("subscription", "Подписка"),
+                        ],
+                        max_length=20,
+                        verbose_name="Тип объекта",
+                    ),
+                ),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("created", "Создание"),
+                            ("updated", "Изменение"),
+                            ("deleted", "Удаление"),
+                        ],
+                        max_length=10,
+                        verbose_name="Действие",
+                    ),
+                ),
+                (
+                    "object_id",
+                    models.BigIntegerField(verbose_name="id объекта"),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата изменения"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Запись журнала изменений",
+                "verbose_name_plural": "Журнал изменений",
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["user", "id"], name="changelog_user_id_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,93 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0006_changelogentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlowQuery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "route",
+                    models.CharField(max_length=200, verbose_name="Маршрут"),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("slow", "Медленный"),
+                            ("repeated", "Повторяющийся"),
+                        ],
+                        max_length=10,
+                        verbose_name="Тип",
+                    ),
+                ),
+                (
+                    "fingerprint",
+                    models.CharField(max_length=40, verbose_name="Отпечаток"),
+                ),
+                ("sql", models.TextField(verbose_name="SQL")),
+                (
+                    "location",
+                    models.CharField(
+                        blank=True, max_length=300, verbose_name="Место вызова"
+                    ),
+                ),
+                (
+                    "duration_ms",
+                    models.FloatField(verbose_name="Макс. время, мс"),
+                ),
+                (
+                    "repeats",
+                    models.PositiveIntegerField(
+                        verbose_name="Макс. повторов за запрос"
+                    ),
+                ),
+                (
+                    "occurrences",
+                    models.PositiveIntegerField(
+                        default=1, verbose_name="Число запросов"
+                    ),
+                ),
+                (
+                    "plan",
+                    models.TextField(blank=True, verbose_name="План EXPLAIN"),
+                ),
+                (
+                    "first_seen",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Впервые"
+                    ),
+                ),
+                (
+                    "last_seen",
+                    models.DateTimeField(
+                        auto_now=True, verbose_name="Последний раз"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Медленный запрос",
+                "verbose_name_plural": "Медленные запросы",
+                "ordering": ["route", "-duration_ms"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("route", "kind", "fingerprint"),
+                        name="unique_slow_query",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,81 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0007_slowquery"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RequestProfile",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "method",
+                    models.CharField(max_length=10, verbose_name="Метод"),
+                ),
+                (
+                    "path",
+                    models.CharField(max_length=2000, verbose_name="Путь"),
+                ),
+                (
+                    "route",
+                    models.CharField(max_length=200, verbose_name="Маршрут"),
+                ),
+                (
+                    "status_code",
+                    models.PositiveSmallIntegerField(
+                        verbose_name="Статус ответа"
+                    ),
+                ),
+                ("duration_ms", models.FloatField(verbose_name="Время, мс")),
+                (
+                    "format",
+                    models.CharField(
+                        choices=[
+                            ("speedscope", "speedscope"),
+                            ("pstats", "pstats"),
+                        ],
+                        max_length=10,
+                        verbose_name="Формат",
+                    ),
+                ),
+                (
+                    "filename",
+                    models.CharField(max_length=255, verbose_name="Файл"),
+                ),
+                (
+                    "created",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Дата"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Сотрудник",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Профиль запроса",
+                "verbose_name_plural": "Профили запросов",
+                "ordering": ["-created"],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_relations(apps, schema_editor):
+    Recipe = apps.get_model("api", "Recipe")
+
+    def count_by_recipe(model_name):
+        model = apps.get_model("api", model_name)
+        return Coalesce(
+            Subquery(
+                model.objects.filter(recipe=OuterRef("pk"))
+                .order_by()
+                .values("recipe")
+                .annotate(total=Count("pk"))
+                .values("total"),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    Recipe.objects.update(
+        popularity=count_by_recipe("Favorite")
+        + count_by_recipe("ShoppingCart")
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0008_requestprofile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="popularity",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Популярность"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["-popularity", "-pub_date"],
+                name="recipe_popularity_idx",
+            ),
+        ),
+        migrations.RunPython(count_relations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0009_recipe_popularity"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrendDecay",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "decayed_at",
+                    models.DateTimeField(verbose_name="Дата затухания"),
+                ),
+            ],
+            options={
+                "verbose_name": "Затухание рейтингов",
+                "verbose_name_plural": "Затухание рейтингов",
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+TIMELINE_FANOUT_MAX_FOLLOWERS = 1000
+
+
+def count_followers(apps, schema_editor):
+    User = apps.get_model("api", "User")
+    Subscription = apps.get_model("api", "Subscription")
+    User.objects.update(
+        followers_count=Coalesce(
+            Subquery(
+                Subscription.objects.filter(author=OuterRef("pk"))
+                .order_by()
+                .values("author")
+                .annotate(total=Count("pk"))
+                .values("total"),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+    )
+    User.objects.filter(
+        followers_count__gt=TIMELINE_FANOUT_MAX_FOLLOWERS
+    ).update(is_celebrity=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0010_trenddecay"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="followers_count",
+            field=models.PositiveIntegerField(
+                default=0, editable=False, verbose_name="Число подписчиков"
+            ),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="is_celebrity",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                verbose_name="Лента собирается при чтении",
+            ),
+        ),
+        migrations.RunPython(count_followers, migrations.RunPython.noop),
+    ]
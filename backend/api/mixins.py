@@ -0,0 +1,119 @@
+import time
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from . import metrics
+
+SPARSE_ACTIONS = ("list", "retrieve", "me", "subscriptions")
+
+
+class SparseFieldsetsMixin:
+    """
+    Поддержка ?fields= и ?omit= во вьюсетах.
+    Набор полей считается один раз на запрос и кладется в контекст
+    сериализатора, чтобы по нему же можно было собрать queryset.
+    """
+
+    fields_query_param = "fields"
+    omit_query_param = "omit"
+    sparse_actions = SPARSE_ACTIONS
+
+    @staticmethod
+    def _split(value):
+        return {item.strip() for item in value.split(",") if item.strip()}
+
+    def get_sparse_fields(self):
+        """
+        Возвращает множество полей, которые нужно отдать,
+        или None, если клиент не ограничивал ответ.
+        """
+        if hasattr(self, "_sparse_fields"):
+            return self._sparse_fields
+
+        self._sparse_fields = None
+        params = self.request.query_params
+        fields = self._split(params.get(self.fields_query_param, ""))
+        omit = self._split(params.get(self.omit_query_param, ""))
+        if self.action not in self.sparse_actions or not (fields or omit):
+            return None
+
+        available = {
+            name
+            for name, field in self.get_serializer_class()().fields.items()
+            if not field.write_only
+        }
+        unknown = (fields | omit) - available
+        if unknown:
+            raise ValidationError(
+                {"fields": f"Неизвестные поля: {', '.join(sorted(unknown))}"}
+            )
+
+        self._sparse_fields = (fields or available) - omit
+        return self._sparse_fields
+
+    def wants_field(self, name):
+        fields = self.get_sparse_fields()
+        return fields is None or name in fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["sparse_fields"] = self.get_sparse_fields()
+        return context
+
+
+class SparseFieldsetsSerializerMixin:
+    """Убирает из сериализатора поля, не выбранные через ?fields=/?omit="""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        sparse_fields = self.context.get("sparse_fields")
+        if sparse_fields is None:
+            return
+        for name in set(self.fields) - sparse_fields:
+            self.fields.pop(name)
+
+
+class TimedSerializerMixin:
+    """
+    Время сериализации для Server-Timing и метрик запроса. Считается
+    только внешний to_representation: вложенные сериализаторы входят в
+    него, а у many=True время складывается по элементам
+    """
+
+    def to_representation(self, instance):
+        request_metrics = metrics.current.get()
+        if request_metrics is None or request_metrics.serializer_depth:
+            return super().to_representation(instance)
+        request_metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            request_metrics.serializer_depth -= 1
+            request_metrics.serializer_time += time.perf_counter() - started
+
+
+class SurrogateKeysMixin:
+    """
+    Помечает успешные ответы GET суррогатными ключами: по ним
+    AnonymousResponseCacheMiddleware кеширует и точечно сбрасывает ответы
+    """
+
+    def get_surrogate_keys(self, data):
+        """Множество ключей ответа или None, если ответ не кешируется"""
+        return None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if (
+            request.method == "GET"
+            and response.status_code == 200
+            and isinstance(response, Response)
+        ):
+            keys = self.get_surrogate_keys(response.data)
+            if keys is not None:
+                response.surrogate_keys = keys
+        return response
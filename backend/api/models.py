@@ -9,7 +9,10 @@ from .constants import (
     INGREDIENT_NAME_MAX_LENGTH,
     LAST_NAME_MAX_LENGTH,
     MEASUREMENT_UNIT_MAX_LENGTH,
+    PROFILE_PATH_MAX_LENGTH,
     RECIPE_NAME_MAX_LENGTH,
+    ROUTE_MAX_LENGTH,
+    SQL_LOCATION_MAX_LENGTH,
     TAG_NAME_MAX_LENGTH,
     TAG_SLUG_MAX_LENGTH,
     USERNAME_MAX_LENGTH,
@@ -45,6 +48,12 @@ class User(AbstractUser):
         blank=True,
         null=True,
     )
+    followers_count = models.PositiveIntegerField(
+        "Число подписчиков", default=0, editable=False
+    )
+    is_celebrity = models.BooleanField(
+        "Лента собирается при чтении", default=False, editable=False
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
@@ -132,6 +141,7 @@ class Recipe(models.Model):
     )
     tags = models.ManyToManyField(
         Tag,
+        through="RecipeTag",
         related_name="recipes",
         verbose_name="Теги рецепта",
     )
@@ -142,16 +152,64 @@ class Recipe(models.Model):
         verbose_name="Ингредиенты рецепта",
     )
     pub_date = models.DateTimeField("Дата публикации", auto_now_add=True)
+    # Сколько раз рецепт добавили в избранное и в списки покупок; ведут
+    # сигналы api.signals, пересчитывает api.trending.recount_popularity.
+    popularity = models.PositiveIntegerField(
+        "Популярность", default=0, editable=False
+    )
 
     class Meta:
         ordering = ["-pub_date"]
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            models.Index(fields=["-pub_date"], name="recipe_pub_date_idx"),
+            models.Index(
+                fields=["-popularity", "-pub_date"],
+                name="recipe_popularity_idx",
+            ),
+            models.Index(
+                fields=["cooking_time"], name="recipe_cooking_time_idx"
+            ),
+            models.Index(fields=["name"], name="recipe_name_idx"),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeTag(models.Model):
+    """Промежуточная модель для связи рецепта и тега"""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="recipe_tags",
+        verbose_name="Рецепт",
+    )
+    tag = models.ForeignKey(
+        Tag,
+        on_delete=models.CASCADE,
+        related_name="recipe_tags",
+        verbose_name="Тег",
+    )
+
+    class Meta:
+        db_table = "api_recipe_tags"
+        verbose_name = "Тег рецепта"
+        verbose_name_plural = "Теги рецепта"
+        # Совпадает с ограничением бывшей автоматической M2M-таблицы
+        unique_together = ("recipe", "tag")
+        indexes = [
+            models.Index(
+                fields=["tag", "recipe"], name="recipe_tag_tag_recipe_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} - {self.tag}"
+
+
 class RecipeIngredient(models.Model):
     """Промежуточная модель для связи рецепта и ингредиента"""
 
@@ -184,6 +242,12 @@ class RecipeIngredient(models.Model):
                 name="unique_recipe_ingredient",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["ingredient", "recipe"],
+                name="recipe_ingr_ingr_recipe_idx",
+            )
+        ]
 
     def __str__(self):
         return f"{self.ingredient.name} - {self.amount}"
@@ -291,3 +355,203 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f"{self.user} - {self.recipe}"
+
+
+class RecipeTrend(models.Model):
+    """Рейтинг популярности рецепта с затуханием по времени"""
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="trend",
+        verbose_name="Рецепт",
+    )
+    score = models.FloatField("Рейтинг", default=0)
+    updated = models.DateTimeField("Дата обновления", auto_now=True)
+
+    class Meta:
+        ordering = ["-score"]
+        verbose_name = "Рейтинг рецепта"
+        verbose_name_plural = "Рейтинги рецептов"
+        indexes = [
+            models.Index(fields=["-score"], name="recipe_trend_score_idx")
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} - {self.score:.2f}"
+
+
+class TrendDecay(models.Model):
+    """
+    Момент последнего затухания рейтингов трендов (одна строка).
+    Рейтинги хранятся приведенными к этому моменту
+    """
+
+    decayed_at = models.DateTimeField("Дата затухания")
+
+    class Meta:
+        verbose_name = "Затухание рейтингов"
+        verbose_name_plural = "Затухание рейтингов"
+
+    def __str__(self):
+        return f"{self.decayed_at:%Y-%m-%d %H:%M}"
+
+
+class TimelineEntry(models.Model):
+    """Рецепт в ленте подписок пользователя (fan-out при публикации)"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline",
+        verbose_name="Подписчик",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+        verbose_name="Рецепт",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Автор",
+    )
+    pub_date = models.DateTimeField("Дата публикации")
+
+    class Meta:
+        ordering = ["-pub_date", "-recipe"]
+        verbose_name = "Запись ленты"
+        verbose_name_plural = "Лента подписок"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="unique_timeline_entry",
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"],
+                name="timeline_user_pub_date_idx",
+            ),
+            models.Index(
+                fields=["user", "author"], name="timeline_user_author_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.recipe}"
+
+
+class ChangeLogEntry(models.Model):
+    """Журнал изменений для дельта-синхронизации клиентов"""
+
+    class Kind(models.TextChoices):
+        RECIPE = "recipe", "Рецепт"
+        FAVORITE = "favorite", "Избранное"
+        SHOPPING_CART = "shopping_cart", "Список покупок"
+        SUBSCRIPTION = "subscription", "Подписка"
+
+    class Action(models.TextChoices):
+        CREATED = "created", "Создание"
+        UPDATED = "updated", "Изменение"
+        DELETED = "deleted", "Удаление"
+
+    kind = models.CharField("Тип объекта", max_length=20, choices=Kind.choices)
+    action = models.CharField(
+        "Действие", max_length=10, choices=Action.choices
+    )
+    object_id = models.BigIntegerField("id объекта")
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Пользователь",
+    )
+    created = models.DateTimeField("Дата изменения", auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Запись журнала изменений"
+        verbose_name_plural = "Журнал изменений"
+        indexes = [
+            models.Index(fields=["user", "id"], name="changelog_user_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} {self.action}"
+
+
+class SlowQuery(models.Model):
+    """
+    Медленный или повторяющийся SQL-запрос, сгруппированный по маршруту,
+    типу и нормализованному тексту
+    """
+
+    class Kind(models.TextChoices):
+        SLOW = "slow", "Медленный"
+        REPEATED = "repeated", "Повторяющийся"
+
+    route = models.CharField("Маршрут", max_length=ROUTE_MAX_LENGTH)
+    kind = models.CharField("Тип", max_length=10, choices=Kind.choices)
+    fingerprint = models.CharField("Отпечаток", max_length=40)
+    sql = models.TextField("SQL")
+    location = models.CharField(
+        "Место вызова", max_length=SQL_LOCATION_MAX_LENGTH, blank=True
+    )
+    duration_ms = models.FloatField("Макс. время, мс")
+    repeats = models.PositiveIntegerField("Макс. повторов за запрос")
+    occurrences = models.PositiveIntegerField("Число запросов", default=1)
+    plan = models.TextField("План EXPLAIN", blank=True)
+    first_seen = models.DateTimeField("Впервые", auto_now_add=True)
+    last_seen = models.DateTimeField("Последний раз", auto_now=True)
+
+    class Meta:
+        ordering = ["route", "-duration_ms"]
+        verbose_name = "Медленный запрос"
+        verbose_name_plural = "Медленные запросы"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["route", "kind", "fingerprint"],
+                name="unique_slow_query",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.route}: {self.sql[:50]}"
+
+
+class RequestProfile(models.Model):
+    """Профиль запроса, снятый по запросу сотрудника"""
+
+    class Format(models.TextChoices):
+        SPEEDSCOPE = "speedscope", "speedscope"
+        PSTATS = "pstats", "pstats"
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="+",
+        verbose_name="Сотрудник",
+    )
+    method = models.CharField("Метод", max_length=10)
+    path = models.CharField("Путь", max_length=PROFILE_PATH_MAX_LENGTH)
+    route = models.CharField("Маршрут", max_length=ROUTE_MAX_LENGTH)
+    status_code = models.PositiveSmallIntegerField("Статус ответа")
+    duration_ms = models.FloatField("Время, мс")
+    format = models.CharField("Формат", max_length=10, choices=Format.choices)
+    filename = models.CharField("Файл", max_length=255)
+    created = models.DateTimeField("Дата", auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created"]
+        verbose_name = "Профиль запроса"
+        verbose_name_plural = "Профили запросов"
+
+    def __str__(self):
+        return f"{self.method} {self.path}"
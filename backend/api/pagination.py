@@ -1,6 +1,86 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+from datetime import datetime
+
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .constants import TIMELINE_PAGE_SIZE_MAX
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = "limit"
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset для async-вьюх: count и страница — async ORM"""
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(
+                self.invalid_page_message.format(
+                    page_number=page_number, message=str(exc)
+                )
+            )
+        self.page.object_list = [obj async for obj in self.page.object_list]
+        self.request = request
+        return self.page.object_list
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset-пагинация по паре (pub_date, id): курсор хранит позицию
+    последнего элемента страницы, поэтому следующая страница читается
+    диапазонным сканом по индексу без OFFSET
+    """
+
+    page_size = CustomPagination.page_size
+    page_size_query_param = "limit"
+    max_page_size = TIMELINE_PAGE_SIZE_MAX
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Неверный курсор."
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, pk = (
+                base64.urlsafe_b64decode(encoded.encode()).decode().split("|")
+            )
+            return datetime.fromisoformat(pub_date), int(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def encode_cursor(position):
+        pub_date, pk = position
+        return base64.urlsafe_b64encode(
+            f"{pub_date.isoformat()}|{pk}".encode()
+        ).decode()
+
+    def get_paginated_response(self, request, data, next_position):
+        next_link = None
+        if next_position is not None:
+            next_link = replace_query_param(
+                request.build_absolute_uri(),
+                self.cursor_query_param,
+                self.encode_cursor(next_position),
+            )
+        return Response({"next": next_link, "results": data})
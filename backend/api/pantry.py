@@ -0,0 +1,282 @@
+import logging
+import threading
+
+import numpy as np
+from django.core.cache import cache
+from django.db import connections
+
+from .constants import PANTRY_DELTA_TIMEOUT, PANTRY_MAX_DELTAS
+from .models import RecipeIngredient
+
+logger = logging.getLogger(__name__)
+
+PANTRY_GENERATION_KEY = "pantry:generation"
+PANTRY_DELTA_KEY = "pantry:delta:{}"
+CAPACITY_STEP = 1024
+STATE = (
+    "capacity",
+    "recipe_ids",
+    "sizes",
+    "bitsets",
+    "positions",
+    "recipe_ingredients",
+    "free_positions",
+    "next_position",
+)
+
+
+class PantryIndex:
+    """
+    Инвертированный индекс ингредиент -> битсет рецептов.
+    Рецепт занимает позицию в битсетах; покрытие кладовой считается
+    сложением распакованных битсетов ингредиентов из кладовой.
+
+    Индекс живет в памяти процесса. Изменение рецепта получает номер
+    поколения из общего счетчика в кеше и публикуется там же как
+    дельта (рецепт и его ингредиенты). Процесс, отставший от счетчика,
+    применяет чужие дельты при следующем запросе, без чтения БД. Если
+    дельты не хватает (вытеснена, кеш сброшен, invalidate()), индекс
+    перестраивается в фоновом потоке, а запросы до конца перестройки
+    отвечают по прежнему индексу.
+
+    Процессы видят изменения друг друга только через общий кеш (Redis,
+    см. CACHES): с локальным LocMemCache каждый процесс знает лишь о
+    своих изменениях.
+    """
+
+    # Перестраивать индекс в фоне; False — в запросе (для тестов).
+    background_rebuild = True
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._generation = None
+        self._rebuild_thread = None
+        self._reset()
+
+    def _reset(self):
+        self.capacity = 0
+        self.recipe_ids = np.zeros(0, dtype=np.int64)
+        self.sizes = np.zeros(0, dtype=np.uint16)
+        self.bitsets = {}
+        self.positions = {}
+        self.recipe_ingredients = {}
+        self.free_positions = []
+        self.next_position = 0
+
+    def _grow(self, capacity):
+        capacity = -(-capacity // CAPACITY_STEP) * CAPACITY_STEP
+        extra = capacity - self.capacity
+        self.recipe_ids = np.concatenate(
+            [self.recipe_ids, np.zeros(extra, dtype=np.int64)]
+        )
+        self.sizes = np.concatenate(
+            [self.sizes, np.zeros(extra, dtype=np.uint16)]
+        )
+        for ingredient_id, bitset in self.bitsets.items():
+            self.bitsets[ingredient_id] = np.concatenate(
+                [bitset, np.zeros(extra // 8, dtype=np.uint8)]
+            )
+        self.capacity = capacity
+
+    def _bitset(self, ingredient_id):
+        bitset = self.bitsets.get(ingredient_id)
+        if bitset is None:
+            bitset = np.zeros(self.capacity // 8, dtype=np.uint8)
+            self.bitsets[ingredient_id] = bitset
+        return bitset
+
+    def _position(self, recipe_id):
+        position = self.positions.get(recipe_id)
+        if position is not None:
+            return position
+        if self.free_positions:
+            position = self.free_positions.pop()
+        else:
+            position = self.next_position
+            self.next_position += 1
+            if position >= self.capacity:
+                self._grow(position + 1)
+        self.positions[recipe_id] = position
+        self.recipe_ids[position] = recipe_id
+        return position
+
+    def _set_bits(self, position, ingredient_ids, value):
+        byte, mask = position // 8, np.uint8(0x80 >> (position % 8))
+        for ingredient_id in ingredient_ids:
+            bitset = self._bitset(ingredient_id)
+            if value:
+                bitset[byte] |= mask
+            else:
+                bitset[byte] &= ~mask
+
+    def _apply(self, recipe_id, ingredient_ids):
+        position = self._position(recipe_id)
+        old = self.recipe_ingredients.get(recipe_id, frozenset())
+        new = frozenset(ingredient_ids)
+        self._set_bits(position, old - new, False)
+        self._set_bits(position, new - old, True)
+        self.recipe_ingredients[recipe_id] = new
+        self.sizes[position] = len(new)
+
+    def _remove(self, recipe_id):
+        position = self.positions.pop(recipe_id, None)
+        if position is None:
+            return
+        self._set_bits(position, self.recipe_ingredients.pop(recipe_id), False)
+        self.sizes[position] = 0
+        self.recipe_ids[position] = 0
+        self.free_positions.append(position)
+
+    @staticmethod
+    def _current_generation():
+        generation = cache.get(PANTRY_GENERATION_KEY)
+        if generation is None:
+            cache.add(PANTRY_GENERATION_KEY, 0, timeout=None)
+            generation = cache.get(PANTRY_GENERATION_KEY)
+        return generation
+
+    @staticmethod
+    def _publish(recipe_id, ingredient_ids):
+        """
+        Дельта поколения: (рецепт, ингредиенты), (рецепт, None) при
+        удалении или (None, None) — перестроить индекс целиком
+        """
+        try:
+            generation = cache.incr(PANTRY_GENERATION_KEY)
+        except ValueError:
+            cache.add(PANTRY_GENERATION_KEY, 0, timeout=None)
+            generation = cache.incr(PANTRY_GENERATION_KEY)
+        cache.set(
+            PANTRY_DELTA_KEY.format(generation),
+            (recipe_id, ingredient_ids),
+            PANTRY_DELTA_TIMEOUT,
+        )
+
+    def rebuild(self):
+        """
+        Строит индекс по БД рядом с текущим и подменяет его; дельты,
+        опубликованные во время сборки, применяются после подмены
+        """
+        with self._build_lock:
+            generation = self._current_generation()
+            rows = RecipeIngredient.objects.order_by().values_list(
+                "recipe_id", "ingredient_id"
+            )
+            by_recipe = {}
+            for recipe_id, ingredient_id in rows.iterator(chunk_size=10000):
+                by_recipe.setdefault(recipe_id, []).append(ingredient_id)
+
+            fresh = PantryIndex()
+            fresh._grow(max(len(by_recipe), 1))
+            for recipe_id, ingredient_ids in by_recipe.items():
+                fresh._apply(recipe_id, ingredient_ids)
+            with self._lock:
+                for name in STATE:
+                    setattr(self, name, getattr(fresh, name))
+                self._generation = generation
+                self._catch_up(self._current_generation())
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception("Pantry index rebuild failed")
+        finally:
+            connections.close_all()
+
+    def _schedule_rebuild(self):
+        if not self.background_rebuild:
+            self.rebuild()
+            return
+        with self._lock:
+            if self._rebuild_thread and self._rebuild_thread.is_alive():
+                return
+            self._rebuild_thread = threading.Thread(
+                target=self._rebuild_in_background,
+                name="pantry-rebuild",
+                daemon=True,
+            )
+            self._rebuild_thread.start()
+
+    def _catch_up(self, current):
+        """
+        Применяет дельты до поколения current. Возвращает False, если
+        их не хватает и индекс нужно перестроить
+        """
+        if current < self._generation:
+            return False
+        if current - self._generation > PANTRY_MAX_DELTAS:
+            return False
+        generations = range(self._generation + 1, current + 1)
+        deltas = cache.get_many(
+            [PANTRY_DELTA_KEY.format(number) for number in generations]
+        )
+        for number in generations:
+            recipe_id, ingredient_ids = deltas.get(
+                PANTRY_DELTA_KEY.format(number), (None, None)
+            )
+            if recipe_id is None:
+                return False
+            if ingredient_ids is None:
+                self._remove(recipe_id)
+            else:
+                self._apply(recipe_id, ingredient_ids)
+            self._generation = number
+        return True
+
+    def invalidate(self):
+        """Все процессы перестроят индекс — после загрузки в обход сигналов"""
+        self._publish(None, None)
+
+    def ensure_fresh(self):
+        if self._generation is None:
+            # Первая сборка: отвечать пока не по чему.
+            self.rebuild()
+            return
+        current = self._current_generation()
+        if current == self._generation:
+            return
+        with self._lock:
+            fresh = self._catch_up(current)
+        if not fresh:
+            self._schedule_rebuild()
+
+    def update_recipe(self, recipe_id, ingredient_ids):
+        self._publish(recipe_id, list(ingredient_ids))
+
+    def remove_recipe(self, recipe_id):
+        self._publish(recipe_id, None)
+
+    def match(self, ingredient_ids, max_missing=0):
+        """
+        Возвращает список (recipe_id, matched, missing), где рецепту
+        не хватает не больше max_missing ингредиентов, по убыванию доли
+        покрытия, затем по возрастанию числа недостающих и от новых
+        рецептов к старым
+        """
+        self.ensure_fresh()
+        with self._lock:
+            counts = np.zeros(self.capacity, dtype=np.uint16)
+            for ingredient_id in set(ingredient_ids):
+                bitset = self.bitsets.get(ingredient_id)
+                if bitset is not None:
+                    counts += np.unpackbits(bitset)
+            sizes = self.sizes.copy()
+            recipe_ids = self.recipe_ids.copy()
+
+        missing = sizes.astype(np.int32) - counts
+        candidates = np.flatnonzero((counts > 0) & (missing <= max_missing))
+        coverage = counts[candidates] / sizes[candidates]
+        ranked = candidates[
+            np.lexsort(
+                (-recipe_ids[candidates], missing[candidates], -coverage)
+            )
+        ]
+        return [
+            (int(recipe_ids[pos]), int(counts[pos]), int(missing[pos]))
+            for pos in ranked
+        ]
+
+
+pantry_index = PantryIndex()
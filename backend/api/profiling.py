@@ -0,0 +1,162 @@
+import os
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+from pyinstrument import Profiler
+from pyinstrument.renderers import PstatsRenderer, SpeedscopeRenderer
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_key
+from .constants import (
+    PROFILER_RATE_WINDOW_SECONDS,
+    PROFILER_SLOT_TIMEOUT_SECONDS,
+)
+from .metrics import route_name
+from .models import RequestProfile
+
+HEADER = "X-Profile"
+QUERY_PARAM = "profile"
+RATE_PREFIX = "profiler:rate:"
+SLOT_PREFIX = "profiler:slot:"
+EXTENSIONS = {
+    RequestProfile.Format.SPEEDSCOPE: ".speedscope.json",
+    RequestProfile.Format.PSTATS: ".pstats",
+}
+RENDERERS = {
+    RequestProfile.Format.SPEEDSCOPE: SpeedscopeRenderer,
+    RequestProfile.Format.PSTATS: PstatsRenderer,
+}
+
+
+class ProfilerBusy(Exception):
+    """Исчерпан лимит профилей или заняты все места"""
+
+
+def has_credentials(request):
+    """
+    Токен в Authorization или cookie сессии: без них запрос точно не от
+    сотрудника, и искать пользователя в БД незачем
+    """
+    return (
+        token_key(request) is not None
+        or settings.SESSION_COOKIE_NAME in request.COOKIES
+    )
+
+
+def requested_format(request):
+    """
+    Формат из заголовка X-Profile или параметра ?profile=: pstats,
+    speedscope, любое другое непустое значение — speedscope. У запросов
+    без учетных данных флаг не учитывается
+    """
+    if not settings.PROFILER_ENABLED:
+        return None
+    value = request.headers.get(HEADER) or request.GET.get(QUERY_PARAM)
+    if not value or not has_credentials(request):
+        return None
+    if value in RequestProfile.Format.values:
+        return RequestProfile.Format(value)
+    return RequestProfile.Format.SPEEDSCOPE
+
+
+def staff_user(request):
+    """Сотрудник по токену или сессии, иначе None"""
+    key = token_key(request)
+    if key is not None:
+        token = Token.objects.select_related("user").filter(key=key).first()
+        user = token.user if token is not None else None
+    else:
+        user = get_user(request)
+    if user is not None and user.is_active and user.is_staff:
+        return user
+    return None
+
+
+def _within_rate_limit():
+    window = int(time.time() // PROFILER_RATE_WINDOW_SECONDS)
+    key = f"{RATE_PREFIX}{window}"
+    cache.add(key, 0, PROFILER_RATE_WINDOW_SECONDS * 2)
+    try:
+        return cache.incr(key) <= settings.PROFILER_RATE_LIMIT
+    except ValueError:
+        return False
+
+
+def _acquire_slot():
+    """
+    Одно из PROFILER_MAX_CONCURRENT мест в общем кеше. Место само
+    освобождается через PROFILER_SLOT_TIMEOUT_SECONDS, если процесс упал
+    """
+    for slot in range(settings.PROFILER_MAX_CONCURRENT):
+        key = f"{SLOT_PREFIX}{slot}"
+        if cache.add(key, True, PROFILER_SLOT_TIMEOUT_SECONDS):
+            return key
+    return None
+
+
+def admit(request):
+    """
+    Разрешение профилировать запрос: (сотрудник, место) или None, если
+    запрос не от сотрудника — тогда он выполняется как обычно
+    """
+    user = staff_user(request)
+    if user is None:
+        return None
+    if not _within_rate_limit():
+        raise ProfilerBusy("Превышен лимит профилируемых запросов.")
+    slot = _acquire_slot()
+    if slot is None:
+        raise ProfilerBusy("Все места профилировщика заняты.")
+    return user, slot
+
+
+def release(slot):
+    cache.delete(slot)
+
+
+def runs_in_event_loop(request):
+    """
+    Под ASGI GET к асинхронной вьюхе выполняется в event loop, остальное —
+    в потоке синхронных вьюх запроса; профилировщик запускается там же
+    """
+    if request.method != "GET":
+        return False
+    try:
+        return iscoroutinefunction(resolve(request.path_info).func)
+    except Resolver404:
+        return False
+
+
+def new_profiler():
+    return Profiler(interval=settings.PROFILER_INTERVAL)
+
+
+def profile_path(profile):
+    return os.path.join(settings.PROFILER_DIR, profile.filename)
+
+
+def save(profiler, profile_format, user, request, response, duration):
+    """Сохраняет профиль в PROFILER_DIR и запись о нем"""
+    output = RENDERERS[profile_format]().render(profiler.last_session)
+    filename = uuid.uuid4().hex + EXTENSIONS[profile_format]
+    os.makedirs(settings.PROFILER_DIR, exist_ok=True)
+    with open(os.path.join(settings.PROFILER_DIR, filename), "wb") as file:
+        # pstats — двоичный marshal, упакованный рендерером в str.
+        file.write(output.encode("utf-8", "surrogateescape"))
+    return RequestProfile.objects.create(
+        user=user,
+        method=request.method,
+        path=request.get_full_path()[
+            : RequestProfile._meta.get_field("path").max_length
+        ],
+        route=route_name(request),
+        status_code=response.status_code,
+        duration_ms=duration * 1000,
+        format=profile_format,
+        filename=filename,
+    )
@@ -0,0 +1,45 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Типы, которые orjson не знает (Decimal, timedelta, ленивые строки,
+# QuerySet, ...), приводятся так же, как в стандартном рендерере DRF.
+_default = JSONEncoder().default
+# Z для UTC и строковые ключи из чисел — как у json.dumps в DRF. Даты
+# и время orjson пишет в isoformat сам.
+OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS if orjson else 0
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer на orjson: тот же JSON, кроме записи чисел с плавающей
+    точкой (1.5e-7 вместо 1.5e-07) и NaN (null вместо ошибки). Без orjson,
+    с отступами (browsable API, Accept: application/json; indent=4),
+    ASCII-выводом и для данных, которые orjson не сериализует (целые
+    больше 64 бит), работает стандартный рендерер
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # U+2028 и U+2029 экранируются, как в JSONRenderer.
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                b"\xe2\x80\xa9", b"\\u2029"
+            )
+        return ret
@@ -0,0 +1,468 @@
+"""
+Нагрузочное воспроизведение postman-коллекции.
+
+Из коллекции берутся запросы, которые по ее тестам должны завершаться
+успешно (2xx). Каждый виртуальный пользователь один раз проходит
+регистрацию и получение токенов, затем повторяет остальные сценарии
+коллекции. Учетные данные уникальны для каждого виртуального
+пользователя, переменные ({{userToken}}, {{firstRecipeId}}, ...)
+заполняются из ответов так же, как это делают тесты коллекции
+"""
+
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+import requests
+
+SETUP_FLOW = "register_and_get_tokens"
+# Ожидаемый статус ответа из теста запроса.
+STATUS = re.compile(r"Статус-код ответа должен быть (\d{3})")
+# const userId = _.get(responseData, "id");
+ALIAS = re.compile(r"const (\w+) = _\.get\(responseData, [\"']([\w.]+)[\"']\)")
+# pm.collectionVariables.set("firstTagId", responseData[0].id);
+SETTER = re.compile(
+    r"pm\.collectionVariables\.set\(\s*[\"'](\w+)[\"']\s*,\s*(.+?)\)\s*;?$",
+    re.M,
+)
+EXPRESSION = re.compile(
+    r"responseData((?:\[\d+\]|\.\w+)*?)(?:\.slice\((\d+),\s*(\d+)\))?$"
+)
+PATH_PART = re.compile(r"\[(\d+)\]|\.(\w+)")
+VARIABLE = re.compile(r"{{(\w+)}}")
+# Переменные с учетными данными: у каждого виртуального пользователя
+# свои, иначе регистрация второго пользователя вернет 400.
+IDENTITY = re.compile(r"(?i)(username|email)$")
+ERROR_EXAMPLES = 3
+
+
+class ReplayError(Exception):
+    pass
+
+
+def _short_name(name):
+    return name.split("//")[0].strip()
+
+
+def _path(expression):
+    return tuple(
+        int(index) if index else key
+        for index, key in PATH_PART.findall(expression)
+    )
+
+
+def _captures(script):
+    """
+    Переменные, которые тест запроса сохраняет из ответа:
+    [(имя, путь в JSON, срез строки или None)]
+    """
+    aliases = {name: _path("." + path) for name, path in ALIAS.findall(script)}
+    captures = []
+    for variable, expression in SETTER.findall(script):
+        expression = expression.strip()
+        if expression in aliases:
+            captures.append((variable, aliases[expression], None))
+            continue
+        match = EXPRESSION.match(expression)
+        if match is None:
+            raise ReplayError(
+                f"Unsupported expression for {variable}: {expression}"
+            )
+        path, start, stop = match.groups()
+        part = (int(start), int(stop)) if start is not None else None
+        captures.append((variable, _path(path), part))
+    return captures
+
+
+class Step:
+    """Запрос коллекции с шаблонами {{переменных}}"""
+
+    def __init__(self, flow, item, auth):
+        request = item["request"]
+        url = request["url"]
+        self.flow = flow
+        self.name = f"{flow}/{_short_name(item['name'])}"
+        self.method = request["method"]
+        self.url = url["raw"] if isinstance(url, dict) else url
+        self.headers = [
+            (header["key"], header["value"])
+            for header in request.get("header", [])
+            if not header.get("disabled")
+        ]
+        if auth and auth["type"] == "apikey":
+            fields = {field["key"]: field["value"] for field in auth["apikey"]}
+            self.headers.append((fields["key"], fields["value"]))
+        body = request.get("body") or {}
+        self.body = body.get("raw") or None
+        if self.body and not any(
+            key.lower() == "content-type" for key, _ in self.headers
+        ):
+            self.headers.append(("Content-Type", "application/json"))
+        script = "\n".join(
+            "\n".join(event["script"]["exec"])
+            for event in item.get("event", [])
+            if event["listen"] == "test"
+        )
+        status = STATUS.search(script)
+        self.status = int(status.group(1)) if status else None
+        self.captures = _captures(script)
+
+    @property
+    def successful(self):
+        return self.status is None or self.status < 400
+
+    def ok(self, status):
+        if self.status is None:
+            return status < 400
+        return status == self.status
+
+    def variables(self):
+        templates = [self.url, self.body or ""]
+        templates.extend(value for _, value in self.headers)
+        return {
+            name
+            for template in templates
+            for name in VARIABLE.findall(template)
+        }
+
+
+def _walk(items, flow=None, auth=None):
+    for item in items:
+        # Postman: без auth запрос или папка наследуют его от родителя.
+        own = (
+            item["request"].get("auth")
+            if "request" in item
+            else item.get("auth")
+        )
+        current = auth if own is None else own
+        if "item" in item:
+            yield from _walk(
+                item["item"], flow or _short_name(item["name"]), current
+            )
+        else:
+            yield Step(flow or "", item, current)
+
+
+def load_collection(path):
+    """
+    Переменные коллекции и ее успешные запросы в порядке коллекции
+    """
+    with open(path, encoding="utf-8") as file:
+        collection = json.load(file)
+    variables = {
+        variable["key"]: variable.get("value", "")
+        for variable in collection.get("variable", [])
+    }
+    steps = [
+        step
+        for step in _walk(collection["item"], auth=collection.get("auth"))
+        if step.successful
+    ]
+    return variables, steps
+
+
+class Scenario:
+    """
+    Запросы регистрации (один раз) и повторяемые сценарии коллекции
+    """
+
+    def __init__(self, steps, variables, flows=None):
+        available = list(dict.fromkeys(step.flow for step in steps))
+        if SETUP_FLOW not in available:
+            raise ReplayError(f"Collection has no {SETUP_FLOW} folder")
+        flows = flows or [flow for flow in available if flow != SETUP_FLOW]
+        unknown = set(flows) - set(available)
+        if unknown:
+            raise ReplayError(
+                f"Unknown flows: {', '.join(sorted(unknown))}. "
+                f"Available: {', '.join(available)}"
+            )
+        self.flows = flows
+        self.setup = [step for step in steps if step.flow == SETUP_FLOW]
+        self.loop = [step for step in steps if step.flow in flows]
+        self._check(variables)
+
+    def _check(self, variables):
+        """
+        Каждая переменная должна задаваться до первого использования:
+        сценарий без рецептов не может добавлять их в избранное
+        """
+        defined = set(variables)
+        for step in self.setup + self.loop:
+            missing = step.variables() - defined
+            if missing:
+                raise ReplayError(
+                    f"{step.name} needs {', '.join(sorted(missing))}: "
+                    "add the flow that sets it"
+                )
+            defined.update(variable for variable, _, _ in step.captures)
+
+
+def render(template, variables):
+    def replace(match):
+        try:
+            return str(variables[match.group(1)])
+        except KeyError:
+            raise ReplayError(f"missing {{{{{match.group(1)}}}}}")
+
+    return VARIABLE.sub(replace, template)
+
+
+def identities(variables, tag):
+    """
+    Уникальные username и email: к значению добавляется метка
+    виртуального пользователя
+    """
+    unique = dict(variables)
+    for key, value in variables.items():
+        if not IDENTITY.search(key):
+            continue
+        try:
+            value = json.loads(value)
+        except ValueError:
+            continue
+        if isinstance(value, str):
+            unique[key] = json.dumps(f"{tag}-{value}")
+    return unique
+
+
+def extract(data, path, part):
+    for key in path:
+        data = data[key]
+    if part is not None:
+        data = str(data)[part[0] : part[1]]
+    return data
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    rank = max(math.ceil(share * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def _timings(values):
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {
+        f"p{share}_ms": round(percentile(values, share / 100) * 1000, 1)
+        for share in (50, 95, 99)
+    }
+
+
+class Stats:
+    """Задержки и ошибки по запросам коллекции, общие для потоков"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.steps = {}
+        self.counts = Counter()
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(Counter)
+        self.examples = defaultdict(list)
+        self.iterations = []
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, step, elapsed, error=None):
+        with self._lock:
+            self.steps.setdefault(step.name, step.method)
+            self.counts[step.name] += 1
+            if elapsed is not None:
+                self.timings[step.name].append(elapsed)
+            if error is not None:
+                kind, detail = error
+                self.errors[step.name][kind] += 1
+                if len(self.examples[step.name]) < ERROR_EXAMPLES:
+                    self.examples[step.name].append(detail)
+
+    def add_iteration(self, elapsed):
+        with self._lock:
+            self.iterations.append(elapsed)
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    def summary(self):
+        duration = (self.finished or time.perf_counter()) - self.started
+        steps = {}
+        for name, method in self.steps.items():
+            timings = self.timings[name]
+            errors = sum(self.errors[name].values())
+            count = self.counts[name]
+            steps[name] = {
+                "method": method,
+                "count": count,
+                "errors": errors,
+                "error_rate": round(errors / count, 4) if count else 0,
+                "throughput_rps": round(count / duration, 2),
+                **_timings(timings),
+                "max_ms": (round(max(timings) * 1000, 1) if timings else None),
+                "error_kinds": dict(self.errors[name]),
+                "error_examples": self.examples[name],
+            }
+        requests_count = sum(step["count"] for step in steps.values())
+        errors = sum(step["errors"] for step in steps.values())
+        everything = [
+            value for timings in self.timings.values() for value in timings
+        ]
+        return {
+            "duration_s": round(duration, 2),
+            "requests": requests_count,
+            "errors": errors,
+            "error_rate": (
+                round(errors / requests_count, 4) if requests_count else 0
+            ),
+            "throughput_rps": round(requests_count / duration, 2),
+            **_timings(everything),
+            "iterations": len(self.iterations),
+            "iteration_p50_ms": _timings(self.iterations)["p50_ms"],
+            "steps": steps,
+        }
+
+
+class VirtualUser:
+    """Поток с собственной сессией и копией переменных коллекции"""
+
+    def __init__(self, scenario, variables, base_url, stats, options):
+        self.scenario = scenario
+        self.variables = variables
+        self.variables["baseUrl"] = base_url
+        self.stats = stats
+        self.options = options
+        self.session = requests.Session()
+
+    def request(self, step):
+        try:
+            url = render(step.url, self.variables)
+            headers = {
+                key: render(value, self.variables)
+                for key, value in step.headers
+            }
+            body = render(step.body, self.variables) if step.body else None
+        except ReplayError as error:
+            self.stats.add(step, None, ("variable", str(error)))
+            return
+        started = time.perf_counter()
+        try:
+            response = self.session.request(
+                step.method,
+                url,
+                data=body.encode() if body else None,
+                headers=headers,
+                timeout=self.options["timeout"],
+            )
+        except requests.RequestException as error:
+            self.stats.add(
+                step,
+                time.perf_counter() - started,
+                (type(error).__name__, str(error)),
+            )
+            return
+        elapsed = time.perf_counter() - started
+        if not step.ok(response.status_code):
+            self.stats.add(
+                step,
+                elapsed,
+                (
+                    f"HTTP {response.status_code}",
+                    f"{step.method} {url}: {response.text[:200]}",
+                ),
+            )
+            return
+        error = None
+        if step.captures:
+            try:
+                data = response.json()
+                for variable, path, part in step.captures:
+                    self.variables[variable] = extract(data, path, part)
+            except (ValueError, LookupError, TypeError) as failure:
+                error = ("capture", f"{step.name}: {failure!r}")
+        self.stats.add(step, elapsed, error)
+
+    def replay(self, steps, stop):
+        for step in steps:
+            if stop.is_set():
+                return
+            self.request(step)
+            if self.options["think_time"]:
+                stop.wait(self.options["think_time"])
+
+    def run(self, stop, delay=0):
+        if stop.wait(delay):
+            return
+        self.replay(self.scenario.setup, stop)
+        deadline = self.options["deadline"]
+        iteration = 0
+        while not stop.is_set():
+            if deadline is None:
+                if iteration >= self.options["iterations"]:
+                    break
+            elif time.monotonic() >= deadline:
+                break
+            started = time.perf_counter()
+            self.replay(self.scenario.loop, stop)
+            self.stats.add_iteration(time.perf_counter() - started)
+            iteration += 1
+        self.session.close()
+
+
+def run_load(
+    scenario,
+    variables,
+    base_url,
+    users,
+    tag,
+    iterations=1,
+    duration=None,
+    ramp_up=0,
+    think_time=0,
+    timeout=30,
+    stop=None,
+):
+    """
+    Запускает users виртуальных пользователей и ждет их завершения.
+    duration (секунды) важнее iterations: пользователи повторяют
+    сценарии, пока не выйдет время. Метка tag делает учетные данные
+    уникальными между запусками
+    """
+    stop = stop or threading.Event()
+    stats = Stats()
+    options = {
+        "iterations": iterations,
+        "deadline": (
+            time.monotonic() + ramp_up + duration if duration else None
+        ),
+        "think_time": think_time,
+        "timeout": timeout,
+    }
+    threads = []
+    for number in range(users):
+        user = VirtualUser(
+            scenario,
+            identities(variables, f"{tag}-{number}"),
+            base_url.rstrip("/"),
+            stats,
+            options,
+        )
+        thread = threading.Thread(
+            target=user.run,
+            args=(stop, ramp_up * number / users),
+            name=f"virtual-user-{number}",
+            daemon=True,
+        )
+        thread.start()
+        threads.append(thread)
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.2)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    stats.finish()
+    return stats
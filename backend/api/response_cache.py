@@ -0,0 +1,185 @@
+import hashlib
+import math
+import random
+import re
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .constants import RESPONSE_CACHE_STALE_SECONDS, XFETCH_BETA
+
+ENTRY_PREFIX = "response:"
+VERSION_PREFIX = "surrogate:"
+CACHEABLE_PATH = re.compile(
+    r"^/(?:api/(?:recipes/(?:\d+/)?|tags/|ingredients/)|s/\d+/)$"
+)
+CACHEABLE_STATUSES = (200, 302)
+
+RECIPES_KEY = "recipes"
+RANKING_KEY = "recipes:ranking"
+TAGS_KEY = "tags"
+INGREDIENTS_KEY = "ingredients"
+
+
+def recipe_key(pk):
+    return f"recipe:{pk}"
+
+
+def user_key(pk):
+    return f"user:{pk}"
+
+
+def tag_key(pk):
+    return f"tag:{pk}"
+
+
+def ingredient_key(pk):
+    return f"ingredient:{pk}"
+
+
+def normalized_query(request):
+    """Параметры по алфавиту, пустые значения отброшены"""
+    return urlencode(
+        [
+            (name, value)
+            for name, values in sorted(request.GET.lists())
+            for value in values
+            if value != ""
+        ]
+    )
+
+
+def request_key(request):
+    """Ключ записи для анонимного GET или None, если запрос не кешируется"""
+    if (
+        not settings.RESPONSE_CACHE_TIMEOUT
+        or request.method != "GET"
+        or "Authorization" in request.headers
+        or not CACHEABLE_PATH.match(request.path_info)
+    ):
+        return None
+    raw = "|".join(
+        (
+            request.scheme,
+            request.get_host(),
+            request.path_info,
+            normalized_query(request),
+            request.headers.get("Accept", ""),
+        )
+    )
+    return ENTRY_PREFIX + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def purge(*keys):
+    """
+    Инвалидирует записи с этими суррогатными ключами. Версия ключа —
+    время очистки в наносекундах, поэтому ответ, который начали
+    собирать до очистки, не попадет в кеш
+    """
+    version = time.time_ns()
+    cache.set_many(
+        {VERSION_PREFIX + key: version for key in keys}, timeout=None
+    )
+
+
+def _versions(keys, default):
+    names = [VERSION_PREFIX + key for key in keys]
+    versions = cache.get_many(names)
+    for name in set(names) - set(versions):
+        cache.add(name, default, timeout=None)
+        versions[name] = cache.get(name, default)
+    return {name[len(VERSION_PREFIX) :]: versions[name] for name in names}
+
+
+def add_headers(response, keys):
+    patch_vary_headers(response, ("Accept", "Authorization"))
+    if settings.RESPONSE_CACHE_SURROGATE_HEADER:
+        response["Surrogate-Key"] = " ".join(sorted(keys))
+
+
+def is_purged(entry, versions):
+    """Какой-то из ключей записи сбросили после ее сохранения"""
+    return any(
+        versions.get(VERSION_PREFIX + name) != version
+        for name, version in entry["keys"].items()
+    )
+
+
+def is_fresh(entry):
+    """
+    Срок записи не вышел. Он проверяется по XFetch: чем дольше
+    собирался ответ и чем ближе истечение, тем вероятнее досрочное
+    обновление одним из запросов
+    """
+    early = -entry["delta"] * XFETCH_BETA * math.log(1 - random.random())
+    return time.time() + early < entry["expires"]
+
+
+def lookup(key):
+    """
+    Возвращает (запись, свежая ли она) или (None, False). Запись с
+    истекшим сроком еще можно отдать как STALE, пока ее пересобирают;
+    сброшенную запись — нельзя, она не возвращается вовсе
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return None, False
+    versions = cache.get_many(
+        [VERSION_PREFIX + name for name in entry["keys"]]
+    )
+    if is_purged(entry, versions):
+        return None, False
+    return entry, is_fresh(entry)
+
+
+def build(entry, status):
+    response = HttpResponse(entry["content"], status=entry["status"])
+    for header, value in entry["headers"]:
+        response[header] = value
+    response["X-Cache"] = status
+    return response
+
+
+def store(key, response, started):
+    """
+    Сохраняет ответ, если вьюха пометила его суррогатными ключами, и
+    возвращает запись. started — время начала запроса в наносекундах:
+    если какой-то ключ сбрасывали позже, ответ мог собраться из старых
+    данных и не кешируется
+    """
+    keys = getattr(response, "surrogate_keys", None)
+    if (
+        keys is None
+        or response.status_code not in CACHEABLE_STATUSES
+        or response.streaming
+        or response.cookies
+    ):
+        return None
+    add_headers(response, keys)
+    versions = _versions(keys, started)
+    response["X-Cache"] = "MISS"
+    if any(version > started for version in versions.values()):
+        return None
+    now = time.time()
+    entry = {
+        "status": response.status_code,
+        "content": response.content,
+        "headers": [
+            (header, value)
+            for header, value in response.items()
+            if header != "X-Cache"
+        ],
+        "keys": versions,
+        "delta": now - started / 1e9,
+        "expires": now + settings.RESPONSE_CACHE_TIMEOUT,
+    }
+    cache.set(
+        key,
+        entry,
+        settings.RESPONSE_CACHE_TIMEOUT + RESPONSE_CACHE_STALE_SECONDS,
+    )
+    return entry
@@ -1,8 +1,17 @@
+from collections.abc import Mapping
+from functools import partial
+
 from django.core.validators import MinValueValidator
 from django.db import transaction
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from .constants import (
+    BATCH_MAX_REQUESTS,
+    PANTRY_MAX_INGREDIENTS,
+    PANTRY_MAX_MISSING,
+)
+from .mixins import SparseFieldsetsSerializerMixin, TimedSerializerMixin
 from .models import (
     Favorite,
     Ingredient,
@@ -13,9 +22,11 @@ from .models import (
     Tag,
     User,
 )
+from .pantry import pantry_index
+from .timeline import fan_out_recipe
 
 
-class UserCreateSerializer(serializers.ModelSerializer):
+class UserCreateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для создания пользователя"""
 
     class Meta:
@@ -40,7 +51,11 @@ class UserCreateSerializer(serializers.ModelSerializer):
         return User.objects.create_user(**validated_data)
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(
+    SparseFieldsetsSerializerMixin,
+    TimedSerializerMixin,
+    serializers.ModelSerializer,
+):
     """Сериализатор для пользователя"""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -59,6 +74,8 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         request = self.context.get("request")
         return (
             request
@@ -69,7 +86,7 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
 
-class UserAvatarSerializer(serializers.ModelSerializer):
+class UserAvatarSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для аватара пользователя"""
 
     avatar = Base64ImageField(required=True)
@@ -97,20 +114,42 @@ class UserPasswordSerializer(serializers.Serializer):
         return instance
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Tag
         fields = ("id", "name", "slug")
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Ingredient
         fields = ("id", "name", "measurement_unit")
 
 
+def _as_list(value):
+    return value if isinstance(value, list) else []
+
+
+def _int_ids(values):
+    return [value for value in values if type(value) is int]
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Сначала ищет объект среди загруженных корневым сериализатором одной
+    выборкой (root.prefetched), а не отдельным запросом на каждый id
+    """
+
+    def to_internal_value(self, data):
+        prefetched = getattr(self.root, "prefetched", {})
+        objects = prefetched.get(self.get_queryset().model, {})
+        if type(data) is int and data in objects:
+            return objects[data]
+        return super().to_internal_value(data)
+
+
 class RecipeIngredientSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
+    id = PrefetchedPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(),
         source="ingredient",
     )
@@ -140,7 +179,11 @@ class RecipeIngredientReadSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "measurement_unit", "amount")
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(
+    SparseFieldsetsSerializerMixin,
+    TimedSerializerMixin,
+    serializers.ModelSerializer,
+):
     tags = TagSerializer(many=True, read_only=True)
     author = UserSerializer(read_only=True)
     ingredients = RecipeIngredientReadSerializer(
@@ -168,6 +211,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, "is_favorited"):
+            return obj.is_favorited
         request = self.context.get("request")
         return (
             request
@@ -176,6 +221,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, "is_in_shopping_cart"):
+            return obj.is_in_shopping_cart
         request = self.context.get("request")
         return (
             request
@@ -186,8 +233,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
 
-class RecipeWriteSerializer(serializers.ModelSerializer):
-    tags = serializers.PrimaryKeyRelatedField(
+class RecipeWriteSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    tags = PrefetchedPrimaryKeyRelatedField(
         many=True, queryset=Tag.objects.all()
     )
     author = UserSerializer(read_only=True)
@@ -211,6 +258,22 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ("author",)
 
+    def to_internal_value(self, data):
+        """Теги и ингредиенты из запроса загружаются двумя выборками"""
+        tag_ids, ingredient_ids = [], []
+        if isinstance(data, Mapping):
+            tag_ids = _as_list(data.get("tags"))
+            ingredient_ids = [
+                item.get("id")
+                for item in _as_list(data.get("ingredients"))
+                if isinstance(item, Mapping)
+            ]
+        self.prefetched = {
+            Tag: Tag.objects.in_bulk(_int_ids(tag_ids)),
+            Ingredient: Ingredient.objects.in_bulk(_int_ids(ingredient_ids)),
+        }
+        return super().to_internal_value(data)
+
     def validate_ingredients(self, value):
         if not value:
             raise serializers.ValidationError(
@@ -257,6 +320,13 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
                     for item in ingredients
                 ]
             )
+            transaction.on_commit(
+                partial(
+                    pantry_index.update_recipe,
+                    recipe.id,
+                    [item["ingredient"].id for item in ingredients],
+                )
+            )
 
     @transaction.atomic
     def create(self, validated_data):
@@ -269,6 +339,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         self._set_tags_ingredients(
             recipe, tags=tags_data, ingredients=ingredients_data
         )
+        fan_out_recipe(recipe)
         return recipe
 
     @transaction.atomic
@@ -283,7 +354,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return instance
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class RecipeShortSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сокращенный сериализатор для рецептов"""
 
     class Meta:
@@ -291,7 +362,11 @@ class RecipeShortSerializer(serializers.ModelSerializer):
         fields = ("id", "name", "image", "cooking_time")
 
 
-class SubscriptionSerializer(serializers.ModelSerializer):
+class SubscriptionSerializer(
+    SparseFieldsetsSerializerMixin,
+    TimedSerializerMixin,
+    serializers.ModelSerializer,
+):
     author = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.all(),
         write_only=True,
@@ -355,6 +430,11 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return True
 
     def get_recipes(self, obj):
+        if hasattr(obj.author, "limited_recipes"):
+            return RecipeShortSerializer(
+                obj.author.limited_recipes, many=True, context=self.context
+            ).data
+
         request = self.context.get("request")
         recipes_limit = (
             request.query_params.get("recipes_limit") if request else None
@@ -370,10 +450,14 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return RecipeShortSerializer(qs, many=True, context=self.context).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
         return obj.author.recipes.count()
 
 
-class FavoriteCreateSerializer(serializers.ModelSerializer):
+class FavoriteCreateSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     recipe = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all())
 
     class Meta:
@@ -396,7 +480,9 @@ class FavoriteCreateSerializer(serializers.ModelSerializer):
         return Favorite.objects.create(user=request.user, **validated_data)
 
 
-class ShoppingCartCreateSerializer(serializers.ModelSerializer):
+class ShoppingCartCreateSerializer(
+    TimedSerializerMixin, serializers.ModelSerializer
+):
     recipe = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all())
 
     class Meta:
@@ -417,3 +503,54 @@ class ShoppingCartCreateSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         request = self.context["request"]
         return ShoppingCart.objects.create(user=request.user, **validated_data)
+
+
+class BatchItemSerializer(serializers.Serializer):
+    """Один подзапрос пакетного запроса"""
+
+    id = serializers.CharField(required=False)
+    method = serializers.ChoiceField(
+        choices=("GET", "POST", "PUT", "PATCH", "DELETE"), default="GET"
+    )
+    url = serializers.CharField()
+    body = serializers.JSONField(required=False)
+
+
+class BatchSerializer(serializers.Serializer):
+    """Пакет подзапросов к API"""
+
+    requests = BatchItemSerializer(many=True, allow_empty=False)
+    parallel = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        if len(value) > BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f"Не больше {BATCH_MAX_REQUESTS} подзапросов в пакете."
+            )
+        return value
+
+
+class PantryQuerySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по содержимому кладовой"""
+
+    ingredients = serializers.CharField()
+    max_missing = serializers.IntegerField(
+        default=0, min_value=0, max_value=PANTRY_MAX_MISSING
+    )
+
+    def validate_ingredients(self, value):
+        try:
+            ingredient_ids = {
+                int(item) for item in value.split(",") if item.strip()
+            }
+        except ValueError:
+            raise serializers.ValidationError(
+                "id ингредиентов должны быть целыми числами."
+            )
+        if not ingredient_ids:
+            raise serializers.ValidationError("Укажите хотя бы один id.")
+        if len(ingredient_ids) > PANTRY_MAX_INGREDIENTS:
+            raise serializers.ValidationError(
+                f"Не больше {PANTRY_MAX_INGREDIENTS} ингредиентов."
+            )
+        return ingredient_ids
@@ -0,0 +1,183 @@
+import os
+from functools import partial
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import events, metrics, profiling, response_cache, slow_queries
+from .cache import invalidate_tag_cache
+from .models import (
+    ChangeLogEntry,
+    Favorite,
+    Ingredient,
+    Recipe,
+    RequestProfile,
+    ShoppingCart,
+    Subscription,
+    Tag,
+    User,
+)
+from .pantry import pantry_index
+from .sync import log_change
+from .timeline import bump_followers
+from .trending import bump_popularity, bump_score, relation_weight
+
+Kind = ChangeLogEntry.Kind
+Action = ChangeLogEntry.Action
+RELATION_KINDS = {
+    Favorite: Kind.FAVORITE,
+    ShoppingCart: Kind.SHOPPING_CART,
+}
+
+
+def publish_on_commit(event_type, **event):
+    transaction.on_commit(
+        partial(events.publish, {"type": event_type, **event})
+    )
+
+
+def purge_on_commit(*keys):
+    transaction.on_commit(partial(response_cache.purge, *keys))
+
+
+@receiver(connection_created)
+def install_query_wrappers(sender, connection, **kwargs):
+    for wrapper in (metrics.record_query, slow_queries.watch_query):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    invalidate_tag_cache()
+    # От набора тегов зависит и валидация фильтра ?tags= в ленте.
+    purge_on_commit(
+        response_cache.TAGS_KEY,
+        response_cache.RECIPES_KEY,
+        response_cache.tag_key(instance.pk),
+    )
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    purge_on_commit(
+        response_cache.INGREDIENTS_KEY,
+        response_cache.ingredient_key(instance.pk),
+    )
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    purge_on_commit(response_cache.user_key(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    purge_on_commit(
+        response_cache.RECIPES_KEY, response_cache.recipe_key(instance.pk)
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, **kwargs):
+    log_change(
+        Kind.RECIPE, Action.CREATED if created else Action.UPDATED, instance.pk
+    )
+    publish_on_commit(
+        events.RECIPE_CREATED if created else events.RECIPE_UPDATED,
+        recipe_id=instance.pk,
+        author_id=instance.author_id,
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    log_change(Kind.RECIPE, Action.DELETED, instance.pk)
+    transaction.on_commit(partial(pantry_index.remove_recipe, instance.pk))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def recipe_relation_created(sender, instance, created, **kwargs):
+    if created:
+        purge_on_commit(response_cache.RANKING_KEY)
+        bump_popularity(instance.recipe_id, 1)
+        bump_score(
+            instance.recipe_id, relation_weight(sender, instance.created)
+        )
+        log_change(
+            RELATION_KINDS[sender],
+            Action.CREATED,
+            instance.recipe_id,
+            instance.user_id,
+        )
+        if sender is ShoppingCart:
+            publish_on_commit(
+                events.SHOPPING_CART_CHANGED,
+                recipe_id=instance.recipe_id,
+                action="added",
+                user_id=instance.user_id,
+            )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def recipe_relation_deleted(sender, instance, **kwargs):
+    purge_on_commit(response_cache.RANKING_KEY)
+    bump_popularity(instance.recipe_id, -1)
+    bump_score(instance.recipe_id, -relation_weight(sender, instance.created))
+    log_change(
+        RELATION_KINDS[sender],
+        Action.DELETED,
+        instance.recipe_id,
+        instance.user_id,
+    )
+    if sender is ShoppingCart:
+        publish_on_commit(
+            events.SHOPPING_CART_CHANGED,
+            recipe_id=instance.recipe_id,
+            action="removed",
+            user_id=instance.user_id,
+        )
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_created(sender, instance, created, **kwargs):
+    if created:
+        bump_followers(instance.author_id, 1)
+        log_change(
+            Kind.SUBSCRIPTION,
+            Action.CREATED,
+            instance.author_id,
+            instance.user_id,
+        )
+        publish_on_commit(
+            events.SUBSCRIPTION_CHANGED,
+            author_id=instance.author_id,
+            action="added",
+            user_id=instance.user_id,
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    bump_followers(instance.author_id, -1)
+    log_change(
+        Kind.SUBSCRIPTION, Action.DELETED, instance.author_id, instance.user_id
+    )
+    publish_on_commit(
+        events.SUBSCRIPTION_CHANGED,
+        author_id=instance.author_id,
+        action="removed",
+        user_id=instance.user_id,
+    )
+
+
+@receiver(post_delete, sender=RequestProfile)
+def delete_profile_file(sender, instance, **kwargs):
+    try:
+        os.remove(profiling.profile_path(instance))
+    except FileNotFoundError:
+        pass
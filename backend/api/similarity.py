@@ -0,0 +1,301 @@
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .models import RecipeIngredient
+from .sync import needs_reset, recipe_changes, settled_cursor
+
+NUM_PERM = 64
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+MAX_HASH = np.uint32((1 << 31) - 1)
+SEED = 20240601
+RELOAD_CHECK_INTERVAL = 5
+
+_rng = np.random.default_rng(SEED)
+PERM_A = _rng.integers(1, int(MERSENNE_PRIME), NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.integers(0, int(MERSENNE_PRIME), NUM_PERM, dtype=np.uint64)
+BAND_MULTIPLIERS = _rng.integers(
+    1, np.iinfo(np.int64).max, ROWS, dtype=np.uint64
+) | np.uint64(1)
+
+FILES = (
+    "recipe_ids",
+    "signatures",
+    "band_hashes",
+    "band_order",
+)
+CURRENT_FILE = "CURRENT"
+META_FILE = "meta.json"
+# Сколько последних версий индекса хранится на диске: процесс, который
+# прочитал указатель перед заменой, успевает открыть свою версию.
+KEEP_VERSIONS = 3
+
+
+def index_dir():
+    return Path(settings.SIMILARITY_INDEX_DIR)
+
+
+def current_version(directory=None):
+    """Имя каталога текущей версии индекса или None"""
+    try:
+        return (directory or index_dir()).joinpath(CURRENT_FILE).read_text()
+    except FileNotFoundError:
+        return None
+
+
+def minhash(ingredient_ids):
+    """MinHash-сигнатура набора ингредиентов длиной NUM_PERM"""
+    if not ingredient_ids:
+        return np.full(NUM_PERM, MAX_HASH, dtype=np.uint32)
+    ids = np.fromiter(ingredient_ids, dtype=np.uint64)
+    hashed = (PERM_A[:, None] * ids[None, :] + PERM_B[:, None]) % (
+        MERSENNE_PRIME
+    )
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def band_hashes(signatures):
+    """Хеши полос LSH: массив формы (BANDS, число сигнатур)"""
+    bands = signatures.reshape(len(signatures), BANDS, ROWS).astype(np.uint64)
+    return (bands * BAND_MULTIPLIERS).sum(axis=2).T
+
+
+def load_recipe_ingredients(recipe_ids=None):
+    """Ингредиенты всех рецептов или только recipe_ids"""
+    by_recipe = {}
+    rows = RecipeIngredient.objects.order_by()
+    if recipe_ids is not None:
+        rows = rows.filter(recipe_id__in=recipe_ids)
+    for recipe_id, ingredient_id in rows.values_list(
+        "recipe_id", "ingredient_id"
+    ).iterator(chunk_size=10000):
+        by_recipe.setdefault(recipe_id, []).append(ingredient_id)
+    return by_recipe
+
+
+def _signatures(by_recipe):
+    recipe_ids = np.array(sorted(by_recipe), dtype=np.int64)
+    signatures = np.empty((len(recipe_ids), NUM_PERM), dtype=np.uint32)
+    for pos, recipe_id in enumerate(recipe_ids.tolist()):
+        signatures[pos] = minhash(by_recipe[recipe_id])
+    return recipe_ids, signatures
+
+
+def _full_arrays(by_recipe):
+    recipe_ids, signatures = _signatures(by_recipe)
+    hashes = band_hashes(signatures)
+    order = np.argsort(hashes, axis=1, kind="stable")
+    return {
+        "recipe_ids": recipe_ids,
+        "signatures": signatures,
+        "band_hashes": np.take_along_axis(hashes, order, axis=1),
+        "band_order": order.astype(np.int64),
+    }
+
+
+def _merged_arrays(old, changed, by_recipe):
+    """
+    Убирает из старого индекса рецепты changed и вставляет заново те из
+    них, что остались в by_recipe. Полосы не сортируются заново:
+    новые хеши вставляются в отсортированные массивы слиянием
+    """
+    old_ids = np.asarray(old["recipe_ids"])
+    keep = ~np.isin(old_ids, np.fromiter(changed, dtype=np.int64))
+    kept_ids = old_ids[keep]
+    added_ids, added_signatures = _signatures(by_recipe)
+
+    insert_at = np.searchsorted(kept_ids, added_ids)
+    added_positions = insert_at + np.arange(len(added_ids))
+    positions = np.full(len(old_ids), -1, dtype=np.int64)
+    positions[keep] = np.arange(len(kept_ids)) + np.searchsorted(
+        added_ids, kept_ids
+    )
+
+    added_hashes = band_hashes(added_signatures)
+    hashes = np.empty((BANDS, len(kept_ids) + len(added_ids)), np.uint64)
+    order = np.empty(hashes.shape, dtype=np.int64)
+    for band in range(BANDS):
+        old_order = np.asarray(old["band_order"][band])
+        kept = keep[old_order]
+        band_kept = np.asarray(old["band_hashes"][band])[kept]
+        added_order = np.argsort(added_hashes[band], kind="stable")
+        band_added = added_hashes[band][added_order]
+        at = np.searchsorted(band_kept, band_added, side="right")
+        hashes[band] = np.insert(band_kept, at, band_added)
+        order[band] = np.insert(
+            positions[old_order[kept]], at, added_positions[added_order]
+        )
+
+    return {
+        "recipe_ids": np.insert(kept_ids, insert_at, added_ids),
+        "signatures": np.insert(
+            np.asarray(old["signatures"])[keep],
+            insert_at,
+            added_signatures,
+            axis=0,
+        ),
+        "band_hashes": hashes,
+        "band_order": order,
+    }
+
+
+def _load_version(directory, version):
+    path = directory / version
+    arrays = {
+        name: np.load(path / f"{name}.npy", mmap_mode="r") for name in FILES
+    }
+    return arrays, json.loads((path / META_FILE).read_text())
+
+
+def _save_version(directory, arrays, meta):
+    """
+    Пишет массивы в новый каталог версии и атомарно переключает на него
+    указатель CURRENT: читатели видят либо старую, либо новую версию
+    целиком. Старые версии сверх KEEP_VERSIONS удаляются
+    """
+    version = f"v{time.time_ns()}"
+    staging = directory / f"{version}.tmp"
+    staging.mkdir()
+    for name, array in arrays.items():
+        np.save(staging / f"{name}.npy", array)
+    (staging / META_FILE).write_text(json.dumps(meta))
+    os.rename(staging, directory / version)
+
+    pointer = directory / f"{CURRENT_FILE}.{os.getpid()}.tmp"
+    pointer.write_text(version)
+    os.replace(pointer, directory / CURRENT_FILE)
+
+    versions = sorted(
+        path.name
+        for path in directory.glob("v*")
+        if path.is_dir() and not path.name.endswith(".tmp")
+    )
+    for name in versions[:-KEEP_VERSIONS]:
+        if name != version:
+            shutil.rmtree(directory / name, ignore_errors=True)
+
+
+def build_index(full=False):
+    """
+    Обновляет индекс по журналу изменений: пересчитываются только
+    рецепты, измененные после прошлой сборки, остальные строки и полосы
+    переносятся из текущей версии. Без текущей версии, с full=True или
+    если журнал уже очищен дальше курсора индекса, индекс строится
+    заново по всем рецептам. Рецепты, загруженные в обход сигналов
+    (generate_dataset), видит только полная сборка.
+    Возвращает (всего, пересчитано, удалено).
+    """
+    directory = index_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    version = None if full else current_version(directory)
+
+    if version is not None:
+        old, meta = _load_version(directory, version)
+        if not needs_reset(meta["cursor"]):
+            changed, cursor = recipe_changes(meta["cursor"])
+            by_recipe = load_recipe_ingredients(changed)
+            arrays = _merged_arrays(old, changed, by_recipe)
+            removed = (
+                len(old["recipe_ids"])
+                + len(by_recipe)
+                - len(arrays["recipe_ids"])
+            )
+            _save_version(directory, arrays, {"cursor": cursor})
+            return len(arrays["recipe_ids"]), len(by_recipe), removed
+
+    cursor = settled_cursor()
+    arrays = _full_arrays(load_recipe_ingredients())
+    _save_version(directory, arrays, {"cursor": cursor})
+    return len(arrays["recipe_ids"]), len(arrays["recipe_ids"]), 0
+
+
+class SimilarityIndex:
+    """
+    Индекс похожих рецептов на MinHash + LSH.
+    Массивы открываются через np.load(mmap_mode="r"), поэтому рабочие
+    процессы делят страницы файлов и не тратят время на загрузку.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._arrays = None
+        self._version = None
+        self._checked_at = 0.0
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._arrays is not None and (
+            now - self._checked_at < RELOAD_CHECK_INTERVAL
+        ):
+            return
+        with self._lock:
+            self._checked_at = now
+            version = current_version()
+            if version is None:
+                self._arrays = self._version = None
+                return
+            if version == self._version:
+                return
+            try:
+                self._arrays, _ = _load_version(index_dir(), version)
+            except FileNotFoundError:
+                # Версию уже заменили и удалили: прочитаем указатель
+                # при следующей проверке.
+                return
+            self._version = version
+
+    @staticmethod
+    def _signature(arrays, recipe_id):
+        recipe_ids = arrays["recipe_ids"]
+        pos = int(np.searchsorted(recipe_ids, recipe_id))
+        if pos < len(recipe_ids) and recipe_ids[pos] == recipe_id:
+            return np.asarray(arrays["signatures"][pos])
+        ingredient_ids = list(
+            RecipeIngredient.objects.filter(recipe_id=recipe_id).values_list(
+                "ingredient_id", flat=True
+            )
+        )
+        return minhash(ingredient_ids) if ingredient_ids else None
+
+    def similar(self, recipe_id, limit):
+        """
+        Возвращает до limit пар (recipe_id, оценка Жаккара) по убыванию
+        оценки. Рецепты вне индекса сравниваются по свежей сигнатуре.
+        """
+        self._maybe_reload()
+        arrays = self._arrays
+        if arrays is None:
+            return []
+        signature = self._signature(arrays, recipe_id)
+        if signature is None:
+            return []
+
+        query_hashes = band_hashes(signature[None, :])[:, 0]
+        candidates = []
+        for band in range(BANDS):
+            hashes = arrays["band_hashes"][band]
+            left = np.searchsorted(hashes, query_hashes[band], side="left")
+            right = np.searchsorted(hashes, query_hashes[band], side="right")
+            candidates.append(arrays["band_order"][band][left:right])
+        candidates = np.unique(np.concatenate(candidates))
+        candidates = candidates[arrays["recipe_ids"][candidates] != recipe_id]
+        if not candidates.size:
+            return []
+
+        scores = (arrays["signatures"][candidates] == signature).mean(axis=1)
+        best = np.argsort(-scores, kind="stable")[:limit]
+        return [
+            (int(arrays["recipe_ids"][candidates[i]]), float(scores[i]))
+            for i in best
+        ]
+
+
+similarity_index = SimilarityIndex()
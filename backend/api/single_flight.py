@@ -0,0 +1,55 @@
+import threading
+import uuid
+from concurrent.futures import Future
+
+from django.core.cache import cache
+
+from .constants import SINGLE_FLIGHT_LEASE_SECONDS
+
+LEASE_PREFIX = "lease:"
+
+
+def acquire_lease(key):
+    """
+    Короткая аренда ключа между процессами через cache.add.
+    Возвращает токен аренды или None, если ключ уже пересобирают
+    """
+    token = uuid.uuid4().hex
+    if cache.add(LEASE_PREFIX + key, token, SINGLE_FLIGHT_LEASE_SECONDS):
+        return token
+    return None
+
+
+def release_lease(key, token):
+    if cache.get(LEASE_PREFIX + key) == token:
+        cache.delete(LEASE_PREFIX + key)
+
+
+class LocalFlights:
+    """
+    Пересборки внутри процесса: первый запрос по ключу становится
+    лидером, остальные получают его Future. Future потокобезопасен, и
+    его можно ждать и из потока, и из event loop через wrap_future
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def join(self, key):
+        """Возвращает (лидер ли вызывающий, Future с результатом)"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return False, flight
+            flight = self._flights[key] = Future()
+            return True, flight
+
+    def finish(self, key, result):
+        with self._lock:
+            flight = self._flights.pop(key, None)
+        if flight is not None and not flight.done():
+            flight.set_result(result)
+
+
+local_flights = LocalFlights()
@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .constants import SLOW_QUERY_QUEUE_SIZE
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+# Запросы текущего запроса; None — запросы не отслеживаются.
+current = ContextVar("query_watch", default=None)
+
+# Находки, ждущие записи в фоновом потоке: EXPLAIN ANALYZE и запись в
+# SlowQuery не задерживают ответ.
+pending = queue.Queue(maxsize=SLOW_QUERY_QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+SKIP_FILES = frozenset(
+    os.path.join(APP_DIR, name)
+    for name in ("slow_queries.py", "metrics.py", "middleware.py")
+)
+
+IN_LIST = re.compile(r"\bIN \((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)", re.I)
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r"(?<![\w.\"])-?\d+(?:\.\d+)?\b")
+SPACES = re.compile(r"\s+")
+
+
+def normalize(sql):
+    """SQL без значений: литералы и списки IN схлопываются"""
+    sql = STRING.sub("?", sql)
+    sql = NUMBER.sub("?", sql)
+    sql = IN_LIST.sub("IN (...)", sql)
+    return SPACES.sub(" ", sql).strip()
+
+
+def caller():
+    """Ближайший к запросу кадр кода приложения: вьюха, сериализатор"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_DIR) and filename not in SKIP_FILES:
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f"{path}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return ""
+
+
+class QueryWatch:
+    """
+    Запросы одного HTTP-запроса. Повторы считаются по тексту SQL от
+    Django: у N+1 он одинаковый, меняются только параметры
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.times = {}
+        self.findings = {}
+
+    def flag(self, kind, sql, params, many, duration, alias):
+        finding = self.findings.get((kind, sql))
+        if finding is None:
+            self.findings[(kind, sql)] = {
+                "kind": kind,
+                "sql": sql,
+                "params": params,
+                "many": many,
+                "duration": duration,
+                "alias": alias,
+                "location": caller(),
+            }
+        elif duration > finding["duration"]:
+            finding.update(params=params, many=many, duration=duration)
+
+
+def watch_query(execute, sql, params, many, context):
+    """Обертка execute_wrappers: отмечает медленные и повторные запросы"""
+    watch = current.get()
+    if watch is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        count = watch.counts[sql] = watch.counts.get(sql, 0) + 1
+        watch.times[sql] = watch.times.get(sql, 0.0) + duration
+        alias = context["connection"].alias
+        if duration * 1000 >= settings.SLOW_QUERY_THRESHOLD_MS:
+            watch.flag(SlowQuery.Kind.SLOW, sql, params, many, duration, alias)
+        if count == settings.SLOW_QUERY_REPEAT_LIMIT + 1:
+            watch.flag(
+                SlowQuery.Kind.REPEATED, sql, params, many, duration, alias
+            )
+
+
+def explain(finding):
+    """
+    EXPLAIN (ANALYZE, BUFFERS) для доли медленных SELECT на PostgreSQL.
+    ANALYZE выполняет запрос повторно, поэтому выборка редкая
+    """
+    connection = connections[finding["alias"]]
+    if (
+        finding["kind"] != SlowQuery.Kind.SLOW
+        or finding["many"]
+        or connection.vendor != "postgresql"
+        or not finding["sql"].lstrip().upper().startswith("SELECT")
+        or random.random() >= settings.SLOW_QUERY_EXPLAIN_RATE
+    ):
+        return ""
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "EXPLAIN (ANALYZE, BUFFERS) " + finding["sql"],
+                    finding["params"],
+                )
+                return "\n".join(row[0] for row in cursor.fetchall())
+    except DatabaseError:
+        logger.exception("EXPLAIN не выполнен")
+        return ""
+
+
+def record(route, finding, plan):
+    """Добавляет находку к записи маршрута или создает новую"""
+    sql = normalize(finding["sql"])
+    lookup = {
+        "route": route[: SlowQuery._meta.get_field("route").max_length],
+        "kind": finding["kind"],
+        "fingerprint": hashlib.sha1(sql.encode()).hexdigest(),
+    }
+    duration_ms = finding["duration"] * 1000
+    location = finding["location"][
+        : SlowQuery._meta.get_field("location").max_length
+    ]
+    changes = {
+        "location": location,
+        "duration_ms": Greatest(F("duration_ms"), duration_ms),
+        "repeats": Greatest(F("repeats"), finding["repeats"]),
+        "occurrences": F("occurrences") + 1,
+    }
+    if plan:
+        changes["plan"] = plan
+    if SlowQuery.objects.filter(**lookup).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            SlowQuery.objects.create(
+                **lookup,
+                sql=sql,
+                location=location,
+                duration_ms=duration_ms,
+                repeats=finding["repeats"],
+                plan=plan,
+            )
+    except IntegrityError:
+        SlowQuery.objects.filter(**lookup).update(**changes)
+
+
+def write(route, findings):
+    """Пишет находки запроса в журнал и в SlowQuery"""
+    for finding in findings:
+        plan = explain(finding)
+        logger.warning(
+            "%s %s: %.1f ms, %d раз, %s\n%s%s",
+            route,
+            finding["kind"],
+            finding["duration"] * 1000,
+            finding["repeats"],
+            finding["location"] or "-",
+            normalize(finding["sql"]),
+            "\n" + plan if plan else "",
+        )
+        try:
+            record(route, finding, plan)
+        except DatabaseError:
+            logger.exception("Не удалось сохранить медленный запрос")
+
+
+def _write_pending():
+    while True:
+        route, findings = pending.get()
+        try:
+            write(route, findings)
+        except Exception:
+            logger.exception("Не удалось записать медленные запросы")
+        finally:
+            connections.close_all()
+            pending.task_done()
+
+
+def _start_writer():
+    """
+    Поток записи запускается при первой находке процесса: воркер
+    gunicorn после fork получает свой
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(
+                target=_write_pending, name="slow-queries", daemon=True
+            )
+            _writer.start()
+
+
+def flush(watch, route):
+    """
+    Отдает находки запроса фоновому потоку записи. Вызывается после
+    сброса current; при переполненной очереди находки отбрасываются
+    """
+    findings = list(watch.findings.values())
+    for finding in findings:
+        finding["repeats"] = watch.counts[finding["sql"]]
+        if finding["kind"] == SlowQuery.Kind.REPEATED:
+            finding["duration"] = watch.times[finding["sql"]]
+    _start_writer()
+    try:
+        pending.put_nowait((route, findings))
+    except queue.Full:
+        logger.error("Очередь медленных запросов переполнена: %s", route)
@@ -0,0 +1,157 @@
+from datetime import timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+from .constants import (
+    CHANGE_LOG_LOCK_ID,
+    SYNC_MAX_CHANGES,
+    SYNC_SAFETY_LAG_SECONDS,
+)
+from .models import ChangeLogEntry
+
+Kind = ChangeLogEntry.Kind
+Action = ChangeLogEntry.Action
+
+RELATION_SECTIONS = {
+    Kind.FAVORITE: "favorites",
+    Kind.SHOPPING_CART: "shopping_cart",
+    Kind.SUBSCRIPTION: "subscriptions",
+}
+
+
+def log_change(kind, action, object_id, user_id=None):
+    """
+    Пишет запись журнала. Курсор клиента — id записи, поэтому id должны
+    идти в порядке коммитов: иначе транзакция, получившая id раньше, а
+    закоммиченная позже, окажется ниже уже выданного курсора, и клиент
+    ее не увидит. На PostgreSQL транзакции с записями журнала
+    упорядочиваются блокировкой pg_advisory_xact_lock, которая держится
+    от первой записи до коммита; SQLite и так пишет по одной транзакции
+    за раз. Для остальных БД остается только задержка
+    SYNC_SAFETY_LAG_SECONDS, и она должна быть больше самой длинной
+    пишущей транзакции
+    """
+    alias = router.db_for_write(ChangeLogEntry)
+    connection = connections[alias]
+    if connection.vendor == "postgresql" and not connection.in_atomic_block:
+        # Вне транзакции блокировка отпустилась бы до вставки записи.
+        with transaction.atomic(using=alias):
+            log_change(kind, action, object_id, user_id)
+        return
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(%s)", [CHANGE_LOG_LOCK_ID]
+            )
+    ChangeLogEntry.objects.using(alias).create(
+        kind=kind, action=action, object_id=object_id, user_id=user_id
+    )
+
+
+def _visible_entries(user):
+    entries = ChangeLogEntry.objects.all()
+    if user.is_authenticated:
+        return entries.filter(Q(user__isnull=True) | Q(user=user))
+    return entries.filter(user__isnull=True)
+
+
+def current_cursor():
+    return ChangeLogEntry.objects.aggregate(cursor=Max("id"))["cursor"] or 0
+
+
+def settled_cursor():
+    """Курсор по записям старше SYNC_SAFETY_LAG_SECONDS"""
+    cutoff = timezone.now() - timedelta(seconds=SYNC_SAFETY_LAG_SECONDS)
+    return (
+        ChangeLogEntry.objects.filter(created__lte=cutoff).aggregate(
+            cursor=Max("id")
+        )["cursor"]
+        or 0
+    )
+
+
+def recipe_changes(since):
+    """
+    id рецептов, измененных после курсора since, и новый курсор.
+    Курсор не заходит в записи моложе SYNC_SAFETY_LAG_SECONDS: их
+    рецепты попадут и в следующую выборку
+    """
+    cutoff = timezone.now() - timedelta(seconds=SYNC_SAFETY_LAG_SECONDS)
+    rows = (
+        ChangeLogEntry.objects.filter(id__gt=since, kind=Kind.RECIPE)
+        .order_by("id")
+        .values_list("id", "object_id", "created")
+    )
+    recipe_ids, cursor, settled = set(), since, True
+    for entry_id, object_id, created in rows.iterator(chunk_size=10000):
+        recipe_ids.add(object_id)
+        settled = settled and created <= cutoff
+        if settled:
+            cursor = entry_id
+    return recipe_ids, cursor
+
+
+def needs_reset(since):
+    """Записи после курсора уже удалены из журнала — нужна полная загрузка"""
+    oldest = ChangeLogEntry.objects.aggregate(oldest=Min("id"))["oldest"]
+    return oldest is not None and oldest > since + 1
+
+
+def collect_changes(user, since):
+    """
+    Сворачивает записи журнала после курсора since в итоговое состояние
+    по каждому объекту. Самые свежие записи (моложе
+    SYNC_SAFETY_LAG_SECONDS) не отдаются: на БД, где id журнала не
+    упорядочены по коммитам (см. log_change), задержка не дает обогнать
+    транзакции, которые получили id раньше, а закоммитились позже.
+    """
+    cutoff = timezone.now() - timedelta(seconds=SYNC_SAFETY_LAG_SECONDS)
+    rows = (
+        _visible_entries(user)
+        .filter(id__gt=since)
+        .order_by("id")
+        .values_list("id", "kind", "action", "object_id", "created")[
+            : SYNC_MAX_CHANGES + 1
+        ]
+    )
+
+    recipes = {}
+    relations = {kind: {} for kind in RELATION_SECTIONS}
+    cursor, processed, has_more = since, 0, False
+    for entry_id, kind, action, object_id, created in rows:
+        if created > cutoff:
+            break
+        if processed == SYNC_MAX_CHANGES:
+            has_more = True
+            break
+        if kind == Kind.RECIPE:
+            if action == Action.DELETED or recipes.get(object_id) is None:
+                recipes[object_id] = action
+        else:
+            relations[kind][object_id] = action
+        cursor, processed = entry_id, processed + 1
+
+    changes = {
+        "cursor": cursor,
+        "has_more": has_more,
+        "reset": False,
+        "recipes": {
+            action: sorted(
+                pk for pk, state in recipes.items() if state == action
+            )
+            for action in Action.values
+        },
+    }
+    for kind, section in RELATION_SECTIONS.items():
+        states = relations[kind]
+        changes[section] = {
+            "added": sorted(
+                pk for pk, state in states.items() if state != Action.DELETED
+            ),
+            "removed": sorted(
+                pk for pk, state in states.items() if state == Action.DELETED
+            ),
+        }
+    return changes
@@ -0,0 +1,150 @@
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce, Greatest
+
+from .constants import TIMELINE_BACKFILL_SIZE, TIMELINE_FANOUT_MAX_FOLLOWERS
+from .models import Recipe, Subscription, TimelineEntry, User
+
+
+def keyset_filter(position, date_field, id_field):
+    """Условие «строго после позиции» для сортировки (-date, -id)"""
+    if position is None:
+        return Q()
+    pub_date, pk = position
+    return Q(**{f"{date_field}__lt": pub_date}) | Q(
+        **{date_field: pub_date, f"{id_field}__lt": pk}
+    )
+
+
+def bump_followers(author_id, delta):
+    """
+    Меняет счетчик подписчиков автора одним UPDATE. Автор, у которого
+    подписчиков стало больше TIMELINE_FANOUT_MAX_FOLLOWERS, навсегда
+    переходит на сборку ленты при чтении: его рецептов нет в
+    TimelineEntry, и при отписках они не должны пропасть из лент
+    """
+    User.objects.filter(pk=author_id).update(
+        followers_count=Greatest(F("followers_count") + delta, Value(0)),
+        # В UPDATE справа видно прежнее значение счетчика.
+        is_celebrity=Case(
+            When(
+                followers_count__gte=TIMELINE_FANOUT_MAX_FOLLOWERS - delta + 1,
+                then=Value(True),
+            ),
+            default=F("is_celebrity"),
+        ),
+    )
+
+
+def recount_followers():
+    """
+    Пересчитывает счетчики подписчиков и отметки популярных авторов:
+    после загрузок через bulk_create, которые не шлют сигналы
+    """
+    updated = User.objects.update(
+        followers_count=Coalesce(
+            Subquery(
+                Subscription.objects.filter(author=OuterRef("pk"))
+                .order_by()
+                .values("author")
+                .annotate(total=Count("pk"))
+                .values("total"),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+    )
+    User.objects.filter(
+        followers_count__gt=TIMELINE_FANOUT_MAX_FOLLOWERS
+    ).update(is_celebrity=True)
+    return updated
+
+
+def fan_out_recipe(recipe):
+    """
+    Раскладывает новый рецепт по лентам подписчиков автора.
+    Популярные авторы (is_celebrity) пропускаются: их рецепты
+    подмешиваются при чтении ленты.
+    """
+    follower_ids = Subscription.objects.filter(
+        author_id=recipe.author_id, author__is_celebrity=False
+    ).values_list("user_id", flat=True)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                recipe_id=recipe.id,
+                author_id=recipe.author_id,
+                pub_date=recipe.pub_date,
+            )
+            for user_id in follower_ids
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def backfill_timeline(user, author):
+    """
+    Добавляет в ленту последние рецепты автора после подписки.
+    Рецепты популярного автора читаются на лету и не копируются
+    """
+    recipes = Recipe.objects.filter(
+        author=author, author__is_celebrity=False
+    ).values_list("id", "pub_date")[:TIMELINE_BACKFILL_SIZE]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user=user,
+                recipe_id=recipe_id,
+                author=author,
+                pub_date=pub_date,
+            )
+            for recipe_id, pub_date in recipes
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def remove_author_from_timeline(user, author_id):
+    TimelineEntry.objects.filter(user=user, author_id=author_id).delete()
+
+
+def pull_author_ids(user):
+    """Авторы из подписок, для которых лента собирается при чтении"""
+    return list(
+        Subscription.objects.filter(
+            user=user, author__is_celebrity=True
+        ).values_list("author_id", flat=True)
+    )
+
+
+def read_timeline(user, position, limit):
+    """
+    Возвращает до limit позиций (pub_date, recipe_id) ленты после
+    position: диапазон из TimelineEntry плюс рецепты популярных авторов
+    """
+    rows = list(
+        TimelineEntry.objects.filter(user=user)
+        .filter(keyset_filter(position, "pub_date", "recipe_id"))
+        .order_by("-pub_date", "-recipe_id")
+        .values_list("pub_date", "recipe_id")[:limit]
+    )
+    pull_authors = pull_author_ids(user)
+    if pull_authors:
+        rows += list(
+            Recipe.objects.filter(author_id__in=pull_authors)
+            .filter(keyset_filter(position, "pub_date", "id"))
+            .order_by("-pub_date", "-id")
+            .values_list("pub_date", "id")[:limit]
+        )
+        rows = sorted(set(rows), reverse=True)
+    return rows[:limit]
@@ -0,0 +1,178 @@
+from functools import partial
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Count,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .constants import (
+    TREND_FAVORITE_WEIGHT,
+    TREND_HALF_LIFE_HOURS,
+    TREND_MIN_SCORE,
+    TREND_SHOPPING_CART_WEIGHT,
+)
+from .models import Favorite, Recipe, RecipeTrend, ShoppingCart, TrendDecay
+from .response_cache import RANKING_KEY, purge
+
+RELATION_WEIGHTS = {
+    Favorite: TREND_FAVORITE_WEIGHT,
+    ShoppingCart: TREND_SHOPPING_CART_WEIGHT,
+}
+DECAYED_AT_KEY = "trending:decayed_at"
+
+
+def decay_factor(hours):
+    return 0.5 ** (hours / TREND_HALF_LIFE_HOURS)
+
+
+def _hours(delta):
+    return delta.total_seconds() / 3600
+
+
+def decayed_at():
+    """
+    Момент последнего затухания. Рейтинг в базе — сумма вкладов,
+    приведенных к этому моменту; чтобы получить рейтинг на текущий
+    момент, его нужно умножить на затухание за прошедшее время
+    """
+    moment = cache.get(DECAYED_AT_KEY)
+    if moment is None:
+        clock, _ = TrendDecay.objects.get_or_create(
+            pk=1, defaults={"decayed_at": timezone.now()}
+        )
+        moment = clock.decayed_at
+        cache.set(DECAYED_AT_KEY, moment, None)
+    return moment
+
+
+def _set_decayed_at(moment):
+    TrendDecay.objects.update_or_create(pk=1, defaults={"decayed_at": moment})
+    # Второй сброс — на случай, если до фиксации транзакции другой
+    # процесс успел закешировать прежнее значение.
+    cache.delete(DECAYED_AT_KEY)
+    transaction.on_commit(partial(cache.delete, DECAYED_AT_KEY))
+
+
+def relation_weight(model, created):
+    """
+    Вклад связи, созданной в момент created, в единицах последнего
+    затухания: столько же прибавляется при добавлении и вычитается при
+    удалении, сколько бы затуханий ни прошло между ними
+    """
+    return RELATION_WEIGHTS[model] * decay_factor(
+        _hours(decayed_at() - created)
+    )
+
+
+def bump_score(recipe_id, delta):
+    """
+    Прибавляет delta к рейтингу рецепта одним UPDATE.
+    Строка создается только при положительном delta, чтобы удаление
+    рецепта каскадом не порождало новых записей.
+    """
+    updated = RecipeTrend.objects.filter(recipe_id=recipe_id).update(
+        score=Greatest(
+            F("score") + delta, Value(0.0), output_field=FloatField()
+        )
+    )
+    if updated or delta <= 0:
+        return
+    try:
+        with transaction.atomic():
+            RecipeTrend.objects.create(recipe_id=recipe_id, score=delta)
+    except IntegrityError:
+        RecipeTrend.objects.filter(recipe_id=recipe_id).update(
+            score=F("score") + delta
+        )
+
+
+@transaction.atomic
+def decay_scores():
+    """
+    Применяет затухание за время с прошлого затухания и удаляет угасшие
+    записи. Возвращает (обновлено, удалено, прошло часов)
+    """
+    now = timezone.now()
+    clock, _ = TrendDecay.objects.select_for_update().get_or_create(
+        pk=1, defaults={"decayed_at": now}
+    )
+    hours = max(_hours(now - clock.decayed_at), 0.0)
+    decayed = RecipeTrend.objects.update(
+        score=F("score") * decay_factor(hours)
+    )
+    removed, _ = RecipeTrend.objects.filter(score__lt=TREND_MIN_SCORE).delete()
+    _set_decayed_at(now)
+    transaction.on_commit(partial(purge, RANKING_KEY))
+    return decayed, removed, hours
+
+
+@transaction.atomic
+def rebuild_scores():
+    """Пересчитывает рейтинги по датам добавления в избранное и покупки"""
+    now = timezone.now()
+    scores = {}
+    for model, weight in RELATION_WEIGHTS.items():
+        rows = model.objects.order_by().values_list("recipe_id", "created")
+        for recipe_id, created in rows.iterator(chunk_size=10000):
+            age_hours = (now - created).total_seconds() / 3600
+            scores[recipe_id] = scores.get(recipe_id, 0) + weight * (
+                decay_factor(age_hours)
+            )
+
+    RecipeTrend.objects.all().delete()
+    RecipeTrend.objects.bulk_create(
+        [
+            RecipeTrend(recipe_id=recipe_id, score=score)
+            for recipe_id, score in scores.items()
+            if score >= TREND_MIN_SCORE
+        ],
+        batch_size=1000,
+    )
+    _set_decayed_at(now)
+    transaction.on_commit(partial(purge, RANKING_KEY))
+    return len(scores)
+
+
+def bump_popularity(recipe_id, delta):
+    """Меняет счетчик популярности рецепта одним UPDATE"""
+    Recipe.objects.filter(pk=recipe_id).update(
+        popularity=Greatest(F("popularity") + delta, Value(0))
+    )
+
+
+def _count_by_recipe(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef("pk"))
+            .order_by()
+            .values("recipe")
+            .annotate(total=Count("pk"))
+            .values("total"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def recount_popularity():
+    """
+    Пересчитывает счетчики популярности по избранному и спискам
+    покупок: после загрузок через bulk_create, которые не шлют сигналы
+    """
+    updated = Recipe.objects.update(
+        popularity=sum(
+            (_count_by_recipe(model) for model in RELATION_WEIGHTS),
+            Value(0),
+        )
+    )
+    transaction.on_commit(partial(purge, RANKING_KEY))
+    return updated
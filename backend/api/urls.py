@@ -1,13 +1,18 @@
-from django.urls import include, path
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
+from .async_views import async_read_view
+from .batch import batch_view
+from .events import events_ticket_view, events_view
 from .views import (
     CustomAuthToken,
     IngredientViewSet,
     RecipeViewSet,
     TagViewSet,
     UserViewSet,
+    db_pool_view,
     logout_view,
+    sync_view,
 )
 
 router = DefaultRouter()
@@ -16,8 +21,62 @@ router.register("tags", TagViewSet, basename="tags")
 router.register("ingredients", IngredientViewSet, basename="ingredients")
 router.register("recipes", RecipeViewSet, basename="recipes")
 
-urlpatterns = [
+# GET этих маршрутов обслуживают async-методы вьюсетов; маршруты
+# объявлены раньше роутера, остальные методы уходят в обычный вьюсет.
+# pk только из цифр, чтобы не перехватить действия вроде recipes/feed/.
+async_urlpatterns = [
+    path(
+        "users/me/",
+        async_read_view(UserViewSet, {"get": "me"}),
+        name="users-me",
+    ),
+    path(
+        "tags/",
+        async_read_view(TagViewSet, {"get": "list"}),
+        name="tags-list",
+    ),
+    re_path(
+        r"^tags/(?P<pk>\d+)/$",
+        async_read_view(TagViewSet, {"get": "retrieve"}),
+        name="tags-detail",
+    ),
+    path(
+        "ingredients/",
+        async_read_view(IngredientViewSet, {"get": "list"}),
+        name="ingredients-list",
+    ),
+    re_path(
+        r"^ingredients/(?P<pk>\d+)/$",
+        async_read_view(IngredientViewSet, {"get": "retrieve"}),
+        name="ingredients-detail",
+    ),
+    path(
+        "recipes/",
+        async_read_view(RecipeViewSet, {"get": "list", "post": "create"}),
+        name="recipes-list",
+    ),
+    re_path(
+        r"^recipes/(?P<pk>\d+)/$",
+        async_read_view(
+            RecipeViewSet,
+            {
+                "get": "retrieve",
+                "put": "update",
+                "patch": "partial_update",
+                "delete": "destroy",
+            },
+        ),
+        name="recipes-detail",
+    ),
+]
+
+urlpatterns = async_urlpatterns + [
     path("", include(router.urls)),
     path("auth/token/login/", CustomAuthToken.as_view(), name="login"),
     path("auth/token/logout/", logout_view, name="logout"),
+    path("batch/", batch_view, name="batch"),
+    path("sync/", sync_view, name="sync"),
+    path("events/", events_view, name="events"),
+    path("events/ticket/", events_ticket_view, name="events-ticket"),
+    path("internal/db-pool/", db_pool_view, name="db-pool"),
 ]
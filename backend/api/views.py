@@ -1,36 +1,59 @@
 import csv
+import os
+from collections.abc import Mapping
 
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Count, Exists, OuterRef, Prefetch, Sum
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import status, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (
     AllowAny,
+    IsAdminUser,
     IsAuthenticated,
     IsAuthenticatedOrReadOnly,
 )
 from rest_framework.response import Response
 
+from .async_views import AsyncReadMixin
 from .auth_serializers import EmailAuthTokenSerializer
+from .cache import TAG_LIST_KEY, TAG_LIST_TIMEOUT
+from .constants import RECIPE_IDS_MAX, SIMILAR_RECIPES_LIMIT
 from .filters import IngredientFilter, RecipeFilter
+from .mixins import SPARSE_ACTIONS, SparseFieldsetsMixin, SurrogateKeysMixin
 from .models import (
     Favorite,
     Ingredient,
     Recipe,
+    RecipeIngredient,
     ShoppingCart,
     Subscription,
     Tag,
     User,
 )
-from .pagination import CustomPagination
+from .pagination import CustomPagination, KeysetPagination
+from .pantry import pantry_index
 from .permissions import IsAuthorOrReadOnly
+from .response_cache import (
+    INGREDIENTS_KEY,
+    RANKING_KEY,
+    RECIPES_KEY,
+    TAGS_KEY,
+    ingredient_key,
+    recipe_key,
+    tag_key,
+    user_key,
+)
 from .serializers import (
     FavoriteCreateSerializer,
     IngredientSerializer,
+    PantryQuerySerializer,
     RecipeReadSerializer,
     RecipeShortSerializer,
     RecipeWriteSerializer,
@@ -42,6 +65,13 @@ from .serializers import (
     UserPasswordSerializer,
     UserSerializer,
 )
+from .similarity import similarity_index
+from .sync import collect_changes, current_cursor, needs_reset
+from .timeline import (
+    backfill_timeline,
+    read_timeline,
+    remove_author_from_timeline,
+)
 
 
 class CustomAuthToken(ObtainAuthToken):
@@ -59,9 +89,12 @@ class CustomAuthToken(ObtainAuthToken):
         return Response({"auth_token": token.key})
 
 
-def recipe_short_redirect(request, pk: int):
-    get_object_or_404(Recipe, pk=pk)
-    return redirect(request.build_absolute_uri(f"/recipes/{pk}"))
+async def recipe_short_redirect(request, pk: int):
+    if not await Recipe.objects.filter(pk=pk).aexists():
+        raise Http404
+    response = redirect(request.build_absolute_uri(f"/recipes/{pk}"))
+    response.surrogate_keys = {recipe_key(pk)}
+    return response
 
 
 @api_view(["POST"])
@@ -71,17 +104,121 @@ def logout_view(request):
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class UserViewSet(viewsets.ModelViewSet):
-    """Вьюсет для пользователей"""
+def annotate_is_subscribed(queryset, user, author_ref="pk"):
+    return queryset.annotate(
+        is_subscribed=Exists(
+            Subscription.objects.filter(user=user, author=OuterRef(author_ref))
+        )
+    )
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def sync_view(request):
+    """
+    Изменения рецептов и связей пользователя после курсора ?since=.
+    Без курсора или после очистки журнала отвечает reset=true и
+    текущим курсором: клиенту нужно загрузить данные целиком.
+    """
+    since = request.query_params.get("since")
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            raise ValidationError(
+                {"since": "Курсор должен быть целым числом."}
+            )
+    if since is None or since < 0 or needs_reset(since):
+        return Response({"cursor": current_cursor(), "reset": True})
+    return Response(collect_changes(request.user, since))
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def db_pool_view(request):
+    """
+    Настройки соединений и статистика пула psycopg по алиасам БД.
+    Пул у каждого процесса свой, поэтому в ответе есть pid
+    """
+    databases = {}
+    for alias in connections:
+        connection = connections[alias]
+        pool = getattr(connection, "pool", None)
+        databases[alias] = {
+            "vendor": connection.vendor,
+            "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+            "conn_health_checks": connection.settings_dict[
+                "CONN_HEALTH_CHECKS"
+            ],
+            "pool": pool.get_stats() if pool is not None else None,
+        }
+    return Response({"pid": os.getpid(), "databases": databases})
+
+
+class UserViewSet(
+    AsyncReadMixin,
+    SparseFieldsetsMixin,
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Вьюсет для пользователей. Профиль по API только читается: изменение
+    и удаление пользователей — через админку
+    """
 
     queryset = User.objects.all()
+    replica_reads = True
     pagination_class = CustomPagination
 
+    def get_queryset(self):
+        queryset = User.objects.all()
+        user = self.request.user
+        if (
+            self.action in ("list", "retrieve")
+            and user.is_authenticated
+            and self.wants_field("is_subscribed")
+        ):
+            queryset = annotate_is_subscribed(queryset, user)
+        return queryset
+
+    def get_subscriptions_queryset(self):
+        queryset = Subscription.objects.filter(
+            user=self.request.user
+        ).select_related("author")
+        if self.wants_field("recipes_count"):
+            queryset = queryset.annotate(
+                recipes_count=Count("author__recipes")
+            ).order_by(*Subscription._meta.ordering)
+        if self.wants_field("recipes"):
+            recipes = Recipe.objects.only(
+                "id", "name", "image", "cooking_time", "author_id"
+            )
+            try:
+                recipes_limit = int(
+                    self.request.query_params.get("recipes_limit", "")
+                )
+            except ValueError:
+                recipes_limit = None
+            if recipes_limit is not None and recipes_limit >= 0:
+                recipes = recipes[:recipes_limit]
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "author__recipes",
+                    queryset=recipes,
+                    to_attr="limited_recipes",
+                )
+            )
+        return queryset
+
     def get_serializer_class(self):
         if self.action == "create":
             return UserCreateSerializer
         if self.action == "avatar":
             return UserAvatarSerializer
+        if self.action == "subscriptions":
+            return SubscriptionSerializer
         return UserSerializer
 
     def get_permissions(self):
@@ -90,6 +227,7 @@ class UserViewSet(viewsets.ModelViewSet):
             "set_password",
             "avatar",
             "subscribe",
+            "delete_subscribe",
             "subscriptions",
         ):
             return [IsAuthenticated()]
@@ -128,6 +266,14 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
+    async def ame(self, request):
+        user = request.user
+        if self.wants_field("is_subscribed"):
+            user = await annotate_is_subscribed(User.objects, user).aget(
+                pk=user.pk
+            )
+        return Response(self.get_serializer(user).data)
+
     @action(detail=False, methods=["post"])
     def set_password(self, request):
         serializer = UserPasswordSerializer(
@@ -162,18 +308,23 @@ class UserViewSet(viewsets.ModelViewSet):
     )
     def subscribe(self, request, pk=None):
         author = get_object_or_404(User, id=pk)
-        return self._create_by_serializer(
+        response = self._create_by_serializer(
             serializer_class=SubscriptionSerializer,
             request=request,
             data={"author": author.id},
         )
+        backfill_timeline(request.user, author)
+        return response
 
     @subscribe.mapping.delete
     def delete_subscribe(self, request, pk=None):
-        return self._delete_by_filter(
+        response = self._delete_by_filter(
             Subscription.objects.filter(user=request.user, author_id=pk),
             error_message="Подписки не существует",
         )
+        if response.status_code == status.HTTP_204_NO_CONTENT:
+            remove_author_from_timeline(request.user, pk)
+        return response
 
     @action(
         detail=False,
@@ -182,42 +333,123 @@ class UserViewSet(viewsets.ModelViewSet):
         url_path="subscriptions",
     )
     def subscriptions(self, request):
-        queryset = Subscription.objects.filter(user=request.user)
+        queryset = self.get_subscriptions_queryset()
         page = self.paginate_queryset(queryset)
 
         if page is not None:
-            serializer = SubscriptionSerializer(
-                page, many=True, context={"request": request}
-            )
+            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = SubscriptionSerializer(
-            queryset, many=True, context={"request": request}
-        )
+        serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(
+    AsyncReadMixin, SurrogateKeysMixin, viewsets.ReadOnlyModelViewSet
+):
     """Вьюсет для тегов"""
 
     queryset = Tag.objects.all()
+    replica_reads = True
     serializer_class = TagSerializer
     pagination_class = None
 
+    def get_surrogate_keys(self, data):
+        if self.action == "list":
+            return {TAGS_KEY}
+        return None
+
+    async def alist(self, request, *args, **kwargs):
+        data = await cache.aget(TAG_LIST_KEY)
+        if data is None:
+            data = (await super().alist(request, *args, **kwargs)).data
+            await cache.aset(TAG_LIST_KEY, data, TAG_LIST_TIMEOUT)
+        return Response(data)
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientViewSet(
+    AsyncReadMixin, SurrogateKeysMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = Ingredient.objects.all()
+    replica_reads = True
     serializer_class = IngredientSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
     pagination_class = None
 
+    def get_surrogate_keys(self, data):
+        if self.action == "list":
+            return {INGREDIENTS_KEY}
+        return None
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    AsyncReadMixin,
+    SparseFieldsetsMixin,
+    SurrogateKeysMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Recipe.objects.all()
+    replica_reads = True
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    extra_read_actions = ("batch", "pantry", "similar", "trending", "feed")
+    read_actions = ("list", "retrieve") + extra_read_actions
+    sparse_actions = SPARSE_ACTIONS + extra_read_actions
+
+    def get_queryset(self):
+        queryset = Recipe.objects.all()
+        if self.action not in self.read_actions:
+            return queryset
+        return self.get_read_queryset(queryset)
+
+    def get_read_queryset(self, queryset):
+        """
+        Собирает queryset под RecipeReadSerializer: джойны, префетчи и
+        аннотации добавляются только для полей, попавших в ответ.
+        """
+        user = self.request.user
+
+        if self.wants_field("author"):
+            authors = User.objects.all()
+            if user.is_authenticated:
+                authors = annotate_is_subscribed(authors, user)
+            queryset = queryset.prefetch_related(
+                Prefetch("author", queryset=authors)
+            )
+        if self.wants_field("tags"):
+            queryset = queryset.prefetch_related("tags")
+        if self.wants_field("ingredients"):
+            queryset = queryset.prefetch_related(
+                Prefetch(
+                    "recipe_ingredients",
+                    queryset=RecipeIngredient.objects.select_related(
+                        "ingredient"
+                    ),
+                )
+            )
+        if not self.wants_field("text"):
+            queryset = queryset.defer("text")
+
+        if user.is_authenticated:
+            if self.wants_field("is_favorited"):
+                queryset = queryset.annotate(
+                    is_favorited=Exists(
+                        Favorite.objects.filter(
+                            user=user, recipe=OuterRef("pk")
+                        )
+                    )
+                )
+            if self.wants_field("is_in_shopping_cart"):
+                queryset = queryset.annotate(
+                    is_in_shopping_cart=Exists(
+                        ShoppingCart.objects.filter(
+                            user=user, recipe=OuterRef("pk")
+                        )
+                    )
+                )
+        return queryset
 
     @staticmethod
     def _create_relation(serializer_class, request, recipe_pk):
@@ -239,6 +471,58 @@ class RecipeViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED,
         )
 
+    @staticmethod
+    def _parse_id(item):
+        """
+        id — целое число (не bool) или строка из цифр; 1.9 и true не
+        приводятся к 1
+        """
+        if isinstance(item, str):
+            item = item.strip()
+            if item.isascii() and item.isdigit():
+                return int(item)
+        elif isinstance(item, int) and not isinstance(item, bool):
+            return item
+        raise ValidationError({"ids": "id должны быть целыми числами."})
+
+    @classmethod
+    def _parse_ids(cls, raw_ids):
+        """
+        Приводит список id из ?ids=1,2,3 или тела запроса к списку int
+        без повторов, сохраняя порядок
+        """
+        if isinstance(raw_ids, str):
+            raw_ids = [item for item in raw_ids.split(",") if item.strip()]
+        if not isinstance(raw_ids, list) or not raw_ids:
+            raise ValidationError({"ids": "Передайте непустой список id."})
+        ids = list(dict.fromkeys(map(cls._parse_id, raw_ids)))
+        if len(ids) > RECIPE_IDS_MAX:
+            raise ValidationError(
+                {"ids": f"Не больше {RECIPE_IDS_MAX} id за один запрос."}
+            )
+        return ids
+
+    def _list_by_ids(self, raw_ids):
+        """Отдает рецепты по списку id в порядке запроса, без пагинации"""
+        ids = self._parse_ids(raw_ids)
+        queryset = self.filter_queryset(self.get_queryset()).filter(pk__in=ids)
+        recipes = {recipe.pk: recipe for recipe in queryset}
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True
+        )
+        return Response(serializer.data)
+
+    async def _alist_by_ids(self, raw_ids):
+        ids = self._parse_ids(raw_ids)
+        queryset = await self.afilter_queryset(self.get_queryset())
+        recipes = {
+            recipe.pk: recipe async for recipe in queryset.filter(pk__in=ids)
+        }
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True
+        )
+        return Response(serializer.data)
+
     @staticmethod
     def _delete_relation(request, model, recipe, error_message):
         deleted, _ = model.objects.filter(
@@ -250,11 +534,79 @@ class RecipeViewSet(viewsets.ModelViewSet):
             )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @staticmethod
+    def _recipe_surrogate_keys(recipe):
+        keys = set()
+        if "id" in recipe:
+            keys.add(recipe_key(recipe["id"]))
+        if recipe.get("author"):
+            keys.add(user_key(recipe["author"]["id"]))
+        keys.update(tag_key(tag["id"]) for tag in recipe.get("tags", ()))
+        keys.update(
+            ingredient_key(ingredient["id"])
+            for ingredient in recipe.get("ingredients", ())
+        )
+        return keys
+
+    def get_surrogate_keys(self, data):
+        """
+        Детальный рецепт зависит от себя, автора, тегов и ингредиентов;
+        список — еще и от любого изменения рецептов, а сортировки по
+        популярности и трендам — от избранного и списков покупок
+        """
+        if self.action == "retrieve":
+            return {recipe_key(self.kwargs["pk"])} | (
+                self._recipe_surrogate_keys(data)
+            )
+        if self.action != "list":
+            return None
+        keys = {RECIPES_KEY}
+        ordering = self.request.query_params.get("ordering", "")
+        if "popularity" in ordering or "trending" in ordering:
+            keys.add(RANKING_KEY)
+        recipes = data["results"] if isinstance(data, dict) else data
+        for recipe in recipes:
+            keys |= self._recipe_surrogate_keys(recipe)
+        return keys
+
+    def _read_data(self, recipe):
+        """
+        Ответ на запись: рецепт перечитывается с префетчами чтения,
+        иначе ингредиенты и автор грузятся по одному
+        """
+        recipe = self.get_read_queryset(Recipe.objects.all()).get(pk=recipe.pk)
+        return RecipeReadSerializer(
+            recipe, context=self.get_serializer_context()
+        ).data
+
     def get_serializer_class(self):
-        if self.action in ("list", "retrieve"):
+        if self.action in self.read_actions:
             return RecipeReadSerializer
         return RecipeWriteSerializer
 
+    def list(self, request, *args, **kwargs):
+        if "ids" in request.query_params:
+            return self._list_by_ids(request.query_params["ids"])
+        return super().list(request, *args, **kwargs)
+
+    async def alist(self, request, *args, **kwargs):
+        if "ids" in request.query_params:
+            return await self._alist_by_ids(request.query_params["ids"])
+        return await super().alist(request, *args, **kwargs)
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="batch",
+        permission_classes=[AllowAny],
+    )
+    def batch(self, request):
+        if not isinstance(request.data, Mapping):
+            raise ValidationError(
+                {"ids": "Тело запроса должно быть объектом с полем ids."}
+            )
+        return self._list_by_ids(request.data.get("ids"))
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(
             data=request.data, context={"request": request}
@@ -262,8 +614,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
         recipe = serializer.save()
         return Response(
-            RecipeReadSerializer(recipe, context={"request": request}).data,
-            status=status.HTTP_201_CREATED,
+            self._read_data(recipe), status=status.HTTP_201_CREATED
         )
 
     def update(self, request, *args, **kwargs):
@@ -278,14 +629,91 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         recipe = serializer.save()
-        return Response(
-            RecipeReadSerializer(recipe, context={"request": request}).data
-        )
+        return Response(self._read_data(recipe))
 
     def partial_update(self, request, *args, **kwargs):
         kwargs["partial"] = True
         return self.update(request, *args, **kwargs)
 
+    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    def pantry(self, request):
+        """
+        Рецепты, которые можно приготовить из ингредиентов кладовой
+        (?ingredients=1,2,3), или которым не хватает не больше
+        ?max_missing= ингредиентов, по убыванию покрытия
+        """
+        params = PantryQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        matches = pantry_index.match(
+            params.validated_data["ingredients"],
+            params.validated_data["max_missing"],
+        )
+
+        page = self.paginate_queryset(matches)
+        rows = matches if page is None else page
+        recipes = self.get_queryset().in_bulk([row[0] for row in rows])
+        rows = [row for row in rows if row[0] in recipes]
+        data = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in rows], many=True
+        ).data
+        for item, (_, matched, missing) in zip(data, rows):
+            item["matched_count"] = matched
+            item["missing_count"] = missing
+
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    @action(detail=False, methods=["get"])
+    def trending(self, request):
+        """Рецепты по убыванию рейтинга трендов (индекс по score)"""
+        queryset = (
+            self.filter_queryset(self.get_queryset())
+            .filter(trend__score__gt=0)
+            .order_by("-trend__score", "-pub_date")
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    @action(
+        detail=False, methods=["get"], permission_classes=[IsAuthenticated]
+    )
+    def feed(self, request):
+        """Лента рецептов авторов из подписок с keyset-пагинацией"""
+        paginator = KeysetPagination()
+        page_size = paginator.get_page_size(request)
+        rows = read_timeline(
+            request.user, paginator.decode_cursor(request), page_size + 1
+        )
+        next_position = rows[page_size - 1] if len(rows) > page_size else None
+        rows = rows[:page_size]
+
+        recipes = self.get_queryset().in_bulk([pk for _, pk in rows])
+        serializer = self.get_serializer(
+            [recipes[pk] for _, pk in rows if pk in recipes], many=True
+        )
+        return paginator.get_paginated_response(
+            request, serializer.data, next_position
+        )
+
+    @action(detail=True, methods=["get"])
+    def similar(self, request, pk=None):
+        """Похожие по набору ингредиентов рецепты (MinHash + LSH)"""
+        get_object_or_404(Recipe.objects.only("id"), pk=pk)
+        matches = similarity_index.similar(int(pk), SIMILAR_RECIPES_LIMIT)
+        recipes = self.get_queryset().in_bulk([row[0] for row in matches])
+        matches = [row for row in matches if row[0] in recipes]
+        data = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _ in matches], many=True
+        ).data
+        for item, (_, score) in zip(data, matches):
+            item["similarity"] = round(score, 3)
+        return Response(data)
+
     @action(
         detail=True, methods=["post"], permission_classes=[IsAuthenticated]
     )
@@ -45,4 +45,22 @@ echo "Collect static..."
 python manage.py collectstatic --noinput
 cp -r /app/static/. /app_static/ 2>/dev/null || true
 
-exec gunicorn foodgram.wsgi:application --bind 0.0.0.0:8000 --workers=3
+WORKER_CLASS="${GUNICORN_WORKER_CLASS:-uvicorn_worker.UvicornWorker}"
+if [ "$WORKER_CLASS" = "sync" ]; then
+  APP=foodgram.wsgi:application
+else
+  APP=foodgram.asgi:application
+fi
+
+# Воркеры пишут метрики в общий каталог, /metrics суммирует их.
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Число воркеров видно приложению: LocalBackend событий с ним сверяется.
+export GUNICORN_WORKERS="${GUNICORN_WORKERS:-3}"
+
+exec gunicorn "$APP" --bind 0.0.0.0:8000 \
+  --workers="$GUNICORN_WORKERS" --worker-class "$WORKER_CLASS" \
+  --max-requests="${GUNICORN_MAX_REQUESTS:-0}" \
+  --max-requests-jitter="${GUNICORN_MAX_REQUESTS_JITTER:-0}"
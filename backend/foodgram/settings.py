@@ -1,3 +1,4 @@
+import copy
 import os
 from pathlib import Path
 
@@ -35,11 +36,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.SlowQueryMiddleware",
+    "api.middleware.RequestMetricsMiddleware",
+    "api.middleware.MemorySampleMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
+    "api.middleware.ProfilerMiddleware",
+    "api.middleware.AnonymousResponseCacheMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "api.middleware.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -72,9 +79,48 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", "foodgram"),
         "HOST": os.getenv("DB_HOST", "db"),
         "PORT": os.getenv("DB_PORT", "5432"),
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": (
+            os.getenv("DB_CONN_HEALTH_CHECKS", "True").lower() == "true"
+        ),
     }
 }
 
+# Пул psycopg 3 заменяет постоянные соединения: Django не допускает
+# CONN_MAX_AGE вместе с пулом, поэтому при включенном пуле он равен 0.
+# CONN_HEALTH_CHECKS для пула включает проверку соединения при выдаче.
+DB_POOL = os.getenv("DB_POOL", "True").lower() == "true"
+if DB_POOL and DATABASES["default"]["ENGINE"].endswith("postgresql"):
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "600")),
+        }
+    }
+
+# Реплики для чтения: DB_REPLICAS — хосты PostgreSQL через запятую
+# (для SQLite — пути к файлам). В тестах реплики зеркалят default.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(
+    (item.strip() for item in os.getenv("DB_REPLICAS", "").split(",")),
+    start=1,
+):
+    if not replica:
+        continue
+    alias = f"replica_{number}"
+    DATABASES[alias] = copy.deepcopy(DATABASES["default"])
+    DATABASES[alias][
+        "NAME" if DATABASES[alias]["ENGINE"].endswith("sqlite3") else "HOST"
+    ] = replica
+    DATABASES[alias]["TEST"] = {"MIRROR": "default"}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["api.db_routers.ReplicaRouter"]
+DB_REPLICA_STICKY_SECONDS = int(os.getenv("DB_REPLICA_STICKY_SECONDS", "10"))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -101,6 +147,88 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+SIMILARITY_INDEX_DIR = os.getenv(
+    "SIMILARITY_INDEX_DIR", os.path.join(BASE_DIR, "similarity")
+)
+
+# Общий кеш нужен, чтобы сбросы кеша ответов, метки реплик и поколения
+# индексов видели все процессы; без REDIS_URL кеш локален для процесса.
+# Бэкенды из api.cache_backends считают попадания и промахи для метрик.
+CACHES = {
+    "default": {
+        "BACKEND": "api.cache_backends.MeteredLocMemCache",
+    }
+}
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "api.cache_backends.MeteredRedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", "300"))
+RESPONSE_CACHE_SURROGATE_HEADER = (
+    os.getenv("RESPONSE_CACHE_SURROGATE_HEADER", "False").lower() == "true"
+)
+
+# Заголовок Server-Timing с разбивкой времени запроса.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "True").lower() == "true"
+
+# /metrics доступен сотрудникам, по заголовку Authorization: Bearer
+# METRICS_TOKEN и с адресов METRICS_ALLOWED_NETWORKS (CIDR через запятую).
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_ALLOWED_NETWORKS = os.getenv(
+    "METRICS_ALLOWED_NETWORKS", "127.0.0.1/32,::1/128"
+).split(",")
+
+# Журнал медленных и повторяющихся (N+1) запросов, см. api.slow_queries.
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "100"))
+SLOW_QUERY_REPEAT_LIMIT = int(os.getenv("SLOW_QUERY_REPEAT_LIMIT", "10"))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.01"))
+SLOW_QUERY_LOG_FILE = os.getenv(
+    "SLOW_QUERY_LOG_FILE", os.path.join(BASE_DIR, "slow_queries.log")
+)
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "slow_queries": {
+            # Файл общий для воркеров gunicorn: ротирует его logrotate,
+            # а обработчик переоткрывает файл после переименования.
+            "class": "logging.handlers.WatchedFileHandler",
+            "filename": SLOW_QUERY_LOG_FILE,
+            "encoding": "utf-8",
+            "delay": True,
+        },
+    },
+    "loggers": {
+        "api.slow_queries": {
+            "handlers": ["slow_queries"],
+            "level": "WARNING",
+            "propagate": False,
+        },
+    },
+}
+
+# Профилирование отдельных запросов сотрудников, см. api.profiling.
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "True").lower() == "true"
+PROFILER_DIR = os.getenv("PROFILER_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.001"))
+PROFILER_RATE_LIMIT = int(os.getenv("PROFILER_RATE_LIMIT", "10"))
+PROFILER_MAX_CONCURRENT = int(os.getenv("PROFILER_MAX_CONCURRENT", "1"))
+
+# Доля запросов, измеряемых tracemalloc; 0 — трассировка выключена.
+TRACEMALLOC_SAMPLE_RATE = float(os.getenv("TRACEMALLOC_SAMPLE_RATE", "0"))
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "15"))
+TRACEMALLOC_DIR = os.getenv(
+    "TRACEMALLOC_DIR", os.path.join(BASE_DIR, "memory")
+)
+
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "api.events.ChangeLogBackend")
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", "1"))
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "api.User"
@@ -112,6 +240,16 @@ REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.TokenAuthentication",
     ],
+    # JSON через orjson; без него — стандартные рендерер и парсер DRF.
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "api.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     "DEFAULT_PAGINATION_CLASS": "api.pagination.CustomPagination",
     "PAGE_SIZE": 6,
     "DEFAULT_FILTER_BACKENDS": [
@@ -3,12 +3,14 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from api.metrics import metrics_view
 from api.views import recipe_short_redirect
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("api.urls")),
     path("s/<int:pk>/", recipe_short_redirect, name="recipe-short"),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 if settings.DEBUG:
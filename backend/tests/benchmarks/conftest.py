@@ -0,0 +1,198 @@
+import io
+import time
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.models import Recipe, ShoppingCart, User
+
+from . import report
+
+# Параметры generate_dataset для каждого масштаба.
+SCALES = {
+    "small": {"users": 100, "recipes": 500},
+    "medium": {"users": 1000, "recipes": 5000},
+    "large": {"users": 10000, "recipes": 50000},
+}
+SEED = 20240101
+WARMUP_ROUNDS = 1
+CART_SIZE = 20
+
+
+def pytest_generate_tests(metafunc):
+    if "dataset" in metafunc.fixturenames:
+        scales = metafunc.config.getoption("benchmark_scales").split(",")
+        unknown = set(scales) - set(SCALES)
+        if unknown:
+            raise pytest.UsageError(f"Unknown scales: {', '.join(unknown)}")
+        metafunc.parametrize("dataset", scales, indirect=True, scope="session")
+
+
+def pytest_configure(config):
+    config.benchmark_results = {"scales": {}}
+    config.benchmark_regressions = []
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    results = config.benchmark_results
+    if not results["scales"]:
+        return
+    results["environment"] = report.environment()
+    if config.getoption("benchmark_json"):
+        report.dump(results, config.getoption("benchmark_json"))
+    if config.getoption("benchmark_baseline"):
+        config.benchmark_regressions = report.compare(
+            results,
+            report.load(config.getoption("benchmark_baseline")),
+            config.getoption("benchmark_tolerance"),
+        )
+        if config.benchmark_regressions:
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    if not config.benchmark_results["scales"]:
+        return
+    terminalreporter.section("benchmarks")
+    for line in report.table(config.benchmark_results):
+        terminalreporter.write_line(line)
+    for regression in config.benchmark_regressions:
+        terminalreporter.write_line(f"REGRESSION {regression}", red=True)
+
+
+class Dataset:
+    """Сгенерированные данные масштаба и пользователь-читатель"""
+
+    def __init__(self, scale):
+        self.scale = scale
+        # Читатель подписан на больше всего авторов.
+        self.reader = (
+            User.objects.annotate(subscriptions=Count("follower"))
+            .order_by("-subscriptions", "id")
+            .first()
+        )
+        self.token = Token.objects.create(user=self.reader).key
+        ShoppingCart.objects.bulk_create(
+            [
+                ShoppingCart(user=self.reader, recipe=recipe)
+                for recipe in Recipe.objects.order_by("id")[:CART_SIZE]
+            ],
+            ignore_conflicts=True,
+        )
+        self.own_recipe = Recipe.objects.filter(author=self.reader).first()
+        if self.own_recipe is None:
+            self.own_recipe = Recipe.objects.order_by("id").first()
+            self.own_recipe.author = self.reader
+            self.own_recipe.save(update_fields=["author"])
+        self.top_author = (
+            User.objects.annotate(recipe_count=Count("recipes"))
+            .order_by("-recipe_count", "id")
+            .first()
+        )
+
+
+@pytest.fixture(scope="session")
+def benchmark_settings(tmp_path_factory):
+    """Медиа во временном каталоге, журнал медленных запросов выключен"""
+    with override_settings(
+        MEDIA_ROOT=str(tmp_path_factory.mktemp("media")),
+        SLOW_QUERY_THRESHOLD_MS=float("inf"),
+        SLOW_QUERY_REPEAT_LIMIT=10**9,
+        SERVER_TIMING=False,
+    ):
+        yield
+
+
+@pytest.fixture(scope="session")
+def dataset(request, benchmark_settings, django_db_setup, django_db_blocker):
+    """
+    Данные масштаба живут в транзакции, которая откатывается после
+    тестов масштаба, поэтому --reuse-db база остается пустой
+    """
+    with django_db_blocker.unblock():
+        atomic = transaction.atomic()
+        atomic.__enter__()
+        try:
+            cache.clear()
+            call_command(
+                "generate_dataset",
+                **SCALES[request.param],
+                seed=SEED,
+                skip_timeline=True,
+                stdout=io.StringIO(),
+            )
+            yield Dataset(request.param)
+        finally:
+            transaction.set_rollback(True)
+            atomic.__exit__(None, None, None)
+            cache.clear()
+
+
+class Runner:
+    """Замеряет запросы одного клиента и пишет сводку в результаты"""
+
+    def __init__(self, client, rounds, results):
+        self.client = client
+        self.rounds = rounds
+        self.results = results
+
+    def request(self, method, path, data):
+        if method == "get":
+            response = self.client.get(path, data)
+        else:
+            response = getattr(self.client, method)(
+                path, data, content_type="application/json"
+            )
+        # Тело читается внутри замера: у потоковых ответов запросы
+        # выполняются при итерации.
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response
+
+    def measure(self, name, method, path, data=None, status=200):
+        """
+        data — словарь или функция, которая строит его для каждого
+        запроса (например, уникальное название рецепта)
+        """
+        timings = []
+        queries = 0
+        for round_number in range(WARMUP_ROUNDS + self.rounds):
+            payload = data() if callable(data) else data
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = self.request(method, path, payload)
+                elapsed = time.perf_counter() - started
+            assert response.status_code == status, response.content[:500]
+            if round_number >= WARMUP_ROUNDS:
+                timings.append(elapsed)
+                queries = max(queries, len(captured))
+        self.results[name] = report.summarize(timings, queries)
+
+    def measure_call(self, name, function):
+        """Замер функции без HTTP-запроса: рендеринг, разбор тела"""
+        timings = []
+        for round_number in range(WARMUP_ROUNDS + self.rounds):
+            started = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - started
+            if round_number >= WARMUP_ROUNDS:
+                timings.append(elapsed)
+        self.results[name] = report.summarize(timings, 0)
+
+
+@pytest.fixture
+def bench(request, dataset, db):
+    results = request.config.benchmark_results["scales"].setdefault(
+        dataset.scale, {}
+    )
+    client = Client(headers={"Authorization": f"Token {dataset.token}"})
+    return Runner(
+        client, request.config.getoption("benchmark_rounds"), results
+    )
@@ -0,0 +1,121 @@
+"""
+Результаты бенчмарков и сравнение с базовой линией.
+
+Сравнить два сохраненных отчета без запуска тестов:
+
+    python -m tests.benchmarks.report current.json baseline.json
+"""
+
+import argparse
+import json
+import math
+import platform
+import sys
+
+import django
+from django.db import connection
+
+# Разница p95 меньше этой не считается регрессией: шум таймера
+# на быстрых эндпоинтах больше допуска в процентах.
+MIN_DELTA_MS = 2.0
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу"""
+    ordered = sorted(values)
+    rank = max(math.ceil(share * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(timings, queries):
+    return {
+        "rounds": len(timings),
+        "p50_ms": round(percentile(timings, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+        "queries": queries,
+    }
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """
+    Регрессии относительно базовой линии: любой рост числа запросов
+    и рост p95 больше чем на tolerance (и больше MIN_DELTA_MS)
+    """
+    regressions = []
+    for scale, cases in current["scales"].items():
+        base_cases = baseline.get("scales", {}).get(scale, {})
+        for name, result in cases.items():
+            base = base_cases.get(name)
+            if base is None:
+                continue
+            if result["queries"] > base["queries"]:
+                regressions.append(
+                    f"{scale} {name}: queries {base['queries']} -> "
+                    f"{result['queries']}"
+                )
+            delta = result["p95_ms"] - base["p95_ms"]
+            if delta > MIN_DELTA_MS and result["p95_ms"] > base["p95_ms"] * (
+                1 + tolerance
+            ):
+                regressions.append(
+                    f"{scale} {name}: p95 {base['p95_ms']:.1f} ms -> "
+                    f"{result['p95_ms']:.1f} ms"
+                )
+    return regressions
+
+
+def table(results):
+    rows = [
+        (scale, name, result)
+        for scale, cases in results["scales"].items()
+        for name, result in cases.items()
+    ]
+    width = max([len("endpoint")] + [len(name) for _, name, _ in rows])
+    lines = [
+        f"{'scale':<8} {'endpoint':<{width}} {'p50 ms':>9} {'p95 ms':>9} "
+        f"{'queries':>7}"
+    ]
+    for scale, name, result in rows:
+        lines.append(
+            f"{scale:<8} {name:<{width}} {result['p50_ms']:>9.1f} "
+            f"{result['p95_ms']:>9.1f} {result['queries']:>7}"
+        )
+    return lines
+
+
+def load(path):
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def dump(results, path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+        file.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("current")
+    parser.add_argument("baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+    current = load(args.current)
+    print("\n".join(table(current)))
+    regressions = compare(current, load(args.baseline), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import itertools
+
+import pytest
+from django.db.models import Count
+
+from api.models import Ingredient, Tag
+
+pytestmark = pytest.mark.benchmark
+
+
+# Фильтры фронтенда: все их сочетания.
+BASE_FILTERS = ("tags", "author", "is_favorited", "is_in_shopping_cart")
+# Расширенные фильтры и сортировки: по одному.
+EXTRA_FILTERS = (
+    "ingredients",
+    "exclude_ingredients",
+    "cooking_time",
+    "ordering=popularity",
+    "ordering=trending",
+    "ordering=name",
+)
+LIST_CASES = [
+    combination
+    for size in range(len(BASE_FILTERS) + 1)
+    for combination in itertools.combinations(BASE_FILTERS, size)
+] + [(extra,) for extra in EXTRA_FILTERS]
+
+
+def popular_ingredients(count):
+    return list(
+        Ingredient.objects.annotate(uses=Count("recipe_ingredients"))
+        .order_by("-uses", "id")
+        .values_list("id", flat=True)[:count]
+    )
+
+
+def list_params(dataset, filters):
+    tags = list(
+        Tag.objects.annotate(uses=Count("recipes"))
+        .order_by("-uses", "id")
+        .values_list("slug", flat=True)[:2]
+    )
+    ingredients = ",".join(map(str, popular_ingredients(2)))
+    values = {
+        "tags": {"tags": tags},
+        "author": {"author": dataset.top_author.pk},
+        "is_favorited": {"is_favorited": 1},
+        "is_in_shopping_cart": {"is_in_shopping_cart": 1},
+        "ingredients": {"ingredients": ingredients},
+        "exclude_ingredients": {"exclude_ingredients": ingredients},
+        "cooking_time": {"cooking_time_min": 15, "cooking_time_max": 45},
+    }
+    params = {"limit": 6}
+    for name in filters:
+        if name.startswith("ordering="):
+            params["ordering"] = name.partition("=")[2]
+        else:
+            params.update(values[name])
+    return params
+
+
+def recipe_payload(name, image):
+    tags = list(Tag.objects.order_by("id").values_list("id", flat=True)[:2])
+    return {
+        "name": name,
+        "text": "Рецепт для замера",
+        "cooking_time": 30,
+        "image": image,
+        "tags": tags,
+        "ingredients": [
+            {"id": pk, "amount": 100} for pk in popular_ingredients(8)
+        ],
+    }
+
+
+@pytest.mark.parametrize(
+    "filters", LIST_CASES, ids=lambda case: "+".join(case) or "none"
+)
+def test_recipe_list(bench, dataset, filters):
+    bench.measure(
+        "recipes-list[{}]".format("+".join(filters) or "none"),
+        "get",
+        "/api/recipes/",
+        list_params(dataset, filters),
+    )
+
+
+def test_recipe_detail(bench, dataset):
+    bench.measure(
+        "recipes-detail", "get", f"/api/recipes/{dataset.own_recipe.pk}/"
+    )
+
+
+@pytest.mark.parametrize("recipes_limit", [None, 3])
+def test_subscriptions(bench, recipes_limit):
+    params = {"limit": 6}
+    if recipes_limit is not None:
+        params["recipes_limit"] = recipes_limit
+    bench.measure(
+        f"users-subscriptions[recipes_limit={recipes_limit}]",
+        "get",
+        "/api/users/subscriptions/",
+        params,
+    )
+
+
+@pytest.mark.parametrize("prefix", ["", "с", "сыр"])
+def test_ingredient_search(bench, prefix):
+    bench.measure(
+        f"ingredients-list[name={prefix}]",
+        "get",
+        "/api/ingredients/",
+        {"name": prefix} if prefix else None,
+    )
+
+
+def test_download_shopping_cart(bench):
+    bench.measure(
+        "recipes-download-shopping-cart",
+        "get",
+        "/api/recipes/download_shopping_cart/",
+    )
+
+
+def test_recipe_create(bench, png_data_url):
+    names = (f"Замер {number}" for number in itertools.count())
+    bench.measure(
+        "recipes-create",
+        "post",
+        "/api/recipes/",
+        lambda: recipe_payload(next(names), png_data_url),
+        status=201,
+    )
+
+
+def test_recipe_update(bench, dataset, png_data_url):
+    names = (f"Замер {number}" for number in itertools.count())
+    bench.measure(
+        "recipes-partial-update",
+        "patch",
+        f"/api/recipes/{dataset.own_recipe.pk}/",
+        lambda: recipe_payload(next(names), png_data_url),
+    )
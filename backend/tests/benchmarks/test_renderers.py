@@ -0,0 +1,46 @@
+import io
+
+import pytest
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+
+pytestmark = pytest.mark.benchmark
+
+# Каталог ингредиентов целиком и большая страница рецептов.
+PAYLOADS = {
+    "ingredients": ("/api/ingredients/", None),
+    "recipes": ("/api/recipes/", {"limit": 100}),
+}
+RENDERERS = {"stock": JSONRenderer, "fast": FastJSONRenderer}
+PARSERS = {"stock": JSONParser, "fast": FastJSONParser}
+
+
+def response_data(bench, payload):
+    path, params = PAYLOADS[payload]
+    response = bench.client.get(path, params)
+    assert response.status_code == 200
+    return response.data
+
+
+@pytest.mark.parametrize("renderer", RENDERERS)
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_render(bench, payload, renderer):
+    data = response_data(bench, payload)
+    instance = RENDERERS[renderer]()
+    bench.measure_call(
+        f"render-{payload}[{renderer}]", lambda: instance.render(data)
+    )
+
+
+@pytest.mark.parametrize("parser", PARSERS)
+@pytest.mark.parametrize("payload", PAYLOADS)
+def test_parse(bench, payload, parser):
+    body = JSONRenderer().render(response_data(bench, payload))
+    instance = PARSERS[parser]()
+    bench.measure_call(
+        f"parse-{payload}[{parser}]",
+        lambda: instance.parse(io.BytesIO(body)),
+    )
@@ -0,0 +1,84 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from api.pantry import pantry_index
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("benchmark", "endpoint benchmarks")
+    group.addoption(
+        "--benchmark",
+        action="store_true",
+        help="Run tests marked benchmark (skipped by default)",
+    )
+    group.addoption(
+        "--benchmark-scales",
+        default="small",
+        help="Comma-separated dataset scales: small, medium, large",
+    )
+    group.addoption(
+        "--benchmark-rounds",
+        type=int,
+        default=20,
+        help="Timed requests per endpoint after a warm-up request",
+    )
+    group.addoption(
+        "--benchmark-json",
+        default=None,
+        help="Write results to this JSON file",
+    )
+    group.addoption(
+        "--benchmark-baseline",
+        default=None,
+        help="Fail on regressions against this JSON file",
+    )
+    group.addoption(
+        "--benchmark-tolerance",
+        type=float,
+        default=0.2,
+        help="Allowed relative p95 slowdown against the baseline",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("benchmark"):
+        return
+    skip = pytest.mark.skip(reason="benchmarks run only with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(autouse=True)
+def fast_password_hasher(settings):
+    settings.PASSWORD_HASHERS = [
+        "django.contrib.auth.hashers.MD5PasswordHasher"
+    ]
+
+
+@pytest.fixture
+def isolated(settings, tmp_path, monkeypatch):
+    """
+    Медиа и индекс похожих рецептов во временном каталоге, индекс
+    кладовой перестраивается в самом запросе, журнал медленных
+    запросов выключен
+    """
+    settings.MEDIA_ROOT = str(tmp_path / "media")
+    settings.SIMILARITY_INDEX_DIR = str(tmp_path / "similarity")
+    settings.SLOW_QUERY_THRESHOLD_MS = float("inf")
+    settings.SLOW_QUERY_REPEAT_LIMIT = 10**9
+    monkeypatch.setattr("api.similarity.RELOAD_CHECK_INTERVAL", 0)
+    monkeypatch.setattr(pantry_index, "background_rebuild", False)
+
+
+@pytest.fixture(scope="session")
+def png_data_url():
+    """Картинка 8x8 в формате data URL для полей изображений"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), (230, 160, 90)).save(buffer, "PNG")
+    return (
+        "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+    )
@@ -0,0 +1,66 @@
+import factory
+from factory.django import DjangoModelFactory, Password
+
+from api.models import Ingredient, Recipe, RecipeIngredient, Tag, User
+
+PASSWORD = "factory-password"
+
+
+class UserFactory(DjangoModelFactory):
+    class Meta:
+        model = User
+
+    username = factory.Sequence(lambda n: f"user{n}")
+    email = factory.LazyAttribute(lambda user: f"{user.username}@example.com")
+    first_name = factory.Faker("first_name", locale="ru_RU")
+    last_name = factory.Faker("last_name", locale="ru_RU")
+    password = Password(PASSWORD)
+
+
+class TagFactory(DjangoModelFactory):
+    class Meta:
+        model = Tag
+
+    name = factory.Sequence(lambda n: f"Тег {n}")
+    slug = factory.Sequence(lambda n: f"tag-{n}")
+
+
+class IngredientFactory(DjangoModelFactory):
+    class Meta:
+        model = Ingredient
+
+    name = factory.Sequence(lambda n: f"ингредиент {n}")
+    measurement_unit = "г"
+
+
+class RecipeFactory(DjangoModelFactory):
+    """
+    Рецепт с тегами и ингредиентами:
+    RecipeFactory(tags=[...], ingredients=[...]). Файл изображения не
+    создается — сериализаторам достаточно имени
+    """
+
+    class Meta:
+        model = Recipe
+        skip_postgeneration_save = True
+
+    author = factory.SubFactory(UserFactory)
+    name = factory.Sequence(lambda n: f"Рецепт {n}")
+    text = factory.Faker("paragraph", locale="ru_RU")
+    cooking_time = 30
+    image = "recipes/factory.png"
+
+    @factory.post_generation
+    def tags(self, create, extracted, **kwargs):
+        if create and extracted:
+            self.tags.set(extracted)
+
+    @factory.post_generation
+    def ingredients(self, create, extracted, **kwargs):
+        if create and extracted:
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=self, ingredient=ingredient, amount=100
+                )
+                for ingredient in extracted
+            )
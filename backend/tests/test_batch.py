@@ -0,0 +1,228 @@
+"""
+Пакетный эндпоинт: подзапросы к синхронным и асинхронным вьюхам
+проходят цепочку middleware, потоковые маршруты отклоняются
+"""
+
+from contextvars import ContextVar
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.constants import BATCH_MAX_REQUESTS
+from api.models import Favorite
+
+from .factories import (
+    IngredientFactory,
+    RecipeFactory,
+    TagFactory,
+    UserFactory,
+)
+
+URL = "/api/batch/"
+
+
+@pytest.fixture
+def world(db, isolated):
+    cache.clear()
+    tag = TagFactory()
+    recipe = RecipeFactory(tags=[tag], ingredients=[IngredientFactory()])
+    user = UserFactory()
+    token = Token.objects.create(user=user).key
+    return tag, recipe, user, token
+
+
+def batch(client, *requests, parallel=False):
+    response = client.post(
+        URL,
+        {"requests": list(requests), "parallel": parallel},
+        content_type="application/json",
+    )
+    assert response.status_code == 200, response.content
+    return response, response.json()["responses"]
+
+
+def async_routes(tag, recipe):
+    return [
+        {"id": "tags", "url": "/api/tags/"},
+        {"id": "tag", "url": f"/api/tags/{tag.pk}/"},
+        {"id": "me", "url": "/api/users/me/"},
+        {"id": "recipe", "url": f"/api/recipes/{recipe.pk}/"},
+        {"id": "recipes", "url": "/api/recipes/?limit=1"},
+    ]
+
+
+def test_async_routes(world):
+    tag, recipe, user, token = world
+    client = Client(headers={"Authorization": f"Token {token}"})
+    _, responses = batch(client, *async_routes(tag, recipe))
+    assert [item["status"] for item in responses] == [200] * 5
+    by_id = {item["id"]: item["body"] for item in responses}
+    assert by_id["tags"][0]["slug"] == tag.slug
+    assert by_id["tag"]["id"] == tag.pk
+    assert by_id["me"]["id"] == user.pk
+    assert by_id["recipe"]["id"] == recipe.pk
+    assert by_id["recipes"]["count"] == 1
+
+
+def test_async_routes_under_asgi(world):
+    tag, recipe, _, token = world
+    # Заголовки AsyncClient передаются как заголовки ASGI-scope.
+    response = async_to_sync(AsyncClient().post)(
+        URL,
+        {"requests": async_routes(tag, recipe)},
+        content_type="application/json",
+        AUTHORIZATION=f"Token {token}",
+    )
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()["responses"]] == [
+        200
+    ] * 5
+
+
+def test_anonymous_subrequest_is_cached(world):
+    tag, _, _, _ = world
+    batch(Client(), {"url": "/api/tags/"})
+    assert Client().get("/api/tags/")["X-Cache"] == "HIT"
+
+
+def test_subrequest_authenticates_itself(world):
+    _, recipe, user, token = world
+    client = Client(headers={"Authorization": f"Token {token}"})
+    _, responses = batch(
+        client,
+        {"method": "POST", "url": f"/api/recipes/{recipe.pk}/favorite/"},
+    )
+    assert responses[0]["status"] == 201
+    assert Favorite.objects.filter(user=user, recipe=recipe).exists()
+
+    _, responses = batch(
+        Client(),
+        {"method": "POST", "url": f"/api/recipes/{recipe.pk}/favorite/"},
+    )
+    assert responses[0]["status"] == 401
+
+
+def test_batch_authenticates_once(world):
+    tag, recipe, user, token = world
+    client = Client(headers={"Authorization": f"Token {token}"})
+    with CaptureQueriesContext(connection) as queries:
+        _, responses = batch(
+            client,
+            *async_routes(tag, recipe),
+            {"method": "POST", "url": f"/api/recipes/{recipe.pk}/favorite/"},
+        )
+    assert [item["status"] for item in responses] == [200] * 5 + [201]
+    assert responses[2]["body"]["id"] == user.pk
+    token_queries = [
+        query["sql"]
+        for query in queries.captured_queries
+        if Token._meta.db_table in query["sql"]
+    ]
+    assert len(token_queries) == 1
+
+
+def test_invalid_token_fails_whole_batch(world):
+    client = Client(headers={"Authorization": "Token invalid"})
+    response = client.post(
+        URL,
+        {"requests": [{"url": "/api/tags/"}]},
+        content_type="application/json",
+    )
+    assert response.status_code == 401
+
+
+@pytest.mark.parametrize(
+    "url, status",
+    [
+        ("/api/events/", 400),
+        ("/api/batch/", 400),
+        ("/admin/", 400),
+        ("/api/missing/", 404),
+    ],
+)
+def test_refused_targets(world, url, status):
+    _, _, _, token = world
+    client = Client(headers={"Authorization": f"Token {token}"})
+    _, responses = batch(client, {"id": "x", "url": url})
+    assert responses[0]["id"] == "x"
+    assert responses[0]["status"] == status
+
+
+def test_writes_pin_later_subrequests_to_primary(world, settings, monkeypatch):
+    settings.DATABASE_REPLICAS = ["replica"]
+
+    def choice(replicas):
+        raise AssertionError("the read must go to the primary")
+
+    monkeypatch.setattr("api.middleware.random.choice", choice)
+    _, responses = batch(
+        Client(),
+        {
+            "method": "POST",
+            "url": "/api/users/",
+            "body": {
+                "email": "new@example.com",
+                "username": "new",
+                "first_name": "Новый",
+                "last_name": "Пользователь",
+                "password": "new-password-123",
+            },
+        },
+        {"url": "/api/tags/"},
+    )
+    assert [item["status"] for item in responses] == [201, 200]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_reads(isolated):
+    cache.clear()
+    tags = TagFactory.create_batch(3)
+    _, responses = batch(
+        Client(),
+        *({"id": tag.slug, "url": f"/api/tags/{tag.pk}/"} for tag in tags),
+        parallel=True,
+    )
+    assert [item["id"] for item in responses] == [tag.slug for tag in tags]
+    assert [item["body"]["id"] for item in responses] == [
+        tag.pk for tag in tags
+    ]
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"requests": [{"method": "get", "url": "/api/tags/"}]},
+        {"requests": []},
+        {"requests": [{"url": "/api/tags/"}] * (BATCH_MAX_REQUESTS + 1)},
+    ],
+)
+def test_invalid_batch(db, payload):
+    response = Client().post(URL, payload, content_type="application/json")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db(transaction=True)
+def test_parallel_workers_see_request_context(isolated, monkeypatch):
+    probe = ContextVar("probe", default=None)
+    seen = []
+
+    def run_subrequest(request, item, cookies):
+        seen.append(probe.get())
+        return {"id": item["id"], "status": 200, "headers": {}, "body": None}
+
+    monkeypatch.setattr("api.batch._run_subrequest", run_subrequest)
+    token = probe.set("batch")
+    try:
+        batch(
+            Client(),
+            *({"id": str(number), "url": "/api/tags/"} for number in range(3)),
+            parallel=True,
+        )
+    finally:
+        probe.reset(token)
+    assert seen == ["batch"] * 3
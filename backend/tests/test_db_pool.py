@@ -0,0 +1,103 @@
+"""
+Соединения с БД: настройки пула и постоянных соединений из окружения
+и служебный эндпоинт со статистикой пула
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from .factories import UserFactory
+
+URL = "/api/internal/db-pool/"
+
+
+def database_settings(**env):
+    """DATABASES["default"] при импорте настроек с переменными env"""
+    script = (
+        "import json, foodgram.settings as s; "
+        "print(json.dumps(s.DATABASES['default']))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        env={**os.environ, **env},
+        cwd=settings.BASE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def test_pool_replaces_persistent_connections():
+    database = database_settings(
+        DB_ENGINE="django.db.backends.postgresql",
+        DB_POOL="True",
+        DB_POOL_MAX_SIZE="4",
+        DB_CONN_MAX_AGE="60",
+    )
+    assert database["CONN_MAX_AGE"] == 0
+    assert database["OPTIONS"]["pool"] == {
+        "min_size": 2,
+        "max_size": 4,
+        "timeout": 10.0,
+        "max_idle": 600.0,
+    }
+
+
+def test_persistent_connections_without_pool():
+    database = database_settings(
+        DB_ENGINE="django.db.backends.postgresql",
+        DB_POOL="false",
+        DB_CONN_MAX_AGE="30",
+        DB_CONN_HEALTH_CHECKS="false",
+    )
+    assert "OPTIONS" not in database
+    assert (database["CONN_MAX_AGE"], database["CONN_HEALTH_CHECKS"]) == (
+        30,
+        False,
+    )
+
+
+def test_pool_is_postgresql_only():
+    database = database_settings(
+        DB_ENGINE="django.db.backends.sqlite3", DB_POOL="True"
+    )
+    assert "OPTIONS" not in database
+
+
+def client_for(user):
+    token = Token.objects.create(user=user).key
+    return Client(headers={"Authorization": f"Token {token}"})
+
+
+@pytest.mark.django_db
+def test_endpoint_is_staff_only():
+    assert Client().get(URL).status_code == 401
+    assert client_for(UserFactory()).get(URL).status_code == 403
+
+
+@pytest.mark.django_db
+def test_endpoint_reports_pool_stats(monkeypatch):
+    class Pool:
+        def get_stats(self):
+            return {"pool_size": 3, "pool_available": 1}
+
+    monkeypatch.setattr(connection, "pool", Pool(), raising=False)
+    response = client_for(UserFactory(is_staff=True)).get(URL)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["pid"] == os.getpid()
+    assert data["databases"]["default"] == {
+        "vendor": connection.vendor,
+        "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+        "conn_health_checks": connection.settings_dict["CONN_HEALTH_CHECKS"],
+        "pool": {"pool_size": 3, "pool_available": 1},
+    }
@@ -0,0 +1,77 @@
+"""
+Чтение с реплик: роутер БД и закрепление клиента за основной БД
+после записи
+"""
+
+import pytest
+from django.core.cache import cache
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from api.db_routers import ReplicaRouter, replica_alias
+from api.models import Recipe
+
+from .factories import RecipeFactory, UserFactory
+
+router = ReplicaRouter()
+
+
+@pytest.fixture
+def replicas(settings, isolated, monkeypatch):
+    """
+    Одна реплика: выбор реплики записывается, а читается все равно
+    основная БД
+    """
+    settings.DATABASE_REPLICAS = ["replica"]
+    chosen = []
+
+    def choice(aliases):
+        chosen.append(aliases[0])
+        return "default"
+
+    monkeypatch.setattr("api.middleware.random.choice", choice)
+    cache.clear()
+    return chosen
+
+
+def test_reads_follow_selected_replica():
+    token = replica_alias.set("replica")
+    try:
+        assert router.db_for_read(Recipe) == "replica"
+        assert router.db_for_read(Token) is None
+    finally:
+        replica_alias.reset(token)
+    assert router.db_for_read(Recipe) is None
+    assert router.db_for_write(Recipe) == "default"
+
+
+@pytest.mark.parametrize(
+    "db, allowed", [("default", True), ("replica", False)]
+)
+def test_migrations_only_on_primary(db, allowed):
+    assert router.allow_migrate(db, "api") is allowed
+
+
+@pytest.mark.django_db
+def test_safe_read_uses_replica(replicas):
+    RecipeFactory()
+    assert Client().get("/api/recipes/").status_code == 200
+    assert Client().get("/api/users/").status_code == 200
+    assert replicas == ["replica", "replica"]
+
+
+@pytest.mark.django_db
+def test_write_pins_cookie_and_token(replicas):
+    recipe = RecipeFactory()
+    user = UserFactory()
+    token = Token.objects.create(user=user).key
+    client = Client(headers={"Authorization": f"Token {token}"})
+    response = client.post(f"/api/recipes/{recipe.pk}/favorite/")
+    assert response.status_code == 201
+    assert "db_primary" in response.cookies
+
+    client.get("/api/users/")
+    Client(headers={"Authorization": f"Token {token}"}).get("/api/users/")
+    assert replicas == []
+    Client().get("/api/users/")
+    assert replicas == ["replica"]
@@ -0,0 +1,203 @@
+"""
+Поток событий: билеты вместо токена в строке запроса, подписка на
+время чтения потока и доставка событий подписчику
+"""
+
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.test import AsyncRequestFactory, Client
+from rest_framework.authtoken.models import Token
+
+from api import events
+from api.models import ChangeLogEntry, Subscription
+
+from .factories import RecipeFactory, UserFactory
+
+URL = "/api/events/"
+
+
+@pytest.fixture
+def people(db, isolated, settings):
+    settings.EVENTS_BACKEND = "api.events.LocalBackend"
+    user, author = UserFactory.create_batch(2)
+    Subscription.objects.create(user=user, author=author)
+    return user, author
+
+
+def ticket_for(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    response = Client(headers={"Authorization": f"Token {token.key}"}).post(
+        "/api/events/ticket/"
+    )
+    assert response.status_code == 200
+    return response.json()["ticket"]
+
+
+def open_stream(**params):
+    return async_to_sync(events.events_view)(
+        AsyncRequestFactory().get(URL, params)
+    )
+
+
+def test_ticket_requires_authentication(db):
+    assert Client().post("/api/events/ticket/").status_code == 401
+
+
+def test_wsgi_is_refused(people):
+    user, _ = people
+    response = Client().get(URL, {"ticket": ticket_for(user)})
+    assert response.status_code == 501
+
+
+def test_ticket_opens_stream_without_subscribing(people):
+    user, _ = people
+    response = open_stream(ticket=ticket_for(user))
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/event-stream"
+    # Поток еще не читали: клиент мог уйти до начала ответа.
+    assert not events.broker._subscribers
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {},
+        {"token": "key"},
+        {"ticket": "forged"},
+        {"ticket": signing.TimestampSigner(salt="other").sign("1")},
+    ],
+)
+def test_stream_refuses_without_valid_ticket(people, params):
+    user, _ = people
+    if "token" in params:
+        params["token"] = Token.objects.create(user=user).key
+    assert open_stream(**params).status_code == 401
+
+
+def test_expired_ticket(people, monkeypatch):
+    user, _ = people
+    ticket = ticket_for(user)
+    monkeypatch.setattr("api.events.EVENTS_TICKET_MAX_AGE", -1)
+    assert open_stream(ticket=ticket).status_code == 401
+
+
+def test_stream_delivers_and_unsubscribes(people):
+    user, author = people
+    other = UserFactory()
+    response = open_stream(ticket=ticket_for(user))
+
+    async def read():
+        stream = response.streaming_content
+        assert (await anext(stream)).startswith(b"retry:")
+        (subscriber,) = events.broker._subscribers
+        events.broker.dispatch(
+            {"type": events.RECIPE_CREATED, "recipe_id": 1, "author_id": 0}
+        )
+        events.broker.dispatch(
+            {
+                "type": events.SUBSCRIPTION_CHANGED,
+                "author_id": other.pk,
+                "action": "added",
+                "user_id": user.pk,
+            }
+        )
+        first = (await anext(stream)).decode()
+        # Новая подписка учитывается для следующих событий.
+        events.broker.dispatch(
+            {
+                "type": events.RECIPE_UPDATED,
+                "recipe_id": 2,
+                "author_id": other.pk,
+            }
+        )
+        second = (await anext(stream)).decode()
+        await stream.aclose()
+        return subscriber, first, second
+
+    subscriber, first, second = async_to_sync(read)()
+    assert first.startswith(f"event: {events.SUBSCRIPTION_CHANGED}\n")
+    assert "user_id" not in first
+    assert second.startswith(f"event: {events.RECIPE_UPDATED}\n")
+    assert subscriber.followed_ids == {author.pk, other.pk}
+    assert not events.broker._subscribers
+
+
+def test_local_backend_refuses_several_workers(monkeypatch):
+    monkeypatch.setenv("GUNICORN_WORKERS", "3")
+    with pytest.raises(ImproperlyConfigured):
+        events.LocalBackend()
+    monkeypatch.setenv("GUNICORN_WORKERS", "1")
+    events.LocalBackend()
+
+
+def test_change_log_entries_become_events(people):
+    user, author = people
+    recipe = RecipeFactory(author=author)
+    entries = list(ChangeLogEntry.objects.order_by("id"))
+    converted = list(events.ChangeLogBackend._to_events(entries))
+    assert {
+        "type": events.SUBSCRIPTION_CHANGED,
+        "author_id": author.pk,
+        "action": "added",
+        "user_id": user.pk,
+    } in converted
+    assert {
+        "type": events.RECIPE_CREATED,
+        "recipe_id": recipe.pk,
+        "author_id": author.pk,
+    } in converted
+
+
+def test_subscriber_wants(people):
+    user, author = people
+
+    async def check():
+        subscriber = events.Subscriber(user.pk, [author.pk])
+        return [
+            subscriber.wants(
+                {"type": events.RECIPE_CREATED, "author_id": author.pk}
+            ),
+            subscriber.wants(
+                {"type": events.RECIPE_CREATED, "author_id": user.pk}
+            ),
+            subscriber.wants(
+                {"type": events.SHOPPING_CART_CHANGED, "user_id": user.pk}
+            ),
+            subscriber.wants(
+                {"type": events.SHOPPING_CART_CHANGED, "user_id": author.pk}
+            ),
+        ]
+
+    assert async_to_sync(check)() == [True, False, True, False]
+
+
+def test_dead_subscriber_does_not_block_others(monkeypatch):
+    broker = events.EventBroker()
+    monkeypatch.setattr(events, "get_backend", events.LocalBackend)
+
+    async def subscribe(user_id):
+        return broker.subscribe(user_id, [1])
+
+    loops = [asyncio.new_event_loop() for _ in range(3)]
+    dead, alive, broken = (
+        loop.run_until_complete(subscribe(number))
+        for number, loop in enumerate(loops)
+    )
+    loops[0].close()
+    monkeypatch.setattr(
+        broken, "wants", lambda event: event["missing"], raising=False
+    )
+    event = {"type": events.RECIPE_CREATED, "recipe_id": 1, "author_id": 1}
+    try:
+        broker.dispatch(event)
+        loops[1].run_until_complete(asyncio.sleep(0))
+        assert alive.queue.get_nowait() == event
+        # Подписчик с закрытым loop отписан, с ошибкой — остается.
+        assert broker._subscribers == {alive, broken}
+    finally:
+        for loop in loops[1:]:
+            loop.close()
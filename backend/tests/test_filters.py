@@ -0,0 +1,175 @@
+"""
+Фильтры списка рецептов: теги, автор, избранное, список покупок,
+ингредиенты, время приготовления и сортировки
+"""
+
+import pytest
+from django.core.cache import cache
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from api.models import Favorite, Recipe, RecipeTrend, ShoppingCart
+from api.trending import recount_popularity
+
+from .factories import (
+    IngredientFactory,
+    RecipeFactory,
+    TagFactory,
+    UserFactory,
+)
+
+
+class Kitchen:
+    """Три рецепта с разными тегами, ингредиентами и временем"""
+
+    def __init__(self):
+        self.breakfast, self.dinner = TagFactory.create_batch(2)
+        self.egg, self.milk, self.fish = IngredientFactory.create_batch(3)
+        self.user = UserFactory()
+        self.token = Token.objects.create(user=self.user).key
+        self.omelette = RecipeFactory(
+            tags=[self.breakfast],
+            ingredients=[self.egg, self.milk],
+            cooking_time=10,
+            name="Омлет",
+        )
+        self.porridge = RecipeFactory(
+            tags=[self.breakfast, self.dinner],
+            ingredients=[self.milk],
+            cooking_time=20,
+            name="Каша",
+        )
+        self.fish_soup = RecipeFactory(
+            author=self.user,
+            tags=[self.dinner],
+            ingredients=[self.fish],
+            cooking_time=60,
+            name="Уха",
+        )
+
+
+@pytest.fixture
+def kitchen(db, isolated):
+    cache.clear()
+    return Kitchen()
+
+
+def names(response):
+    assert response.status_code == 200, response.content
+    return {recipe["name"] for recipe in response.json()["results"]}
+
+
+def test_tags_match_any(kitchen):
+    response = Client().get(
+        "/api/recipes/", {"tags": [kitchen.breakfast.slug]}
+    )
+    assert names(response) == {"Омлет", "Каша"}
+    response = Client().get(
+        "/api/recipes/",
+        {"tags": [kitchen.breakfast.slug, kitchen.dinner.slug]},
+    )
+    assert names(response) == {"Омлет", "Каша", "Уха"}
+
+
+def test_unknown_tag_is_rejected(kitchen):
+    assert Client().get("/api/recipes/?tags=missing").status_code == 400
+
+
+def test_author(kitchen):
+    response = Client().get(f"/api/recipes/?author={kitchen.user.pk}")
+    assert names(response) == {"Уха"}
+
+
+@pytest.mark.parametrize(
+    "flag, model",
+    [("is_favorited", Favorite), ("is_in_shopping_cart", ShoppingCart)],
+)
+def test_user_flags(kitchen, flag, model):
+    model.objects.create(user=kitchen.user, recipe=kitchen.porridge)
+    client = Client(headers={"Authorization": f"Token {kitchen.token}"})
+    assert names(client.get(f"/api/recipes/?{flag}=1")) == {"Каша"}
+    assert len(names(client.get(f"/api/recipes/?{flag}=0"))) == 3
+    # Анониму флаг ничего не отфильтровывает.
+    assert len(names(Client().get(f"/api/recipes/?{flag}=1"))) == 3
+
+
+def ordered(response):
+    assert response.status_code == 200, response.content
+    return [recipe["name"] for recipe in response.json()["results"]]
+
+
+def test_ingredients_match_all(kitchen):
+    response = Client().get(
+        f"/api/recipes/?ingredients={kitchen.egg.pk},{kitchen.milk.pk}"
+    )
+    assert names(response) == {"Омлет"}
+
+
+def test_exclude_ingredients(kitchen):
+    response = Client().get(
+        f"/api/recipes/?exclude_ingredients={kitchen.egg.pk},"
+        f"{kitchen.fish.pk}"
+    )
+    assert names(response) == {"Каша"}
+
+
+def test_cooking_time_range(kitchen):
+    response = Client().get(
+        "/api/recipes/?cooking_time_min=15&cooking_time_max=60"
+    )
+    assert names(response) == {"Каша", "Уха"}
+
+
+@pytest.mark.parametrize(
+    "ordering, expected",
+    [
+        ("name", ["Каша", "Омлет", "Уха"]),
+        ("-cooking_time", ["Уха", "Каша", "Омлет"]),
+    ],
+)
+def test_ordering(kitchen, ordering, expected):
+    assert ordered(Client().get(f"/api/recipes/?ordering={ordering}")) == (
+        expected
+    )
+
+
+def test_popularity_counter_follows_relations(kitchen):
+    other = UserFactory()
+    client = Client(headers={"Authorization": f"Token {kitchen.token}"})
+    for path in ("favorite", "shopping_cart"):
+        response = client.post(f"/api/recipes/{kitchen.fish_soup.pk}/{path}/")
+        assert response.status_code == 201
+    Favorite.objects.create(user=other, recipe=kitchen.omelette)
+    kitchen.fish_soup.refresh_from_db()
+    assert kitchen.fish_soup.popularity == 2
+    assert ordered(Client().get("/api/recipes/?ordering=-popularity")) == [
+        "Уха",
+        "Омлет",
+        "Каша",
+    ]
+
+    response = client.delete(f"/api/recipes/{kitchen.fish_soup.pk}/favorite/")
+    assert response.status_code == 204
+    kitchen.fish_soup.refresh_from_db()
+    assert kitchen.fish_soup.popularity == 1
+
+
+def test_recount_popularity(kitchen):
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=user, recipe=kitchen.porridge)
+        for user in UserFactory.create_batch(2)
+    )
+    Recipe.objects.filter(pk=kitchen.omelette.pk).update(popularity=5)
+    recount_popularity()
+    assert dict(Recipe.objects.values_list("name", "popularity")) == {
+        "Омлет": 0,
+        "Каша": 2,
+        "Уха": 0,
+    }
+
+
+def test_trending_ordering_puts_unranked_last(kitchen):
+    RecipeTrend.objects.create(recipe=kitchen.porridge, score=1.0)
+    assert ordered(Client().get("/api/recipes/?ordering=-trending"))[0] == (
+        "Каша"
+    )
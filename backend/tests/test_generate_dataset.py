@@ -0,0 +1,155 @@
+"""
+Генератор тестового набора данных: состав и связи рецептов,
+воспроизводимость по seed, счетчики подписчиков и ленты подписок
+"""
+
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import Count, F
+
+from api.models import (
+    Favorite,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Subscription,
+    Tag,
+    TimelineEntry,
+    User,
+)
+
+from .factories import UserFactory
+
+INGREDIENTS = [
+    ("мука", "г"),
+    ("молоко", "мл"),
+    ("яйцо", "шт."),
+    ("соль", "по вкусу"),
+    ("сахар", "г"),
+    ("масло", "г"),
+    ("вода", "мл"),
+    ("лук", "шт."),
+]
+
+
+@pytest.fixture
+def csv_path(db, isolated, tmp_path, monkeypatch):
+    # Порог fan-out ниже, чтобы в маленьком наборе были популярные авторы.
+    for module in ("api.timeline", "api.management.commands.generate_dataset"):
+        monkeypatch.setattr(f"{module}.TIMELINE_FANOUT_MAX_FOLLOWERS", 3)
+    path = tmp_path / "ingredients.csv"
+    path.write_text(
+        "\n".join(f"{name},{unit}" for name, unit in INGREDIENTS),
+        encoding="utf-8",
+    )
+    return path
+
+
+def generate(csv_path, **options):
+    out = StringIO()
+    options = {
+        "users": 30,
+        "recipes": 60,
+        "following": 4,
+        "favorites": 3,
+        "carts": 2,
+        "seed": 1,
+        "prefix": "dataset",
+        "csv": str(csv_path),
+        "batch_size": 7,
+        **options,
+    }
+    call_command("generate_dataset", stdout=out, **options)
+    return out.getvalue()
+
+
+def test_dataset(csv_path):
+    output = generate(csv_path)
+    assert "Dataset generated" in output
+    assert Ingredient.objects.count() == len(INGREDIENTS)
+    assert Tag.objects.exists()
+    assert User.objects.filter(username__startswith="dataset").count() == 30
+    assert Recipe.objects.count() == 60
+    for model in (
+        Recipe,
+        RecipeIngredient,
+        Subscription,
+        Favorite,
+        ShoppingCart,
+        TimelineEntry,
+    ):
+        assert f"{model.__name__}: {model.objects.count()}\n" in output
+
+    recipes = Recipe.objects.annotate(
+        ingredient_count=Count("recipe_ingredients", distinct=True),
+        tag_count=Count("tags", distinct=True),
+    )
+    assert all(
+        recipe.ingredient_count and recipe.tag_count for recipe in recipes
+    )
+    assert not Subscription.objects.filter(user=F("author")).exists()
+    for model in (Favorite, ShoppingCart):
+        assert not model.objects.filter(
+            created__lt=F("recipe__pub_date")
+        ).exists()
+
+
+def test_followers_and_timelines(csv_path):
+    generate(csv_path)
+    authors = User.objects.annotate(total=Count("following"))
+    assert all(author.followers_count == author.total for author in authors)
+    celebrities = {author.pk for author in authors if author.total > 3}
+    assert celebrities
+    assert celebrities == set(
+        User.objects.filter(is_celebrity=True).values_list("pk", flat=True)
+    )
+    expected = {
+        (subscription.user_id, recipe.pk)
+        for subscription in Subscription.objects.exclude(
+            author__in=celebrities
+        )
+        for recipe in Recipe.objects.filter(author=subscription.author_id)
+    }
+    assert (
+        set(TimelineEntry.objects.values_list("user_id", "recipe_id"))
+        == expected
+    )
+
+
+def test_skip_timeline(csv_path):
+    generate(csv_path, skip_timeline=True)
+    assert not TimelineEntry.objects.exists()
+
+
+def test_same_seed_gives_same_dataset(csv_path):
+    def snapshot(prefix):
+        recipes = Recipe.objects.filter(author__username__startswith=prefix)
+        return (
+            list(
+                recipes.order_by("id").values_list(
+                    "name", "text", "cooking_time"
+                )
+            ),
+            Subscription.objects.filter(
+                user__username__startswith=prefix
+            ).count(),
+            Favorite.objects.filter(user__username__startswith=prefix).count(),
+        )
+
+    generate(csv_path, prefix="first")
+    generate(csv_path, prefix="second")
+    generate(csv_path, prefix="third", seed=2)
+    assert snapshot("first") == snapshot("second")
+    assert snapshot("first") != snapshot("third")
+
+
+def test_invalid_options(csv_path):
+    with pytest.raises(CommandError, match="--users"):
+        generate(csv_path, users=1)
+    UserFactory(username="dataset-taken")
+    with pytest.raises(CommandError, match="already exist"):
+        generate(csv_path)
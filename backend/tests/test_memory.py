@@ -0,0 +1,130 @@
+"""
+Замеры памяти tracemalloc: места выделения, записи по запросам под
+WSGI и ASGI и сводный отчет memory_report
+"""
+
+import os
+import threading
+import tracemalloc
+from io import StringIO
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import AsyncClient, Client
+
+from api import memory
+
+URL = "/api/tags/"
+
+
+@pytest.fixture
+def tracing(db, isolated, settings, tmp_path):
+    settings.TRACEMALLOC_SAMPLE_RATE = 1
+    settings.TRACEMALLOC_DIR = str(tmp_path / "memory")
+    cache.clear()
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start(settings.TRACEMALLOC_FRAMES)
+    yield settings.TRACEMALLOC_DIR
+    memory.pending.join()
+    if started:
+        tracemalloc.stop()
+
+
+def samples(directory):
+    memory.pending.join()
+    return list(memory.read_samples(directory))
+
+
+def allocate():
+    return [bytearray(1024) for _ in range(100)]
+
+
+def test_sites_point_to_allocating_code(tracing):
+    memory.Sample()
+    kept = allocate()
+    (site, (size, count)), *_ = memory.Sample._sites(
+        tracemalloc.take_snapshot()
+    )
+    assert site.startswith("tests/test_memory.py:")
+    assert size >= 100 * 1024
+    assert count >= 100
+    assert len(kept) == 100
+
+
+def test_sync_request_is_sampled(tracing):
+    Client().get(URL)
+    (record,) = samples(tracing)
+    assert (record["route"], record["method"], record["status"]) == (
+        "tags-list",
+        "GET",
+        200,
+    )
+    assert record["pid"] == os.getpid()
+    assert record["peak"] >= record["retained"] >= 0
+    assert record["sites"]
+    assert not memory._sampling.locked()
+
+
+def test_requests_outside_rate_are_not_sampled(tracing, settings):
+    settings.TRACEMALLOC_SAMPLE_RATE = 0
+    Client().get(URL)
+    assert not os.path.exists(tracing)
+
+
+def test_busy_sampler_skips_request(tracing):
+    with memory._sampling:
+        Client().get(URL)
+    assert not os.path.exists(tracing)
+
+
+@pytest.fixture
+def blocked_finish(monkeypatch):
+    """Запись замера ждет release; потоки, в которых она выполнялась"""
+    release = threading.Event()
+    threads = []
+    finish = memory.Sample.finish
+
+    def blocked(sample):
+        release.wait(5)
+        threads.append(threading.current_thread().name)
+        finish(sample)
+
+    monkeypatch.setattr(memory.Sample, "finish", blocked)
+    return release, threads
+
+
+def test_response_does_not_wait_for_sample(tracing, blocked_finish):
+    release, threads = blocked_finish
+    assert Client().get(URL).status_code == 200
+    assert threads == []
+    # Пока замер не записан, следующий запрос не измеряется.
+    assert memory._sampling.locked()
+    Client().get(URL)
+    release.set()
+    assert [record["route"] for record in samples(tracing)] == ["tags-list"]
+    assert threads == ["memory-samples"]
+    assert not memory._sampling.locked()
+
+
+def test_asgi_response_does_not_wait_for_sample(tracing, blocked_finish):
+    release, threads = blocked_finish
+    response = async_to_sync(AsyncClient().get)(URL)
+    assert response.status_code == 200
+    assert threads == []
+    release.set()
+    assert [record["route"] for record in samples(tracing)] == ["tags-list"]
+    assert threads == ["memory-samples"]
+
+
+def test_memory_report(tracing):
+    Client().get(URL)
+    memory.pending.join()
+    Client().get(URL)
+    memory.pending.join()
+    out = StringIO()
+    call_command("memory_report", dir=tracing, clear=True, stdout=out)
+    assert "tags-list" in out.getvalue()
+    assert not os.path.exists(tracing)
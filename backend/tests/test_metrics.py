@@ -0,0 +1,112 @@
+"""
+Метрики запросов: Server-Timing, счетчики кеша в бэкенде кеша,
+время сериализаторов и доступ к /metrics
+"""
+
+import re
+
+import pytest
+from django.core.cache import cache
+from django.test import Client
+
+from api import metrics
+from api.serializers import TagSerializer
+
+from .factories import TagFactory, UserFactory
+
+URL = "/metrics"
+
+
+def server_timing(response):
+    parts = re.split(r", (?=\w+;)", response["Server-Timing"])
+    return dict(part.split(";", 1) for part in parts)
+
+
+@pytest.fixture
+def request_metrics():
+    request_metrics = metrics.RequestMetrics()
+    token = metrics.current.set(request_metrics)
+    yield request_metrics
+    metrics.current.reset(token)
+
+
+def test_cache_lookups_are_counted(request_metrics):
+    cache.clear()
+    cache.set("first", 1)
+    cache.set("empty", None)
+    assert cache.get("first") == 1
+    assert cache.get("empty", "default") is None
+    assert cache.get("absent", "default") == "default"
+    assert cache.get_many(["first", "absent"]) == {"first": 1}
+    assert (request_metrics.cache_hits, request_metrics.cache_misses) == (
+        3,
+        2,
+    )
+
+
+def test_cache_without_request_is_not_counted():
+    cache.clear()
+    assert cache.get("absent") is None
+    assert metrics.current.get() is None
+
+
+def test_serializer_time_counts_outer_call_once(db, request_metrics):
+    tags = TagFactory.create_batch(3)
+    data = TagSerializer(tags, many=True).data
+    assert len(data) == 3
+    assert request_metrics.serializer_time > 0
+    assert request_metrics.serializer_depth == 0
+
+
+def test_server_timing_header(db, isolated):
+    cache.clear()
+    TagFactory()
+    response = Client().get("/api/tags/")
+    timing = server_timing(response)
+    assert set(timing) == {"db", "serializer", "cache", "view"}
+    assert re.fullmatch(r'dur=[\d.]+;desc="[1-9]\d* queries"', timing["db"])
+    assert re.fullmatch(r'desc="\d+ hit, [1-9]\d* miss"', timing["cache"])
+    assert float(timing["serializer"].removeprefix("dur=")) > 0
+
+
+def test_metrics_are_exported(db):
+    Client().get("/api/tags/")
+    response = Client().get(URL)
+    assert response.status_code == 200
+    assert b'foodgram_requests_total{method="GET",route="tags-list"' in (
+        response.content
+    )
+
+
+@pytest.mark.django_db
+def test_metrics_refused_outside_allowed_networks(settings):
+    settings.METRICS_ALLOWED_NETWORKS = ["10.0.0.0/8"]
+    assert Client().get(URL).status_code == 403
+    response = Client(REMOTE_ADDR="10.1.2.3").get(URL)
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_metrics_token(settings):
+    settings.METRICS_ALLOWED_NETWORKS = []
+    settings.METRICS_TOKEN = "secret"
+    assert Client().get(URL).status_code == 403
+    for header in ("Bearer wrong", "Token secret", "Bearer"):
+        client = Client(headers={"Authorization": header})
+        assert client.get(URL).status_code == 403
+    client = Client(headers={"Authorization": "Bearer secret"})
+    assert client.get(URL).status_code == 200
+
+    settings.METRICS_TOKEN = ""
+    client = Client(headers={"Authorization": "Bearer "})
+    assert client.get(URL).status_code == 403
+
+
+@pytest.mark.django_db
+def test_metrics_for_staff(settings):
+    settings.METRICS_ALLOWED_NETWORKS = []
+    client = Client()
+    client.force_login(UserFactory())
+    assert client.get(URL).status_code == 403
+    client.force_login(UserFactory(is_staff=True))
+    assert client.get(URL).status_code == 200
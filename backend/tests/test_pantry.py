@@ -0,0 +1,134 @@
+"""
+Индекс кладовой: подбор рецептов, дельты изменений между процессами
+и перестройка в фоне
+"""
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.pantry import PANTRY_DELTA_KEY, PANTRY_GENERATION_KEY, PantryIndex
+from api.pantry import pantry_index as index
+
+from .factories import (
+    IngredientFactory,
+    RecipeFactory,
+    TagFactory,
+    UserFactory,
+)
+
+
+@pytest.fixture
+def ingredients(db, isolated):
+    cache.clear()
+    return IngredientFactory.create_batch(4)
+
+
+def matches(pantry, ingredients, max_missing=0):
+    return [
+        row[0]
+        for row in pantry.match(
+            [ingredient.pk for ingredient in ingredients], max_missing
+        )
+    ]
+
+
+def test_match_ranks_by_coverage(ingredients):
+    egg, milk, flour, fish = ingredients
+    omelette = RecipeFactory(ingredients=[egg, milk])
+    pancakes = RecipeFactory(ingredients=[egg, milk, flour])
+    RecipeFactory(ingredients=[fish])
+    index.rebuild()
+    assert matches(index, [egg, milk]) == [omelette.pk]
+    assert matches(index, [egg, milk], max_missing=1) == [
+        omelette.pk,
+        pancakes.pk,
+    ]
+
+
+def test_endpoint(ingredients):
+    egg, milk, _, _ = ingredients
+    recipe = RecipeFactory(ingredients=[egg, milk])
+    response = Client().get(f"/api/recipes/pantry/?ingredients={egg.pk}")
+    assert response.status_code == 200
+    assert response.json()["results"] == []
+    response = Client().get(
+        f"/api/recipes/pantry/?ingredients={egg.pk}&max_missing=1"
+    )
+    [item] = response.json()["results"]
+    assert (item["id"], item["matched_count"], item["missing_count"]) == (
+        recipe.pk,
+        1,
+        1,
+    )
+
+
+def test_other_process_applies_deltas_without_db(
+    ingredients, png_data_url, django_capture_on_commit_callbacks
+):
+    egg, milk, flour, _ = ingredients
+    author = UserFactory()
+    old = RecipeFactory(author=author, ingredients=[egg])
+    other = PantryIndex()
+    other.rebuild()
+    client = Client(
+        headers={
+            "Authorization": f"Token {Token.objects.create(user=author).key}"
+        }
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(
+            "/api/recipes/",
+            {
+                "name": "Блины",
+                "text": "Описание",
+                "cooking_time": 20,
+                "image": png_data_url,
+                "tags": [TagFactory().pk],
+                "ingredients": [
+                    {"id": milk.pk, "amount": 100},
+                    {"id": flour.pk, "amount": 100},
+                ],
+            },
+            content_type="application/json",
+        )
+        assert response.status_code == 201, response.content
+        assert client.delete(f"/api/recipes/{old.pk}/").status_code == 204
+
+    with CaptureQueriesContext(connection) as captured:
+        assert matches(other, [egg, milk, flour]) == [response.json()["id"]]
+    assert len(captured) == 0
+
+
+def test_missing_delta_rebuilds(ingredients):
+    egg, milk, _, _ = ingredients
+    index.rebuild()
+    recipe = RecipeFactory(ingredients=[egg, milk])
+    index.update_recipe(recipe.pk, [egg.pk, milk.pk])
+    cache.delete(PANTRY_DELTA_KEY.format(cache.get(PANTRY_GENERATION_KEY)))
+    assert matches(index, [egg, milk]) == [recipe.pk]
+
+
+def test_invalidate_rebuilds(ingredients):
+    egg, _, _, _ = ingredients
+    index.rebuild()
+    recipe = RecipeFactory(ingredients=[egg])
+    index.invalidate()
+    assert matches(index, [egg]) == [recipe.pk]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_rebuild_runs_in_background(isolated, monkeypatch):
+    cache.clear()
+    egg = IngredientFactory()
+    index.rebuild()
+    monkeypatch.setattr(index, "background_rebuild", True)
+    recipe = RecipeFactory(ingredients=[egg])
+    index.invalidate()
+    # Запрос отвечает по прежнему индексу, пока фон собирает новый.
+    assert matches(index, [egg]) in ([], [recipe.pk])
+    index._rebuild_thread.join(10)
+    assert matches(index, [egg]) == [recipe.pk]
@@ -0,0 +1,161 @@
+"""
+Профилирование запросов сотрудников: формат из заголовка или
+параметра, лимиты, сохранение профиля под WSGI и ASGI
+"""
+
+import os
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import AsyncClient, Client, RequestFactory
+from rest_framework.authtoken.models import Token
+
+from api import profiling
+from api.models import RequestProfile
+
+from .factories import TagFactory, UserFactory
+
+URL = "/api/tags/"
+
+
+@pytest.fixture
+def staff(db, isolated, settings, tmp_path):
+    settings.PROFILER_ENABLED = True
+    settings.PROFILER_DIR = str(tmp_path / "profiles")
+    settings.PROFILER_RATE_LIMIT = 10
+    settings.PROFILER_MAX_CONCURRENT = 1
+    settings.RESPONSE_CACHE_TIMEOUT = 0
+    cache.clear()
+    TagFactory()
+    return UserFactory(is_staff=True)
+
+
+def token_for(user):
+    return Token.objects.get_or_create(user=user)[0].key
+
+
+def get(user, profile="pstats", path=URL):
+    headers = {"X-Profile": profile}
+    if user is not None:
+        headers["Authorization"] = f"Token {token_for(user)}"
+    return Client(headers=headers).get(path)
+
+
+@pytest.mark.parametrize(
+    "headers, params, expected",
+    [
+        ({}, {}, None),
+        ({"X-Profile": "pstats"}, {}, RequestProfile.Format.PSTATS),
+        ({"X-Profile": "1"}, {}, RequestProfile.Format.SPEEDSCOPE),
+        ({}, {"profile": "speedscope"}, RequestProfile.Format.SPEEDSCOPE),
+    ],
+)
+def test_requested_format(settings, headers, params, expected):
+    settings.PROFILER_ENABLED = True
+    request = RequestFactory(
+        headers={**headers, "Authorization": "Token key"}
+    ).get(URL, params)
+    assert profiling.requested_format(request) == expected
+    settings.PROFILER_ENABLED = False
+    assert profiling.requested_format(request) is None
+
+
+@pytest.mark.parametrize("profile_format", list(RequestProfile.Format.values))
+def test_staff_request_is_profiled(staff, profile_format):
+    response = get(staff, profile_format)
+    assert response.status_code == 200
+    profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+    assert (
+        profile.user,
+        profile.method,
+        profile.path,
+        profile.route,
+        profile.status_code,
+        profile.format,
+    ) == (staff, "GET", URL, "tags-list", 200, profile_format)
+    assert profile.filename.endswith(profiling.EXTENSIONS[profile_format])
+    assert os.path.getsize(profiling.profile_path(profile)) > 0
+    # Место освобождено.
+    assert profiling._acquire_slot() is not None
+
+
+def test_session_staff_is_profiled(staff):
+    client = Client()
+    client.force_login(staff)
+    response = client.get(URL, {"profile": "speedscope"})
+    assert "X-Profile-Id" in response
+
+
+@pytest.mark.parametrize("is_staff", [False, None])
+def test_others_are_not_profiled(staff, is_staff):
+    user = None if is_staff is None else UserFactory(is_staff=is_staff)
+    response = get(user)
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response
+    assert not RequestProfile.objects.exists()
+
+
+def test_anonymous_flag_costs_nothing(
+    staff, settings, django_assert_num_queries
+):
+    settings.RESPONSE_CACHE_TIMEOUT = 300
+    path = f"{URL}?profile=pstats"
+    Client().get(path)
+    # Ни поиска сотрудника, ни промаха кеша ответов.
+    with django_assert_num_queries(0):
+        response = Client(headers={"X-Profile": "pstats"}).get(path)
+    assert response["X-Cache"] == "HIT"
+    assert "X-Profile-Id" not in response
+    assert not profiling.requested_format(
+        RequestFactory(headers={"X-Profile": "pstats"}).get(URL)
+    )
+
+
+def test_rate_limit(staff, settings):
+    settings.PROFILER_RATE_LIMIT = 1
+    assert get(staff).status_code == 200
+    response = get(staff)
+    assert response.status_code == 429
+    assert RequestProfile.objects.count() == 1
+
+
+def test_busy_slots(staff):
+    slot = profiling._acquire_slot()
+    response = get(staff)
+    assert response.status_code == 429
+    profiling.release(slot)
+    assert get(staff).status_code == 200
+
+
+def test_profiler_disabled(staff, settings):
+    settings.PROFILER_ENABLED = False
+    assert "X-Profile-Id" not in get(staff)
+
+
+def test_asgi_request_is_profiled(staff):
+    # Заголовки AsyncClient передаются как заголовки ASGI-scope.
+    response = async_to_sync(AsyncClient().get)(
+        URL,
+        AUTHORIZATION=f"Token {token_for(staff)}",
+        X_PROFILE="speedscope",
+    )
+    assert response.status_code == 200
+    profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+    assert profile.format == RequestProfile.Format.SPEEDSCOPE
+    assert os.path.exists(profiling.profile_path(profile))
+
+
+def test_admin_download(staff):
+    profile = RequestProfile.objects.get(pk=get(staff)["X-Profile-Id"])
+    client = Client()
+    client.force_login(UserFactory(is_staff=True, is_superuser=True))
+    response = client.get(f"/admin/api/requestprofile/{profile.pk}/download/")
+    assert response.status_code == 200
+    assert response["Content-Disposition"].endswith(
+        f'filename="{profile.filename}"'
+    )
+
+    os.remove(profiling.profile_path(profile))
+    response = client.get(f"/admin/api/requestprofile/{profile.pk}/download/")
+    assert response.status_code == 404
@@ -0,0 +1,354 @@
+"""
+Бюджеты SQL-запросов для каждого действия роутера api/urls.py.
+
+Бюджет — максимум запросов на один HTTP-запрос анонима и пользователя
+с токеном. Он не зависит от числа строк в ответе: каждый запрос
+выполняется на данных растущего размера (SIZES), и рост числа
+запросов с размером (N+1) выходит за бюджет на большем размере.
+"""
+
+from collections import Counter
+
+import pytest
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.models import (
+    Favorite,
+    RecipeTrend,
+    ShoppingCart,
+    Subscription,
+    TimelineEntry,
+)
+from api.pantry import pantry_index
+from api.similarity import build_index
+from api.slow_queries import normalize
+from api.trending import decayed_at
+from api.urls import router
+
+from .factories import (
+    PASSWORD,
+    IngredientFactory,
+    RecipeFactory,
+    TagFactory,
+    UserFactory,
+)
+
+SIZES = (1, 3, 8)
+# Страница больше любого размера: в ответ попадают все строки.
+PAGE = {"limit": 50}
+ANONYMOUS = "anonymous"
+AUTHENTICATED = "authenticated"
+
+
+class World:
+    """
+    Данные размера size: size авторов по два рецепта, на всех подписан
+    читатель, их рецепты у него в избранном, в списке покупок и в ленте.
+    У читателя свой рецепт, у постороннего автора — size рецептов.
+    image — data URL картинки для рецептов и аватара
+    """
+
+    def __init__(self, size, image):
+        self.size = size
+        self.image = image
+        self.tags = TagFactory.create_batch(size + 1)
+        self.ingredients = IngredientFactory.create_batch(size + 3)
+        self.reader = UserFactory()
+        self.token = Token.objects.create(user=self.reader).key
+        self.authors = UserFactory.create_batch(size)
+        self.recipes = [
+            self.recipe(author, number)
+            for author in self.authors
+            for number in range(2)
+        ]
+        self.own = self.recipe(self.reader, size)
+        self.stranger = UserFactory()
+        self.target = self.recipe(self.stranger, 0)
+        for number in range(1, size):
+            self.recipe(self.stranger, number)
+
+        Subscription.objects.bulk_create(
+            Subscription(user=self.reader, author=author)
+            for author in self.authors
+        )
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=self.reader, recipe=recipe)
+                for recipe in self.recipes
+            )
+        RecipeTrend.objects.bulk_create(
+            RecipeTrend(recipe=recipe, score=1.0) for recipe in self.recipes
+        )
+        TimelineEntry.objects.bulk_create(
+            TimelineEntry(
+                user=self.reader,
+                recipe=recipe,
+                author=recipe.author,
+                pub_date=recipe.pub_date,
+            )
+            for recipe in self.recipes
+        )
+        build_index(full=True)
+        pantry_index.invalidate()
+
+    def recipe(self, author, number):
+        """Рецепты делят первые два ингредиента: они похожи между собой"""
+        return RecipeFactory(
+            author=author,
+            tags=self.tags[number % 2 : number % 2 + 2],
+            ingredients=[
+                *self.ingredients[:2],
+                self.ingredients[2 + number % (len(self.ingredients) - 2)],
+            ],
+        )
+
+    def recipe_payload(self):
+        return {
+            "name": f"Новый рецепт {self.size}",
+            "text": "Описание",
+            "cooking_time": 15,
+            "image": self.image,
+            "tags": [tag.pk for tag in self.tags],
+            "ingredients": [
+                {"id": ingredient.pk, "amount": 10}
+                for ingredient in self.ingredients
+            ],
+        }
+
+    def user_payload(self):
+        return {
+            "email": f"new{self.size}@example.com",
+            "username": f"new{self.size}",
+            "first_name": "Новый",
+            "last_name": "Пользователь",
+            "password": "new-password-123",
+        }
+
+
+# (маршрут, метод): функция World -> (путь, данные) и для анонима и
+# пользователя — (ожидаемый статус, бюджет запросов).
+BUDGETS = {
+    ("users-list", "get"): (
+        lambda w: ("/api/users/", PAGE),
+        {ANONYMOUS: (200, 2), AUTHENTICATED: (200, 3)},
+    ),
+    ("users-list", "post"): (
+        lambda w: ("/api/users/", w.user_payload()),
+        {ANONYMOUS: (201, 3), AUTHENTICATED: (201, 4)},
+    ),
+    ("users-avatar", "put"): (
+        lambda w: ("/api/users/me/avatar/", {"avatar": w.image}),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (200, 2)},
+    ),
+    ("users-avatar", "delete"): (
+        lambda w: ("/api/users/me/avatar/", None),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (204, 2)},
+    ),
+    ("users-me", "get"): (
+        lambda w: ("/api/users/me/", None),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (200, 2)},
+    ),
+    ("users-set-password", "post"): (
+        lambda w: (
+            "/api/users/set_password/",
+            {"current_password": PASSWORD, "new_password": "new-pass-123"},
+        ),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (204, 2)},
+    ),
+    ("users-subscriptions", "get"): (
+        lambda w: ("/api/users/subscriptions/", PAGE),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (200, 4)},
+    ),
+    ("users-detail", "get"): (
+        lambda w: (f"/api/users/{w.authors[0].pk}/", None),
+        {ANONYMOUS: (200, 1), AUTHENTICATED: (200, 2)},
+    ),
+    ("users-subscribe", "post"): (
+        lambda w: (f"/api/users/{w.stranger.pk}/subscribe/", None),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (201, 11)},
+    ),
+    ("users-subscribe", "delete"): (
+        lambda w: (f"/api/users/{w.authors[0].pk}/subscribe/", None),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (204, 6)},
+    ),
+    ("tags-list", "get"): (
+        lambda w: ("/api/tags/", None),
+        {ANONYMOUS: (200, 1), AUTHENTICATED: (200, 2)},
+    ),
+    ("tags-detail", "get"): (
+        lambda w: (f"/api/tags/{w.tags[0].pk}/", None),
+        {ANONYMOUS: (200, 1), AUTHENTICATED: (200, 2)},
+    ),
+    ("ingredients-list", "get"): (
+        lambda w: ("/api/ingredients/", {"name": "ингр"}),
+        {ANONYMOUS: (200, 1), AUTHENTICATED: (200, 2)},
+    ),
+    ("ingredients-detail", "get"): (
+        lambda w: (f"/api/ingredients/{w.ingredients[0].pk}/", None),
+        {ANONYMOUS: (200, 1), AUTHENTICATED: (200, 2)},
+    ),
+    ("recipes-list", "get"): (
+        lambda w: ("/api/recipes/", PAGE),
+        {ANONYMOUS: (200, 5), AUTHENTICATED: (200, 6)},
+    ),
+    ("recipes-list", "post"): (
+        lambda w: ("/api/recipes/", w.recipe_payload()),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (201, 17)},
+    ),
+    ("recipes-batch", "post"): (
+        lambda w: (
+            "/api/recipes/batch/",
+            {"ids": [recipe.pk for recipe in w.recipes]},
+        ),
+        {ANONYMOUS: (200, 4), AUTHENTICATED: (200, 5)},
+    ),
+    ("recipes-download-shopping-cart", "get"): (
+        lambda w: ("/api/recipes/download_shopping_cart/", None),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (200, 2)},
+    ),
+    ("recipes-feed", "get"): (
+        lambda w: ("/api/recipes/feed/", PAGE),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (200, 7)},
+    ),
+    ("recipes-pantry", "get"): (
+        lambda w: (
+            "/api/recipes/pantry/",
+            {
+                **PAGE,
+                "ingredients": ",".join(
+                    str(ingredient.pk) for ingredient in w.ingredients
+                ),
+            },
+        ),
+        {ANONYMOUS: (200, 4), AUTHENTICATED: (200, 5)},
+    ),
+    ("recipes-trending", "get"): (
+        lambda w: ("/api/recipes/trending/", PAGE),
+        {ANONYMOUS: (200, 5), AUTHENTICATED: (200, 6)},
+    ),
+    ("recipes-detail", "get"): (
+        lambda w: (f"/api/recipes/{w.own.pk}/", None),
+        {ANONYMOUS: (200, 4), AUTHENTICATED: (200, 5)},
+    ),
+    ("recipes-detail", "put"): (
+        lambda w: (f"/api/recipes/{w.own.pk}/", w.recipe_payload()),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (200, 18)},
+    ),
+    ("recipes-detail", "patch"): (
+        lambda w: (
+            f"/api/recipes/{w.own.pk}/",
+            {
+                key: value
+                for key, value in w.recipe_payload().items()
+                if key in ("tags", "ingredients")
+            },
+        ),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (200, 18)},
+    ),
+    ("recipes-detail", "delete"): (
+        lambda w: (f"/api/recipes/{w.own.pk}/", None),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (204, 11)},
+    ),
+    ("recipes-favorite", "post"): (
+        lambda w: (f"/api/recipes/{w.target.pk}/favorite/", None),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (201, 10)},
+    ),
+    ("recipes-favorite", "delete"): (
+        lambda w: (f"/api/recipes/{w.recipes[0].pk}/favorite/", None),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (204, 7)},
+    ),
+    ("recipes-shopping-cart", "post"): (
+        lambda w: (f"/api/recipes/{w.target.pk}/shopping_cart/", None),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (201, 10)},
+    ),
+    ("recipes-shopping-cart", "delete"): (
+        lambda w: (f"/api/recipes/{w.recipes[0].pk}/shopping_cart/", None),
+        {ANONYMOUS: (401, 0), AUTHENTICATED: (204, 7)},
+    ),
+    ("recipes-get-link", "get"): (
+        lambda w: (f"/api/recipes/{w.own.pk}/get-link/", None),
+        {ANONYMOUS: (200, 1), AUTHENTICATED: (200, 2)},
+    ),
+    ("recipes-similar", "get"): (
+        lambda w: (f"/api/recipes/{w.own.pk}/similar/", None),
+        {ANONYMOUS: (200, 5), AUTHENTICATED: (200, 6)},
+    ),
+}
+
+
+def router_actions():
+    """Пары (имя маршрута, HTTP-метод) всех действий роутера"""
+    actions = set()
+    for _, viewset, basename in router.registry:
+        for route in router.get_routes(viewset):
+            mapping = router.get_method_map(viewset, route.mapping)
+            name = route.name.format(basename=basename)
+            actions.update((name, method) for method in mapping)
+    return actions
+
+
+def explain_queries(queries):
+    """Список SQL с отметкой повторов: так видно, какой запрос растет"""
+    repeats = Counter(normalize(query["sql"]) for query in queries)
+    lines = []
+    for number, query in enumerate(queries, 1):
+        count = repeats[normalize(query["sql"])]
+        mark = f" [x{count}]" if count > 1 else ""
+        lines.append(f"{number}.{mark} {query['sql']}")
+    return "\n".join(lines)
+
+
+def measure(world, user, method, path, data):
+    """Один запрос на холодном кеше; возвращает ответ и запросы к БД"""
+    headers = {}
+    if user == AUTHENTICATED:
+        headers["Authorization"] = f"Token {world.token}"
+    client = Client(headers=headers)
+    # Кеш ответов и кеши вьюх сбрасываются, чтобы считались запросы
+    # построения ответа; индекс кладовой и момент затухания трендов
+    # прогреваются заранее.
+    cache.clear()
+    pantry_index.ensure_fresh()
+    decayed_at()
+    with CaptureQueriesContext(connection) as captured:
+        if method == "get":
+            response = client.get(path, data)
+        else:
+            response = getattr(client, method)(
+                path, data, content_type="application/json"
+            )
+    return response, captured.captured_queries
+
+
+def test_every_router_action_has_budget():
+    assert router_actions() == set(BUDGETS)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("user", [ANONYMOUS, AUTHENTICATED])
+@pytest.mark.parametrize(
+    "action", sorted(BUDGETS), ids=lambda action: "-".join(action)
+)
+def test_query_budget(isolated, png_data_url, action, user):
+    build, expected = BUDGETS[action]
+    status, budget = expected[user]
+    route, method = action
+    for size in SIZES:
+        with transaction.atomic():
+            world = World(size, png_data_url)
+            path, data = build(world)
+            response, queries = measure(world, user, method, path, data)
+            transaction.set_rollback(True)
+        assert response.status_code == status, (
+            f"{method.upper()} {path} (size {size}): "
+            f"{response.status_code} {response.content[:500]!r}"
+        )
+        assert len(queries) <= budget, (
+            f"{method.upper()} {route} as {user}, size {size}: "
+            f"{len(queries)} queries, budget {budget}\n"
+            + explain_queries(queries)
+        )
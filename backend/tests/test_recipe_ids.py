@@ -0,0 +1,63 @@
+"""
+Рецепты по списку id: GET ?ids= и POST /api/recipes/batch/
+"""
+
+import pytest
+from django.core.cache import cache
+from django.test import Client
+
+from api.constants import RECIPE_IDS_MAX
+
+from .factories import RecipeFactory
+
+
+@pytest.fixture
+def recipes(db, isolated):
+    cache.clear()
+    return RecipeFactory.create_batch(3)
+
+
+def ids_of(response):
+    assert response.status_code == 200, response.content
+    return [recipe["id"] for recipe in response.json()]
+
+
+def test_query_keeps_requested_order(recipes):
+    first, second, third = (recipe.pk for recipe in recipes)
+    response = Client().get(f"/api/recipes/?ids={third},{first},{third}")
+    assert ids_of(response) == [third, first]
+
+
+def test_body_accepts_ints_and_digit_strings(recipes):
+    first, second, _ = (recipe.pk for recipe in recipes)
+    response = Client().post(
+        "/api/recipes/batch/",
+        {"ids": [second, str(first), 10**6]},
+        content_type="application/json",
+    )
+    assert ids_of(response) == [second, first]
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        [1, 2],
+        {"ids": [1.9]},
+        {"ids": [True]},
+        {"ids": ["1.5"]},
+        {"ids": ["-1"]},
+        {"ids": [None]},
+        {"ids": []},
+        {"ids": list(range(1, RECIPE_IDS_MAX + 2))},
+    ],
+)
+def test_invalid_body(recipes, body):
+    response = Client().post(
+        "/api/recipes/batch/", body, content_type="application/json"
+    )
+    assert response.status_code == 400
+    assert "ids" in response.json()
+
+
+def test_invalid_query(recipes):
+    assert Client().get("/api/recipes/?ids=1,x").status_code == 400
@@ -0,0 +1,100 @@
+"""
+FastJSONRenderer и FastJSONParser: тот же JSON, что у стандартных
+классов DRF, и откат на них без orjson. Без установленного orjson
+тесты проверяют только откат
+"""
+
+import datetime
+import decimal
+import io
+import json
+import uuid
+
+import pytest
+from django.core.cache import cache
+from django.test import Client
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ErrorDetail, ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer
+
+from .factories import IngredientFactory, RecipeFactory, TagFactory
+
+PAYLOAD = {
+    "aware": timezone.now(),
+    "naive": datetime.datetime(2024, 1, 1, 12, 0, 0, 123),
+    "date": datetime.date(2024, 1, 1),
+    "time": datetime.time(1, 2, 3, 4000),
+    "decimal": decimal.Decimal("1.10"),
+    "timedelta": datetime.timedelta(seconds=90),
+    "lazy": gettext_lazy("Hello"),
+    "uuid": uuid.UUID(int=1),
+    1: "integer key",
+    "errors": [ErrorDetail("Обязательное поле.", code="required")],
+    "separator": "строка с разделителем",
+    "nested": {"list": [1, 2.5, None, True], "empty": {}},
+}
+
+
+def test_render_matches_stock_renderer():
+    assert FastJSONRenderer().render(PAYLOAD) == JSONRenderer().render(PAYLOAD)
+
+
+def test_unsupported_data_falls_back_to_stock_renderer():
+    data = {"big": 2**70}
+    assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+def test_indent_falls_back_to_stock_renderer():
+    media_type = "application/json; indent=4"
+    assert FastJSONRenderer().render(
+        PAYLOAD, media_type
+    ) == JSONRenderer().render(PAYLOAD, media_type)
+
+
+def test_renderer_without_orjson(monkeypatch):
+    monkeypatch.setattr("api.renderers.orjson", None)
+    assert FastJSONRenderer().render(PAYLOAD) == JSONRenderer().render(PAYLOAD)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "path", ["/api/recipes/?limit=20", "/api/ingredients/", "/api/tags/"]
+)
+def test_api_responses_match_stock_renderer(path, settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    tags = TagFactory.create_batch(3)
+    ingredients = IngredientFactory.create_batch(5)
+    RecipeFactory.create_batch(20, tags=tags, ingredients=ingredients)
+    cache.clear()
+    response = Client().get(path)
+    assert response.status_code == 200
+    assert response.content == JSONRenderer().render(response.data)
+
+
+def test_parse_matches_stock_parser():
+    body = JSONRenderer().render(
+        {"name": "Борщ", "ingredients": [{"id": 1, "amount": 10}]}
+    )
+    assert FastJSONParser().parse(io.BytesIO(body)) == JSONParser().parse(
+        io.BytesIO(body)
+    )
+
+
+@pytest.mark.parametrize("body", [b"{", b'{"a": NaN}', b"\xff"])
+def test_parse_error_matches_stock_parser(body):
+    with pytest.raises(ParseError) as stock:
+        JSONParser().parse(io.BytesIO(body))
+    with pytest.raises(ParseError) as fast:
+        FastJSONParser().parse(io.BytesIO(body))
+    assert str(fast.value) == str(stock.value)
+
+
+def test_parser_without_orjson(monkeypatch):
+    monkeypatch.setattr("api.parsers.orjson", None)
+    body = json.dumps({"name": "Борщ"}).encode()
+    assert FastJSONParser().parse(io.BytesIO(body)) == {"name": "Борщ"}
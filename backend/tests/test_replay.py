@@ -0,0 +1,81 @@
+"""
+Воспроизведение postman-коллекции: разбор коллекции и полный прогон
+виртуальных пользователей против live_server
+"""
+
+import pytest
+from django.db import connection
+
+from api.management.commands.replay_load import DEFAULT_COLLECTION
+from api.replay import (
+    ReplayError,
+    Scenario,
+    identities,
+    load_collection,
+    run_load,
+)
+
+from .factories import IngredientFactory, TagFactory
+
+ITERATIONS = 2
+
+
+@pytest.fixture(scope="module")
+def collection():
+    return load_collection(DEFAULT_COLLECTION)
+
+
+def test_collection_keeps_successful_requests(collection):
+    variables, steps = collection
+    assert steps
+    assert all(step.status < 400 for step in steps)
+    captured = {name for step in steps for name, _, _ in step.captures}
+    assert {
+        "userToken",
+        "secondUserToken",
+        "firstRecipeId",
+        "ingredientNameFirstLatter",
+    } <= captured
+
+
+def test_identities_are_unique_per_virtual_user(collection):
+    variables, _ = collection
+    first = identities(variables, "load-1")
+    second = identities(variables, "load-2")
+    assert first["email"] != second["email"]
+    assert first["secondUserUsername"] != second["secondUserUsername"]
+    assert first["password"] == second["password"] == variables["password"]
+
+
+def test_flow_without_its_variables_is_rejected(collection):
+    variables, steps = collection
+    with pytest.raises(ReplayError, match="firstRecipeId"):
+        Scenario(steps, variables, ["favorite"])
+
+
+def test_replay_has_no_errors(collection, live_server, isolated):
+    TagFactory.create_batch(3)
+    IngredientFactory.create_batch(2)
+    # SQLite в памяти у live_server одно соединение на все потоки:
+    # параллельные записи блокируют таблицы.
+    users = 1 if connection.vendor == "sqlite" else 2
+    variables, steps = collection
+    scenario = Scenario(steps, variables)
+    summary = run_load(
+        scenario,
+        variables,
+        live_server.url,
+        users,
+        "test",
+        iterations=ITERATIONS,
+    ).summary()
+    failures = {
+        name: step["error_examples"]
+        for name, step in summary["steps"].items()
+        if step["errors"]
+    }
+    assert not failures
+    assert summary["iterations"] == users * ITERATIONS
+    assert summary["requests"] == users * (
+        len(scenario.setup) + ITERATIONS * len(scenario.loop)
+    )
@@ -0,0 +1,107 @@
+"""
+Кеш анонимных ответов: ключ записи, попадания и сброс по суррогатным
+ключам при изменении данных
+"""
+
+import time
+
+import pytest
+from django.core.cache import cache
+from django.test import Client, RequestFactory
+from rest_framework.authtoken.models import Token
+
+from api import response_cache
+
+from .factories import IngredientFactory, RecipeFactory, TagFactory
+
+
+@pytest.fixture
+def recipe(db, isolated, settings, django_capture_on_commit_callbacks):
+    settings.RESPONSE_CACHE_SURROGATE_HEADER = True
+    cache.clear()
+    with django_capture_on_commit_callbacks(execute=True):
+        return RecipeFactory(
+            tags=[TagFactory()], ingredients=[IngredientFactory()]
+        )
+
+
+def get(path, **headers):
+    response = Client(headers=headers).get(path)
+    assert response.status_code == 200, response.content
+    return response
+
+
+def key(path, **headers):
+    return response_cache.request_key(
+        RequestFactory(headers=headers).get(path)
+    )
+
+
+def test_request_key_normalizes_query(db):
+    assert key("/api/recipes/?b=2&a=1&c=") == key("/api/recipes/?a=1&b=2")
+    assert key("/api/recipes/?a=1") != key("/api/recipes/?a=2")
+    assert key("/api/recipes/", Accept="text/html") != key("/api/recipes/")
+    assert key("/api/users/") is None
+    assert key("/api/recipes/", Authorization="Token x") is None
+
+
+def test_hit_after_miss(recipe):
+    path = f"/api/recipes/{recipe.pk}/"
+    first = get(path)
+    assert first["X-Cache"] == "MISS"
+    second = get(path)
+    assert second["X-Cache"] == "HIT"
+    assert second.content == first.content
+    assert set(second["Surrogate-Key"].split()) >= {
+        response_cache.recipe_key(recipe.pk),
+        response_cache.user_key(recipe.author_id),
+    }
+    assert "Authorization" in second["Vary"]
+
+
+def test_authenticated_requests_bypass_cache(recipe):
+    token = Token.objects.create(user=recipe.author).key
+    get("/api/recipes/")
+    response = get("/api/recipes/", Authorization=f"Token {token}")
+    assert "X-Cache" not in response
+
+
+def test_change_purges_dependent_entries(
+    recipe, django_capture_on_commit_callbacks
+):
+    tag = recipe.tags.get()
+    paths = ["/api/recipes/", f"/api/recipes/{recipe.pk}/", "/api/tags/"]
+    for path in paths:
+        get(path)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        tag.name = "Новое имя"
+        tag.save()
+    for path in paths:
+        assert get(path)["X-Cache"] == "MISS"
+    assert get("/api/tags/").json()[0]["name"] == "Новое имя"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        RecipeFactory()
+    assert get("/api/recipes/")["X-Cache"] == "MISS"
+    assert get("/api/tags/")["X-Cache"] == "HIT"
+
+
+def test_response_built_before_purge_is_not_stored(recipe):
+    request = RequestFactory().get("/api/tags/")
+    started = time.time_ns()
+    response = Client().get("/api/tags/")
+    response.surrogate_keys = {response_cache.TAGS_KEY}
+    response_cache.purge(response_cache.TAGS_KEY)
+    assert (
+        response_cache.store(
+            response_cache.request_key(request), response, started
+        )
+        is None
+    )
+
+
+def test_disabled_cache(recipe, settings):
+    settings.RESPONSE_CACHE_TIMEOUT = 0
+    get("/api/tags/")
+    assert "X-Cache" not in get("/api/tags/")
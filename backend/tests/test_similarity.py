@@ -0,0 +1,134 @@
+"""
+Индекс похожих рецептов: версии на диске с атомарной заменой указателя
+и инкрементальная сборка по журналу изменений
+"""
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from api.models import ChangeLogEntry, RecipeIngredient
+from api.similarity import (
+    BANDS,
+    KEEP_VERSIONS,
+    SimilarityIndex,
+    band_hashes,
+    build_index,
+    current_version,
+    index_dir,
+)
+
+from .factories import IngredientFactory, RecipeFactory
+
+
+@pytest.fixture
+def kitchen(db, isolated, monkeypatch):
+    """Три рецепта: два почти совпадают по ингредиентам, третий другой"""
+    monkeypatch.setattr("api.sync.SYNC_SAFETY_LAG_SECONDS", 0)
+    cache.clear()
+    ingredients = IngredientFactory.create_batch(12)
+    recipes = [
+        RecipeFactory(ingredients=ingredients[:6]),
+        RecipeFactory(ingredients=ingredients[:5]),
+        RecipeFactory(ingredients=ingredients[6:]),
+    ]
+    return ingredients, recipes
+
+
+def load(version):
+    path = index_dir() / version
+    return {
+        name: np.load(path / f"{name}.npy")
+        for name in ("recipe_ids", "signatures", "band_hashes", "band_order")
+    }
+
+
+def assert_consistent(arrays):
+    """Полосы отсортированы и указывают на сигнатуры своих рецептов"""
+    hashes = band_hashes(arrays["signatures"])
+    assert (np.diff(arrays["recipe_ids"]) > 0).all()
+    for band in range(BANDS):
+        order = arrays["band_order"][band]
+        assert sorted(order.tolist()) == list(range(len(order)))
+        assert (arrays["band_hashes"][band] == hashes[band][order]).all()
+        assert (np.diff(arrays["band_hashes"][band].astype(float)) >= 0).all()
+
+
+def test_similar_endpoint(kitchen):
+    _, (omelette, scramble, soup) = kitchen
+    assert build_index() == (3, 3, 0)
+    response = Client().get(f"/api/recipes/{omelette.pk}/similar/")
+    assert response.status_code == 200
+    ids = [item["id"] for item in response.json()]
+    assert ids[0] == scramble.pk
+    assert soup.pk not in ids
+
+
+def test_pointer_switches_between_versions(kitchen):
+    _, (omelette, scramble, _) = kitchen
+    build_index()
+    reader = SimilarityIndex()
+    first = current_version()
+    assert reader.similar(omelette.pk, 5)[0][0] == scramble.pk
+
+    for _ in range(KEEP_VERSIONS + 1):
+        build_index(full=True)
+    versions = sorted(path.name for path in index_dir().glob("v*"))
+    assert len(versions) == KEEP_VERSIONS
+    assert current_version() == versions[-1] != first
+    assert not list(index_dir().glob("*.tmp"))
+    # Старая версия удалена с диска: читатель переходит на текущую.
+    assert reader.similar(omelette.pk, 5)[0][0] == scramble.pk
+    assert reader._version == versions[-1]
+
+
+def test_incremental_build_reads_only_changed_recipes(kitchen):
+    ingredients, (omelette, scramble, soup) = kitchen
+    build_index()
+    added = RecipeFactory(ingredients=ingredients[:6])
+    scramble.delete()
+
+    with CaptureQueriesContext(connection) as captured:
+        assert build_index() == (3, 1, 1)
+    rows = [
+        query["sql"]
+        for query in captured
+        if RecipeIngredient._meta.db_table in query["sql"]
+    ]
+    assert len(rows) == 1
+    assert str(added.pk) in rows[0]
+    assert str(omelette.pk) not in rows[0]
+
+    arrays = load(current_version())
+    assert arrays["recipe_ids"].tolist() == [omelette.pk, soup.pk, added.pk]
+    assert_consistent(arrays)
+    full = build_index(full=True)
+    assert full == (3, 3, 0)
+    assert (
+        load(current_version())["signatures"] == arrays["signatures"]
+    ).all()
+    assert SimilarityIndex().similar(omelette.pk, 5)[0] == (added.pk, 1.0)
+
+
+def test_unchanged_log_keeps_rows(kitchen):
+    build_index()
+    before = load(current_version())
+    assert build_index() == (3, 0, 0)
+    after = load(current_version())
+    for name, array in before.items():
+        assert (after[name] == array).all()
+
+
+def test_purged_log_falls_back_to_full_build(kitchen):
+    ingredients, _ = kitchen
+    build_index()
+    cursor = ChangeLogEntry.objects.latest("id").id
+    RecipeFactory(ingredients=ingredients[:3])
+    RecipeFactory(ingredients=ingredients[3:])
+    # Очистка журнала удалила первую запись после курсора индекса.
+    ChangeLogEntry.objects.filter(id__lte=cursor + 1).delete()
+    assert build_index() == (5, 5, 0)
+    assert_consistent(load(current_version()))
@@ -0,0 +1,152 @@
+"""
+Пересборка записей кеша ответов: один лидер на ключ, прежняя запись
+(STALE) на время пересборки и никакой STALE после сброса
+"""
+
+import threading
+import time
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from api import response_cache
+from api.middleware import AnonymousResponseCacheMiddleware
+from api.single_flight import (
+    LocalFlights,
+    acquire_lease,
+    local_flights,
+    release_lease,
+)
+
+PATH = "/api/tags/"
+
+
+class View:
+    """Медленная вьюха: считает вызовы и отдает номер вызова"""
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        with self._lock:
+            self.calls += 1
+            number = self.calls
+        time.sleep(self.delay)
+        response = HttpResponse(str(number))
+        response.surrogate_keys = {response_cache.TAGS_KEY}
+        return response
+
+
+@pytest.fixture
+def key(settings, monkeypatch):
+    settings.RESPONSE_CACHE_TIMEOUT = 300
+    monkeypatch.setattr("api.middleware.SINGLE_FLIGHT_LEASE_SECONDS", 0.3)
+    cache.clear()
+    return response_cache.request_key(RequestFactory().get(PATH))
+
+
+def call(middleware):
+    response = middleware(RequestFactory().get(PATH))
+    return response["X-Cache"], response.content.decode()
+
+
+def expire(key):
+    entry = cache.get(key)
+    entry["expires"] = time.time() - 1
+    cache.set(key, entry)
+
+
+def test_lookup_separates_expired_and_purged(key):
+    middleware = AnonymousResponseCacheMiddleware(View())
+    call(middleware)
+    entry, fresh = response_cache.lookup(key)
+    assert entry is not None and fresh
+
+    expire(key)
+    entry, fresh = response_cache.lookup(key)
+    assert entry is not None and not fresh
+
+    response_cache.purge(response_cache.TAGS_KEY)
+    assert response_cache.lookup(key) == (None, False)
+
+
+def test_expired_entry_is_served_stale_while_rebuilding(key):
+    middleware = AnonymousResponseCacheMiddleware(View())
+    call(middleware)
+    expire(key)
+    # Запись пересобирает другой процесс.
+    token = acquire_lease(key)
+    assert call(middleware) == ("STALE", "1")
+    release_lease(key, token)
+    assert call(middleware) == ("MISS", "2")
+
+
+def test_purged_entry_is_never_served(key):
+    middleware = AnonymousResponseCacheMiddleware(View())
+    call(middleware)
+    response_cache.purge(response_cache.TAGS_KEY)
+    token = acquire_lease(key)
+    # Лидер другого процесса не успел: ответ собирается заново, а не
+    # берется из сброшенной записи.
+    assert call(middleware) == ("MISS", "2")
+    release_lease(key, token)
+
+
+def test_purged_entry_is_never_served_under_asgi(key):
+    view = View()
+
+    async def get_response(request):
+        return view(request)
+
+    middleware = AnonymousResponseCacheMiddleware(get_response)
+    request = RequestFactory().get(PATH)
+    async_to_sync(middleware)(request)
+    response_cache.purge(response_cache.TAGS_KEY)
+    token = acquire_lease(key)
+    response = async_to_sync(middleware)(RequestFactory().get(PATH))
+    release_lease(key, token)
+    assert (response["X-Cache"], response.content) == ("MISS", b"2")
+
+
+def test_one_leader_per_key(key):
+    view = View(delay=0.2)
+    middleware = AnonymousResponseCacheMiddleware(view)
+    results = []
+
+    def worker():
+        results.append(call(middleware))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert view.calls == 1
+    assert sorted(results) == [("HIT", "1")] * 4 + [("MISS", "1")]
+    assert not local_flights._flights
+
+
+def test_local_flights():
+    flights = LocalFlights()
+    leader, flight = flights.join("key")
+    follower, same = flights.join("key")
+    assert (leader, follower) == (True, False)
+    assert same is flight
+    flights.finish("key", "result")
+    assert flight.result(timeout=0) == "result"
+    assert flights.join("key")[0]
+
+
+def test_lease_belongs_to_its_owner(key):
+    token = acquire_lease(key)
+    assert token is not None
+    assert acquire_lease(key) is None
+    release_lease(key, "someone-else")
+    assert acquire_lease(key) is None
+    release_lease(key, token)
+    assert acquire_lease(key) is not None
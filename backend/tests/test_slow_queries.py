@@ -0,0 +1,121 @@
+"""
+Журнал медленных запросов: нормализация SQL, находки запроса и их
+запись фоновым потоком, а не на пути ответа
+"""
+
+import logging
+import logging.handlers
+import queue
+import threading
+
+import pytest
+from django.test import Client
+
+from api import slow_queries
+from api.models import SlowQuery, Tag
+
+from .factories import TagFactory
+
+
+@pytest.fixture
+def watched(settings):
+    settings.SLOW_QUERY_THRESHOLD_MS = float("inf")
+    settings.SLOW_QUERY_REPEAT_LIMIT = 2
+    settings.SLOW_QUERY_EXPLAIN_RATE = 0
+
+
+def test_normalize():
+    assert slow_queries.normalize(
+        "SELECT * FROM t WHERE a = 'x''y' AND b IN (%s, %s,%s)\n"
+        '  AND c = 12.5 AND "t2"."c1" = -3'
+    ) == (
+        "SELECT * FROM t WHERE a = ? AND b IN (...) AND c = ? "
+        'AND "t2"."c1" = ?'
+    )
+
+
+def run_queries(count):
+    watch = slow_queries.QueryWatch()
+    token = slow_queries.current.set(watch)
+    try:
+        for number in range(count):
+            Tag.objects.filter(pk=number).exists()
+    finally:
+        slow_queries.current.reset(token)
+    return watch
+
+
+@pytest.mark.django_db(transaction=True)
+def test_repeated_queries_are_recorded(watched):
+    watch = run_queries(2)
+    assert not watch.findings
+    watch = run_queries(4)
+    (finding,) = watch.findings.values()
+    assert finding["kind"] == SlowQuery.Kind.REPEATED
+
+    slow_queries.flush(watch, "route")
+    slow_queries.flush(run_queries(3), "route")
+    slow_queries.pending.join()
+    row = SlowQuery.objects.get()
+    assert (row.route, row.kind, row.repeats, row.occurrences) == (
+        "route",
+        SlowQuery.Kind.REPEATED,
+        4,
+        2,
+    )
+
+
+@pytest.mark.django_db(transaction=True)
+def test_middleware_records_slow_queries(settings):
+    settings.SLOW_QUERY_THRESHOLD_MS = 0
+    settings.SLOW_QUERY_EXPLAIN_RATE = 0
+    TagFactory()
+    assert Client().get("/api/tags/").status_code == 200
+    slow_queries.pending.join()
+    assert set(SlowQuery.objects.values_list("route", "kind")) == {
+        ("tags-list", SlowQuery.Kind.SLOW)
+    }
+
+
+@pytest.mark.django_db
+def test_response_does_not_wait_for_writer(settings, monkeypatch):
+    settings.SLOW_QUERY_THRESHOLD_MS = 0
+    release = threading.Event()
+    written = []
+
+    def write(route, findings):
+        release.wait(5)
+        written.append((route, threading.current_thread().name))
+
+    monkeypatch.setattr("api.slow_queries.write", write)
+    assert Client().get("/api/tags/").status_code == 200
+    assert written == []
+    release.set()
+    slow_queries.pending.join()
+    assert written == [("tags-list", "slow-queries")]
+
+
+def test_full_queue_drops_findings(watched, monkeypatch, caplog):
+    monkeypatch.setattr("api.slow_queries.pending", queue.Queue(maxsize=1))
+    monkeypatch.setattr("api.slow_queries._start_writer", lambda: None)
+    watch = slow_queries.QueryWatch()
+    watch.counts["SELECT 1"] = 1
+    watch.times["SELECT 1"] = 0.5
+    watch.flag(SlowQuery.Kind.SLOW, "SELECT 1", (), False, 0.5, "default")
+    caplog.set_level(logging.ERROR)
+    logger = logging.getLogger("api.slow_queries")
+    logger.addHandler(caplog.handler)
+    try:
+        slow_queries.flush(watch, "first")
+        slow_queries.flush(watch, "second")
+    finally:
+        logger.removeHandler(caplog.handler)
+    assert slow_queries.pending.get_nowait()[0] == "first"
+    assert "переполнена: second" in caplog.text
+
+
+def test_log_file_survives_external_rotation():
+    assert any(
+        isinstance(handler, logging.handlers.WatchedFileHandler)
+        for handler in logging.getLogger("api.slow_queries").handlers
+    )
@@ -0,0 +1,85 @@
+"""
+Разреженные наборы полей ?fields= и ?omit=: состав ответа и запросы
+к БД только для выбранных полей
+"""
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.models import Subscription
+
+from .factories import (
+    IngredientFactory,
+    RecipeFactory,
+    TagFactory,
+    UserFactory,
+)
+
+
+@pytest.fixture
+def client(db, isolated):
+    cache.clear()
+    user = UserFactory()
+    token = Token.objects.create(user=user).key
+    author = UserFactory()
+    Subscription.objects.create(user=user, author=author)
+    RecipeFactory.create_batch(
+        2,
+        author=author,
+        tags=TagFactory.create_batch(2),
+        ingredients=IngredientFactory.create_batch(2),
+    )
+    return Client(headers={"Authorization": f"Token {token}"})
+
+
+def queries(client, path):
+    with CaptureQueriesContext(connection) as captured:
+        response = client.get(path)
+    assert response.status_code == 200, response.content
+    return response.json(), len(captured)
+
+
+def test_fields_limit_recipe_list(client):
+    data, sparse = queries(client, "/api/recipes/?fields=id,name")
+    assert all(set(recipe) == {"id", "name"} for recipe in data["results"])
+    _, full = queries(client, "/api/recipes/")
+    assert sparse < full
+
+
+def test_omit_drops_fields(client):
+    data, _ = queries(client, "/api/recipes/?omit=text,ingredients,author")
+    recipe = data["results"][0]
+    assert not {"text", "ingredients", "author"} & set(recipe)
+    assert {"id", "tags", "is_favorited"} <= set(recipe)
+
+
+def test_fields_and_omit_combine(client):
+    data, _ = queries(client, "/api/users/me/?fields=id,email,avatar&omit=id")
+    assert set(data) == {"email", "avatar"}
+
+
+def test_subscriptions_fields(client):
+    data, _ = queries(
+        client, "/api/users/subscriptions/?fields=id,recipes_count"
+    )
+    assert data["results"] == [
+        {"id": data["results"][0]["id"], "recipes_count": 2}
+    ]
+
+
+def test_unknown_field_is_rejected(client):
+    response = client.get("/api/recipes/?fields=id,password")
+    assert response.status_code == 400
+    assert "password" in response.json()["fields"]
+
+
+def test_write_actions_ignore_fields(client):
+    response = client.post(
+        "/api/recipes/?fields=id", {}, content_type="application/json"
+    )
+    assert response.status_code == 400
+    assert "name" in response.json()
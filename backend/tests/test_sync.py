@@ -0,0 +1,200 @@
+"""
+Синхронизация по журналу изменений: свертка записей, видимость связей
+пользователя, постраничная выдача, задержка свежих записей и сброс
+после очистки журнала
+"""
+
+import threading
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.models import ChangeLogEntry, Favorite, ShoppingCart, Subscription
+from api.sync import current_cursor, log_change, recipe_changes
+
+from .factories import RecipeFactory, UserFactory
+
+URL = "/api/sync/"
+
+
+@pytest.fixture
+def user(db, isolated, monkeypatch):
+    monkeypatch.setattr("api.sync.SYNC_SAFETY_LAG_SECONDS", 0)
+    cache.clear()
+    return UserFactory()
+
+
+def sync(user, since):
+    client = Client()
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(headers={"Authorization": f"Token {token.key}"})
+    response = client.get(URL, {"since": since})
+    assert response.status_code == 200, response.content
+    return response.json()
+
+
+def test_without_cursor_client_resets(user):
+    RecipeFactory()
+    response = Client().get(URL)
+    assert response.json() == {"cursor": current_cursor(), "reset": True}
+
+
+@pytest.mark.parametrize("since", ["abc", "1.5"])
+def test_invalid_cursor(user, since):
+    response = Client().get(URL, {"since": since})
+    assert response.status_code == 400
+    assert "since" in response.json()
+
+
+def test_changes_are_collapsed(user):
+    since = current_cursor()
+    created = RecipeFactory()
+    created.save()
+    updated = RecipeFactory()
+    since_updated = current_cursor()
+    updated.save()
+    deleted = RecipeFactory()
+    deleted_pk = deleted.pk
+    deleted.delete()
+    author = UserFactory()
+    Favorite.objects.create(user=user, recipe=created)
+    ShoppingCart.objects.create(user=user, recipe=updated)
+    ShoppingCart.objects.filter(user=user).delete()
+    Subscription.objects.create(user=user, author=author)
+
+    changes = sync(user, since)
+    assert changes["cursor"] == current_cursor()
+    assert (changes["reset"], changes["has_more"]) == (False, False)
+    assert changes["recipes"] == {
+        "created": [created.pk, updated.pk],
+        "updated": [],
+        "deleted": [deleted_pk],
+    }
+    assert changes["favorites"] == {"added": [created.pk], "removed": []}
+    assert changes["shopping_cart"] == {"added": [], "removed": [updated.pk]}
+    assert changes["subscriptions"] == {"added": [author.pk], "removed": []}
+
+    assert sync(user, since_updated)["recipes"]["updated"] == [updated.pk]
+
+
+def test_relations_are_private(user):
+    recipe = RecipeFactory()
+    since = current_cursor()
+    Favorite.objects.create(user=UserFactory(), recipe=recipe)
+    recipe.save()
+
+    for viewer in (user, None):
+        changes = sync(viewer, since)
+        assert changes["favorites"] == {"added": [], "removed": []}
+        assert changes["recipes"]["updated"] == [recipe.pk]
+
+
+def test_pages_follow_cursor(user, monkeypatch):
+    monkeypatch.setattr("api.sync.SYNC_MAX_CHANGES", 2)
+    since = current_cursor()
+    recipes = RecipeFactory.create_batch(3)
+
+    first = sync(user, since)
+    assert first["has_more"]
+    assert first["recipes"]["created"] == [recipe.pk for recipe in recipes[:2]]
+    second = sync(user, first["cursor"])
+    assert not second["has_more"]
+    assert second["recipes"]["created"] == [recipes[2].pk]
+    assert second["cursor"] == current_cursor()
+
+
+def test_fresh_entries_are_held_back(user, monkeypatch):
+    monkeypatch.setattr("api.sync.SYNC_SAFETY_LAG_SECONDS", 60)
+    since = current_cursor()
+    recipe = RecipeFactory()
+
+    changes = sync(user, since)
+    assert changes["cursor"] == since
+    assert changes["recipes"]["created"] == []
+    # Индекс похожих рецептов уже видит свежий рецепт, но курсор не
+    # сдвигается: рецепт попадет и в следующую выборку.
+    assert recipe_changes(since) == ({recipe.pk}, since)
+
+    ChangeLogEntry.objects.update(
+        created=timezone.now() - timedelta(minutes=5)
+    )
+    assert sync(user, since)["recipes"]["created"] == [recipe.pk]
+    assert recipe_changes(since) == ({recipe.pk}, current_cursor())
+
+
+def test_pruned_log_forces_reset(user):
+    since = current_cursor()
+    RecipeFactory.create_batch(2)
+    ChangeLogEntry.objects.update(created=timezone.now() - timedelta(days=40))
+    RecipeFactory()
+    out = StringIO()
+    call_command("prune_changelog", days=30, stdout=out)
+    assert "deleted: 2" in out.getvalue()
+
+    changes = sync(user, since)
+    assert changes == {"cursor": current_cursor(), "reset": True}
+
+
+@pytest.mark.skipif(
+    connection.vendor != "postgresql",
+    reason="в SQLite пишущие транзакции и так не пересекаются",
+)
+@pytest.mark.django_db(transaction=True)
+def test_late_commit_is_not_skipped(monkeypatch):
+    monkeypatch.setattr("api.sync.SYNC_SAFETY_LAG_SECONDS", 0)
+    cache.clear()
+    user = UserFactory()
+    slow, fast = RecipeFactory.create_batch(2)
+    since = current_cursor()
+    logged, commit = threading.Event(), threading.Event()
+
+    def run(target):
+        def wrapper():
+            try:
+                target()
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=wrapper)
+        thread.start()
+        return thread
+
+    def slow_transaction():
+        with transaction.atomic():
+            log_change(
+                ChangeLogEntry.Kind.RECIPE,
+                ChangeLogEntry.Action.UPDATED,
+                slow.pk,
+            )
+            logged.set()
+            commit.wait(5)
+
+    slow_thread = run(slow_transaction)
+    assert logged.wait(5)
+    # Запись, начатая позже, ждет коммита первой транзакции и получает
+    # id после нее, поэтому выданный сейчас курсор ее не обгонит.
+    fast_thread = run(
+        lambda: log_change(
+            ChangeLogEntry.Kind.RECIPE,
+            ChangeLogEntry.Action.UPDATED,
+            fast.pk,
+        )
+    )
+    fast_thread.join(0.5)
+    assert fast_thread.is_alive()
+    cursor = sync(user, since)["cursor"]
+    assert cursor == since
+    commit.set()
+    slow_thread.join()
+    fast_thread.join()
+
+    changes = sync(user, cursor)
+    assert changes["recipes"]["updated"] == sorted([slow.pk, fast.pk])
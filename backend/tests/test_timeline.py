@@ -0,0 +1,135 @@
+"""
+Лента подписок: счетчик подписчиков, fan-out при публикации и сборка
+при чтении для популярных авторов
+"""
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.models import Subscription, TimelineEntry, User
+from api.timeline import fan_out_recipe, pull_author_ids, recount_followers
+
+from .factories import RecipeFactory, UserFactory
+
+THRESHOLD = 2
+
+
+@pytest.fixture
+def author(db, isolated, monkeypatch):
+    monkeypatch.setattr(
+        "api.timeline.TIMELINE_FANOUT_MAX_FOLLOWERS", THRESHOLD
+    )
+    cache.clear()
+    return UserFactory()
+
+
+def client_for(user):
+    token, _ = Token.objects.get_or_create(user=user)
+    return Client(headers={"Authorization": f"Token {token.key}"})
+
+
+def subscribe(user, author):
+    response = client_for(user).post(f"/api/users/{author.pk}/subscribe/")
+    assert response.status_code == 201, response.content
+
+
+def unsubscribe(user, author):
+    response = client_for(user).delete(f"/api/users/{author.pk}/subscribe/")
+    assert response.status_code == 204
+
+
+def publish(author):
+    recipe = RecipeFactory(author=author)
+    fan_out_recipe(recipe)
+    return recipe
+
+
+def feed(user):
+    response = client_for(user).get("/api/recipes/feed/")
+    assert response.status_code == 200
+    return [item["id"] for item in response.json()["results"]]
+
+
+def test_counter_follows_subscriptions(author):
+    followers = UserFactory.create_batch(THRESHOLD)
+    for user in followers:
+        subscribe(user, author)
+    author.refresh_from_db()
+    assert (author.followers_count, author.is_celebrity) == (THRESHOLD, False)
+
+    unsubscribe(followers[0], author)
+    author.refresh_from_db()
+    assert author.followers_count == THRESHOLD - 1
+
+
+def test_pull_authors_read_flag_without_counting(author):
+    user = UserFactory()
+    Subscription.objects.create(user=user, author=author)
+    User.objects.filter(pk=author.pk).update(is_celebrity=True)
+    with CaptureQueriesContext(connection) as captured:
+        assert pull_author_ids(user) == [author.pk]
+    assert len(captured) == 1
+    assert "COUNT" not in captured[0]["sql"].upper()
+
+
+def test_small_author_is_pushed(author):
+    follower = UserFactory()
+    subscribe(follower, author)
+    recipe = publish(author)
+    assert TimelineEntry.objects.filter(user=follower, recipe=recipe).exists()
+    assert feed(follower) == [recipe.pk]
+
+
+def test_celebrity_is_pulled_and_stays_pulled(author):
+    old = publish(author)
+    followers = UserFactory.create_batch(THRESHOLD + 1)
+    for user in followers:
+        subscribe(user, author)
+    author.refresh_from_db()
+    assert author.is_celebrity
+
+    recipe = publish(author)
+    assert not TimelineEntry.objects.filter(recipe=recipe).exists()
+    assert feed(followers[0]) == [recipe.pk, old.pk]
+
+    # Отписки опускают число подписчиков ниже порога, но рецепты,
+    # которые не раскладывались по лентам, не пропадают.
+    for user in followers[1:]:
+        unsubscribe(user, author)
+    author.refresh_from_db()
+    assert author.followers_count == 1
+    assert author.is_celebrity
+    newest = publish(author)
+    assert feed(followers[0]) == [newest.pk, recipe.pk, old.pk]
+
+
+def test_backfill_skips_celebrity(author):
+    recipes = [publish(author) for _ in range(2)]
+    first = UserFactory()
+    subscribe(first, author)
+    assert TimelineEntry.objects.filter(user=first).count() == 2
+
+    User.objects.filter(pk=author.pk).update(is_celebrity=True)
+    second = UserFactory()
+    subscribe(second, author)
+    assert not TimelineEntry.objects.filter(user=second).exists()
+    assert feed(second) == [recipe.pk for recipe in reversed(recipes)]
+
+
+def test_recount_followers(author):
+    Subscription.objects.bulk_create(
+        Subscription(user=user, author=author)
+        for user in UserFactory.create_batch(THRESHOLD + 1)
+    )
+    author.refresh_from_db()
+    assert author.followers_count == 0
+    recount_followers()
+    author.refresh_from_db()
+    assert (author.followers_count, author.is_celebrity) == (
+        THRESHOLD + 1,
+        True,
+    )
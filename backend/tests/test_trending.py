@@ -0,0 +1,127 @@
+"""
+Рейтинг трендов: затухание за реально прошедшее время и вычитание
+затухшего вклада при удалении из избранного и списка покупок
+"""
+
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client
+
+from api.constants import (
+    TREND_FAVORITE_WEIGHT,
+    TREND_HALF_LIFE_HOURS,
+    TREND_SHOPPING_CART_WEIGHT,
+)
+from api.models import Favorite, RecipeTrend, ShoppingCart, TrendDecay
+from api.trending import decay_scores, decayed_at, rebuild_scores
+
+from .factories import RecipeFactory, UserFactory
+
+
+@pytest.fixture
+def recipes(db, isolated):
+    cache.clear()
+    return RecipeFactory.create_batch(2)
+
+
+def score(recipe):
+    trend = RecipeTrend.objects.filter(recipe=recipe).first()
+    return trend.score if trend else 0.0
+
+
+def travel(hours):
+    """Сдвигает все сохраненные моменты назад: прошло hours часов"""
+    shift = timedelta(hours=hours)
+    decayed_at()
+    TrendDecay.objects.update(
+        decayed_at=TrendDecay.objects.get().decayed_at - shift
+    )
+    for model in (Favorite, ShoppingCart):
+        for relation in model.objects.all():
+            model.objects.filter(pk=relation.pk).update(
+                created=relation.created - shift
+            )
+    cache.clear()
+
+
+def test_decay_uses_elapsed_time(recipes):
+    recipe, _ = recipes
+    Favorite.objects.create(user=UserFactory(), recipe=recipe)
+    assert score(recipe) == pytest.approx(TREND_FAVORITE_WEIGHT)
+
+    travel(TREND_HALF_LIFE_HOURS * 2)
+    decayed, removed, hours = decay_scores()
+    assert (decayed, removed) == (1, 0)
+    assert hours == pytest.approx(TREND_HALF_LIFE_HOURS * 2, rel=1e-3)
+    assert score(recipe) == pytest.approx(TREND_FAVORITE_WEIGHT / 4, rel=1e-3)
+
+    # Повторный запуск сразу после предыдущего почти ничего не меняет.
+    decay_scores()
+    assert score(recipe) == pytest.approx(TREND_FAVORITE_WEIGHT / 4, rel=1e-3)
+
+
+def test_delete_subtracts_decayed_weight(recipes):
+    recipe, _ = recipes
+    user, other = UserFactory.create_batch(2)
+    Favorite.objects.create(user=user, recipe=recipe)
+    travel(TREND_HALF_LIFE_HOURS)
+    decay_scores()
+    Favorite.objects.create(user=other, recipe=recipe)
+    assert score(recipe) == pytest.approx(
+        TREND_FAVORITE_WEIGHT * 1.5, rel=1e-3
+    )
+
+    Favorite.objects.get(user=user).delete()
+    assert score(recipe) == pytest.approx(TREND_FAVORITE_WEIGHT, rel=1e-3)
+    Favorite.objects.get(user=other).delete()
+    assert score(recipe) == pytest.approx(0.0, abs=1e-6)
+
+
+def test_relations_between_decays_match_rebuild(recipes):
+    old, new = recipes
+    user = UserFactory()
+    Favorite.objects.create(user=user, recipe=old)
+    travel(TREND_HALF_LIFE_HOURS)
+    decay_scores()
+    travel(TREND_HALF_LIFE_HOURS / 2)
+    ShoppingCart.objects.create(user=user, recipe=new)
+    travel(TREND_HALF_LIFE_HOURS / 2)
+    decay_scores()
+
+    live = {recipe.pk: score(recipe) for recipe in recipes}
+    rebuild_scores()
+    assert live == pytest.approx(
+        {recipe.pk: score(recipe) for recipe in recipes}, rel=1e-3
+    )
+    assert live[new.pk] == pytest.approx(
+        TREND_SHOPPING_CART_WEIGHT / 2**0.5, rel=1e-3
+    )
+
+
+def test_trending_endpoint_order(recipes):
+    old, new = recipes
+    Favorite.objects.create(user=UserFactory(), recipe=old)
+    travel(TREND_HALF_LIFE_HOURS * 2)
+    decay_scores()
+    ShoppingCart.objects.create(user=UserFactory(), recipe=new)
+
+    response = Client().get("/api/recipes/trending/")
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()["results"]] == [
+        new.pk,
+        old.pk,
+    ]
+
+
+def test_update_trending_command(recipes):
+    recipe, _ = recipes
+    Favorite.objects.create(user=UserFactory(), recipe=recipe)
+    travel(TREND_HALF_LIFE_HOURS)
+    out = StringIO()
+    call_command("update_trending", stdout=out)
+    assert f"over {TREND_HALF_LIFE_HOURS:.2f} h: 1" in out.getvalue()
+    assert score(recipe) == pytest.approx(TREND_FAVORITE_WEIGHT / 2, rel=1e-3)